@@ -6,21 +6,44 @@ QQ空间相册下载器 - 核心模块
 """
 
 import errno
+import fnmatch
+import hashlib
+import heapq
+import http.cookiejar
+import io
 import json
 import json_repair
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
 import random
 import re
 import shutil
+import socket
+import sqlite3
+import struct
 import sys
+import tarfile
+import threading
 import time
-from collections import namedtuple
-from concurrent.futures import ThreadPoolExecutor
+import urllib.parse
+import zipfile
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from fractions import Fraction
 
 import piexif
 import requests
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.service import Service as ChromeService
@@ -34,6 +57,140 @@ from webdriver_manager.chrome import ChromeDriverManager
 # ---------------------------------------------------------------------------
 
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # 由 apply_log_level() 按配置 log_level 调整
+# 结构化事件（JSON Lines），不向上传播到普通日志
+event_logger = logging.getLogger(f"{__name__}.events")
+event_logger.propagate = False
+event_logger.setLevel(logging.CRITICAL + 1)  # 由 LogPipeline 按配置启用
+
+EVENT_LOG_MAX_BYTES = 10 * 1024 * 1024
+EVENT_LOG_BACKUP_COUNT = 3
+
+
+def task_log(log_func, level: int, msg: str, *args) -> None:
+    """
+    按级别输出下载任务日志到 logger 和 log_func（GUI 信号等）。
+
+    级别未启用时直接返回，既不格式化也不发往 GUI；args 非空时按 % 格式延迟格式化，
+    逐张照片的日志应使用这种写法。
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if log_func:
+        log_func(msg % args if args else msg)
+    logger.log(level, msg, *args)
+
+
+def apply_log_level() -> None:
+    """按配置 log_level 设置 core 的日志级别；设为 "DEBUG" 时输出逐张照片的下载日志。"""
+    level = logging.getLevelName(str(APP_CONFIG.get("log_level", "INFO")).upper())
+    if isinstance(level, int):
+        logger.setLevel(level)
+
+
+def log_event(event: str, **fields) -> None:
+    """记录一条结构化事件，由 LogPipeline 在后台线程序列化为一行 JSON。"""
+    if event_logger.isEnabledFor(logging.INFO):
+        event_logger.info(event, extra={"event_fields": fields})
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把 LogRecord 放入队列，格式化留给 QueueListener 中的 handler。
+
+    标准 QueueHandler 会在调用线程中格式化消息；这里的队列只在进程内使用，
+    记录无需可序列化，直接传递即可。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonEventFormatter(logging.Formatter):
+    """把 log_event() 产生的记录格式化为一行 JSON。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": round(record.created, 3),
+            "event": record.getMessage(),
+            **getattr(record, "event_fields", {}),
+        }
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """
+    异步日志管道：把给定 logger 上已有的 handler 移到后台 QueueListener 线程，
+    下载线程记录日志时只需入队；结构化事件按配置 event_log 写入 JSON Lines 文件。
+
+    start() 时按配置 log_level 设置 core 的日志级别；close() 会写完队列中剩余的日志。
+    """
+
+    def __init__(self, *loggers: logging.Logger):
+        self.loggers = loggers
+        self._listeners: list[logging.handlers.QueueListener] = []
+        self._installed: list[tuple[logging.Logger, logging.Handler]] = []
+        self._moved: list[tuple[logging.Logger, logging.Handler]] = []
+        self._events_enabled = False
+
+    def start(self) -> "LogPipeline":
+        apply_log_level()
+        handlers: list[logging.Handler] = []
+        for target in self.loggers:
+            for handler in list(target.handlers):
+                target.removeHandler(handler)
+                self._moved.append((target, handler))
+                if handler not in handlers:
+                    handlers.append(handler)
+        if handlers:
+            self._listen(handlers, self.loggers)
+
+        event_path = APP_CONFIG.get("event_log", "")
+        if event_path:
+            if not os.path.isabs(event_path):
+                event_path = os.path.join(get_script_directory(), event_path)
+            os.makedirs(os.path.dirname(event_path), exist_ok=True)
+            event_handler = logging.handlers.RotatingFileHandler(
+                event_path,
+                maxBytes=EVENT_LOG_MAX_BYTES,
+                backupCount=EVENT_LOG_BACKUP_COUNT,
+                encoding="utf-8",
+            )
+            event_handler.setFormatter(JsonEventFormatter())
+            self._listen([event_handler], [event_logger])
+            event_logger.setLevel(logging.INFO)
+            self._events_enabled = True
+        return self
+
+    def close(self) -> None:
+        for listener in self._listeners:
+            listener.stop()
+        for target, handler in self._installed:
+            target.removeHandler(handler)
+        for target, handler in self._moved:
+            target.addHandler(handler)
+        for listener in self._listeners:
+            for handler in listener.handlers:
+                if not any(handler is moved for _, moved in self._moved):
+                    handler.close()
+        self._listeners.clear()
+        self._installed.clear()
+        self._moved.clear()
+        if self._events_enabled:
+            event_logger.setLevel(logging.CRITICAL + 1)
+            self._events_enabled = False
+
+    def _listen(self, handlers: list[logging.Handler], loggers) -> None:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        listener.start()
+        self._listeners.append(listener)
+        for target in loggers:
+            queue_handler = _DeferredQueueHandler(log_queue)
+            target.addHandler(queue_handler)
+            self._installed.append((target, queue_handler))
 
 # ---------------------------------------------------------------------------
 # 配置
@@ -89,7 +246,45 @@ def load_config(exit_on_error: bool = True) -> bool:
         "exclude_albums": [
             name for name in CONFIG.get("exclude_albums", []) if str(name).strip()
         ],
+        "include_albums": [
+            name for name in CONFIG.get("include_albums", []) if str(name).strip()
+        ],
+        "photo_date_from": CONFIG.get("photo_date_from", ""),
+        "photo_date_to": CONFIG.get("photo_date_to", ""),
+        "photo_date_field": CONFIG.get("photo_date_field", "upload"),
         "download_path": CONFIG.get("download_path", "qzone_photo"),
+        "output_mode": CONFIG.get("output_mode", "files"),
+        "connect_timeout": CONFIG.get("connect_timeout", 10),
+        "read_timeout": CONFIG.get("read_timeout", CONFIG.get("timeout_init", 30)),
+        "retry_backoff_base": CONFIG.get("retry_backoff_base", 2),
+        "retry_backoff_max": CONFIG.get("retry_backoff_max", 60),
+        "task_deadline": CONFIG.get("task_deadline", 600),
+        "auth_auto_relogin": CONFIG.get("auth_auto_relogin", True),
+        "api_max_concurrency": CONFIG.get("api_max_concurrency", 4),
+        "api_rate_limit": CONFIG.get("api_rate_limit", 5),
+        "listing_cache_ttl": CONFIG.get("listing_cache_ttl", 3600),
+        "album_list_cache_ttl": CONFIG.get("album_list_cache_ttl", 300),
+        "lane_workers": CONFIG.get("lane_workers", {}),
+        "task_order": CONFIG.get("task_order", "album"),
+        "writer_workers": CONFIG.get("writer_workers", 2),
+        "writer_queue_size": CONFIG.get("writer_queue_size", 32),
+        "fsync_batch": CONFIG.get("fsync_batch", 0),
+        "memory_budget_mb": CONFIG.get("memory_budget_mb", 256),
+        "hls_segment_workers": CONFIG.get("hls_segment_workers", 4),
+        "ranged_download_min_mb": CONFIG.get("ranged_download_min_mb", 16),
+        "ranged_download_connections": CONFIG.get("ranged_download_connections", 4),
+        "hedge_enabled": CONFIG.get("hedge_enabled", False),
+        "hedge_percentile": CONFIG.get("hedge_percentile", 95),
+        "hedge_max_ratio": CONFIG.get("hedge_max_ratio", 0.05),
+        "log_level": CONFIG.get("log_level", "INFO"),
+        "event_log": CONFIG.get("event_log", "logs/events.jsonl"),
+        "file_naming": CONFIG.get("file_naming", "index"),
+        "file_name_prefix": CONFIG.get("file_name_prefix", ""),
+        "metadata_db": CONFIG.get("metadata_db", "metadata.db"),
+        "processes": CONFIG.get("processes", 1),
+        "daemon_host": CONFIG.get("daemon_host", "127.0.0.1"),
+        "daemon_port": CONFIG.get("daemon_port", 8765),
+        "daemon_max_jobs": CONFIG.get("daemon_max_jobs", 2),
     })
 
     USER_CONFIG.update({
@@ -104,7 +299,16 @@ def load_config(exit_on_error: bool = True) -> bool:
 # 命名元组
 # ---------------------------------------------------------------------------
 
-QzoneAlbum = namedtuple("QzoneAlbum", ["uid", "name", "count"])
+QzoneAlbum = namedtuple(
+    "QzoneAlbum",
+    [
+        "uid",
+        "name",
+        "count",
+        "modifytime",  # int，相册最后修改时间戳，接口未返回时为 0
+    ],
+    defaults=(0,),
+)
 QzonePhoto = namedtuple(
     "QzonePhoto",
     [
@@ -117,9 +321,63 @@ QzonePhoto = namedtuple(
         "shoottime",   # str，来自 rawshoottime，含时分秒
         "uploadtime",  # str，来自 uploadtime，含时分秒
         "cameratype",  # str，完整设备名，如 "Apple iPhone 15 Pro Max"
+        "width",       # int，原图宽度，未知时为 0
+        "height",      # int，原图高度，未知时为 0
+    ],
+    defaults=(0, 0),
+)
+
+PhotoTask = namedtuple(
+    "PhotoTask",
+    [
+        "request_cookies",
+        "user_qq",
+        "album_index",
+        "album_name",
+        "photo_index",
+        "photo",
+        "log_func",         # callable(str)，输出日志
+        "progress_func",    # callable(int)，更新进度；CLI 模式传 None 或 noop
+        "is_stopped_func",
+        "qzone_manager",
+        "album_id",
+        "dest_user_qq",
+        "attempt",          # 已失败的尝试次数，由调度器在重试时递增
+        "video_url",        # 视频真实下载地址：None 未解析，"" 解析失败（改为下载封面）
+    ],
+    defaults=(0, None),
+)
+
+# save_photo_worker 下载成功后交给写盘阶段的任务
+WriteJob = namedtuple(
+    "WriteJob",
+    [
+        "task",      # PhotoTask
+        "content",   # bytes | bytearray，下载得到的原始数据
+        "filename",  # str，最终文件名（归档模式下为成员名）
+        "path",      # str，最终文件路径（归档模式下仅用于日志）
+        "archive",   # AlbumArchiveWriter | None
+        "sha256",    # str，下载过程中计算的原始数据 SHA-256
+        "budget",    # ByteBudget | None，写盘完成后归还预留的内存
+        "reserved",  # int，在 budget 中预留的字节数
+        "temp_path",  # str，数据已直接写入磁盘时的临时文件路径（此时 content 为空）
+        "etag",           # str，响应的 ETag，供之后的条件请求使用
+        "last_modified",  # str，响应的 Last-Modified
     ],
+    defaults=("", None, 0, "", "", ""),
 )
 
+# save_photo_worker 的返回值
+TASK_DONE = "done"          # 下载并保存成功
+TASK_SKIPPED = "skipped"    # 本地已存在，跳过
+TASK_FAILED = "failed"      # 重试耗尽或不可恢复的错误
+TASK_STOPPED = "stopped"    # 收到停止请求，未完成
+TASK_RETRY = "retry"        # 可恢复的错误，交由调度器延迟重试
+TASK_AUTH_RETRY = "auth_retry"  # 登录态已刷新，立即重新执行且不计入尝试次数
+
+# 这些 HTTP 状态码视为暂时性错误，可以重试
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
 # ---------------------------------------------------------------------------
 # 工具函数
 # ---------------------------------------------------------------------------
@@ -168,6 +426,14 @@ def _str_to_short(value_str: str) -> int | None:
         return None
 
 
+def _safe_int(value, default: int = 0) -> int:
+    """将 API 返回的数值（可能为字符串或缺失）转为 int，失败返回 default。"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
 def _ascii_bytes(s: str) -> bytes:
     """编码为 ASCII bytes，非 ASCII 字符用 ? 替换。"""
     return s.encode("ascii", errors="replace")
@@ -194,132 +460,153 @@ def _datetime_str_to_exif(dt_str: str) -> str | None:
     return None
 
 
-def write_exif_to_photo(
-    file_path: str,
+def _fill_exif_dict(
+    exif_dict: dict,
     exif_data: dict,
     shoottime: str,
     uploadtime: str,
     cameratype: str = "",
 ) -> None:
-    """
-    将 API 返回的元数据回写至 JPEG 文件的 EXIF，并对所有文件类型设置 mtime。
-
-    - EXIF 字段写入仅对 .jpg/.jpeg 有效，出错时静默跳过。
-    - 文件修改时间（mtime）对所有文件类型生效。
-    """
-    if file_path.lower().endswith((".jpg", ".jpeg")):
-        try:
-            try:
-                exif_dict = piexif.load(file_path)
-            except Exception:
-                exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
-
-            zeroth = exif_dict.setdefault("0th", {})
-            exif   = exif_dict.setdefault("Exif", {})
-
-            # --- 相机厂商 / 完整型号 ---
-            make       = (exif_data.get("make")  or "").strip()
-            exif_model = (exif_data.get("model") or "").strip()
-            cameratype = (cameratype or "").strip()
-
-            extracted_brand = ""
-            if not make and cameratype:
-                known_makes = [
-                    "Apple", "Samsung", "SONY", "HUAWEI", "Xiaomi", "ASUS",
-                    "Google", "OnePlus", "OPPO", "vivo", "Canon", "Nikon",
-                    "Fujifilm", "Panasonic", "Leica", "DJI", "GoPro",
-                ]
-                for brand in known_makes:
-                    if cameratype.startswith(brand):
-                        extracted_brand = brand
-                        make = brand
-                        break
-
-            if exif_model:
-                zeroth[piexif.ImageIFD.Model] = _ascii_bytes(exif_model)
-            elif cameratype:
-                model_str = (
-                    cameratype[len(extracted_brand):].strip()
-                    if extracted_brand
-                    else cameratype
-                )
-                if model_str:
-                    zeroth[piexif.ImageIFD.Model] = _ascii_bytes(model_str)
-
-            if make:
-                zeroth[piexif.ImageIFD.Make] = _ascii_bytes(make)
-
-            # --- 拍摄时间 → DateTimeOriginal ---
-            original_time = _datetime_str_to_exif(exif_data.get("originalTime", ""))
-            if original_time:
-                exif[piexif.ExifIFD.DateTimeOriginal] = _ascii_bytes(original_time)
-            elif shoottime:
-                shoot_exif = _datetime_str_to_exif(shoottime)
-                if shoot_exif:
-                    exif[piexif.ExifIFD.DateTimeOriginal] = _ascii_bytes(shoot_exif)
-            else:
-                shoot_exif = _datetime_str_to_exif(uploadtime)
-                if shoot_exif:
-                    exif[piexif.ExifIFD.DateTimeOriginal] = _ascii_bytes(shoot_exif)
+    """将 API 返回的元数据填充到 piexif 格式的 EXIF 字典中（原地修改）。"""
+    zeroth = exif_dict.setdefault("0th", {})
+    exif   = exif_dict.setdefault("Exif", {})
+
+    # --- 相机厂商 / 完整型号 ---
+    make       = (exif_data.get("make")  or "").strip()
+    exif_model = (exif_data.get("model") or "").strip()
+    cameratype = (cameratype or "").strip()
+
+    extracted_brand = ""
+    if not make and cameratype:
+        known_makes = [
+            "Apple", "Samsung", "SONY", "HUAWEI", "Xiaomi", "ASUS",
+            "Google", "OnePlus", "OPPO", "vivo", "Canon", "Nikon",
+            "Fujifilm", "Panasonic", "Leica", "DJI", "GoPro",
+        ]
+        for brand in known_makes:
+            if cameratype.startswith(brand):
+                extracted_brand = brand
+                make = brand
+                break
 
-            r = _str_to_rational(exif_data.get("exposureTime", ""))
-            if r:
-                exif[piexif.ExifIFD.ExposureTime] = r
+    if exif_model:
+        zeroth[piexif.ImageIFD.Model] = _ascii_bytes(exif_model)
+    elif cameratype:
+        model_str = (
+            cameratype[len(extracted_brand):].strip()
+            if extracted_brand
+            else cameratype
+        )
+        if model_str:
+            zeroth[piexif.ImageIFD.Model] = _ascii_bytes(model_str)
+
+    if make:
+        zeroth[piexif.ImageIFD.Make] = _ascii_bytes(make)
+
+    # --- 拍摄时间 → DateTimeOriginal ---
+    original_time = _datetime_str_to_exif(exif_data.get("originalTime", ""))
+    if original_time:
+        exif[piexif.ExifIFD.DateTimeOriginal] = _ascii_bytes(original_time)
+    elif shoottime:
+        shoot_exif = _datetime_str_to_exif(shoottime)
+        if shoot_exif:
+            exif[piexif.ExifIFD.DateTimeOriginal] = _ascii_bytes(shoot_exif)
+    else:
+        shoot_exif = _datetime_str_to_exif(uploadtime)
+        if shoot_exif:
+            exif[piexif.ExifIFD.DateTimeOriginal] = _ascii_bytes(shoot_exif)
 
-            r = _str_to_rational(exif_data.get("fnumber", ""))
-            if r:
-                exif[piexif.ExifIFD.FNumber] = r
+    r = _str_to_rational(exif_data.get("exposureTime", ""))
+    if r:
+        exif[piexif.ExifIFD.ExposureTime] = r
 
-            iso = _str_to_short(exif_data.get("iso", ""))
-            if iso is not None:
-                exif[piexif.ExifIFD.ISOSpeedRatings] = iso
+    r = _str_to_rational(exif_data.get("fnumber", ""))
+    if r:
+        exif[piexif.ExifIFD.FNumber] = r
 
-            r = _str_to_rational(exif_data.get("focalLength", ""))
-            if r:
-                exif[piexif.ExifIFD.FocalLength] = r
+    iso = _str_to_short(exif_data.get("iso", ""))
+    if iso is not None:
+        exif[piexif.ExifIFD.ISOSpeedRatings] = iso
 
-            flash = _str_to_short(exif_data.get("flash", ""))
-            if flash is not None:
-                exif[piexif.ExifIFD.Flash] = flash
+    r = _str_to_rational(exif_data.get("focalLength", ""))
+    if r:
+        exif[piexif.ExifIFD.FocalLength] = r
 
-            em = _str_to_short(exif_data.get("exposureMode", ""))
-            if em is not None:
-                exif[piexif.ExifIFD.ExposureMode] = em
+    flash = _str_to_short(exif_data.get("flash", ""))
+    if flash is not None:
+        exif[piexif.ExifIFD.Flash] = flash
 
-            ep = _str_to_short(exif_data.get("exposureProgram", ""))
-            if ep is not None:
-                exif[piexif.ExifIFD.ExposureProgram] = ep
+    em = _str_to_short(exif_data.get("exposureMode", ""))
+    if em is not None:
+        exif[piexif.ExifIFD.ExposureMode] = em
 
-            mm = _str_to_short(exif_data.get("meteringMode", ""))
-            if mm is not None:
-                exif[piexif.ExifIFD.MeteringMode] = mm
+    ep = _str_to_short(exif_data.get("exposureProgram", ""))
+    if ep is not None:
+        exif[piexif.ExifIFD.ExposureProgram] = ep
 
-            sr = _str_to_srational(exif_data.get("exposureCompensation", ""))
-            if sr is not None:
-                exif[piexif.ExifIFD.ExposureBiasValue] = sr
+    mm = _str_to_short(exif_data.get("meteringMode", ""))
+    if mm is not None:
+        exif[piexif.ExifIFD.MeteringMode] = mm
 
-            lens = (exif_data.get("lensModel") or "").strip()
-            if lens:
-                exif[piexif.ExifIFD.LensModel] = _ascii_bytes(lens)
+    sr = _str_to_srational(exif_data.get("exposureCompensation", ""))
+    if sr is not None:
+        exif[piexif.ExifIFD.ExposureBiasValue] = sr
 
-            exif_bytes = piexif.dump(exif_dict)
-            piexif.insert(exif_bytes, file_path)
+    lens = (exif_data.get("lensModel") or "").strip()
+    if lens:
+        exif[piexif.ExifIFD.LensModel] = _ascii_bytes(lens)
 
-        except Exception as e:
-            logger.warning(f"[EXIF] 回写失败，文件 {file_path}: {e}")
 
-    # 对所有文件类型设置 mtime
-    dt_str = (
+def _photo_datetime(exif_data: dict, shoottime: str, uploadtime: str) -> str:
+    """按 originalTime > shoottime > uploadtime 的优先级取照片时间（EXIF 格式），没有时为空。"""
+    return (
         _datetime_str_to_exif(exif_data.get("originalTime", ""))
         or _datetime_str_to_exif(shoottime)
         or _datetime_str_to_exif(uploadtime)
     )
-    if dt_str:
+
+
+def _exif_datetime_to_timestamp(dt_str: str | None) -> float | None:
+    """把 EXIF 格式的时间转换为本地时间戳，无法解析时返回 None。"""
+    if not dt_str:
+        return None
+    try:
+        return time.mktime(time.strptime(dt_str, "%Y:%m:%d %H:%M:%S"))
+    except Exception:
+        return None
+
+
+def _photo_timestamp(exif_data: dict, shoottime: str, uploadtime: str) -> float | None:
+    """按 originalTime > shoottime > uploadtime 的优先级计算照片时间戳（本地时间）。"""
+    return _exif_datetime_to_timestamp(_photo_datetime(exif_data, shoottime, uploadtime))
+
+
+def apply_exif_to_bytes(
+    content: bytes,
+    exif_data: dict,
+    shoottime: str,
+    uploadtime: str,
+    cameratype: str = "",
+) -> bytes:
+    """
+    在内存中将元数据写入 JPEG 数据的 EXIF，返回新的字节串。
+
+    非 JPEG 数据或写入出错时原样返回。
+    """
+    if content[:3] != b"\xff\xd8\xff":
+        return content
+    try:
         try:
-            t = time.mktime(time.strptime(dt_str, "%Y:%m:%d %H:%M:%S"))
-            os.utime(file_path, (t, t))
-        except Exception as e:
-            logger.warning(f"[mtime] 写入文件修改日期失败，文件 {file_path}: {e}")
+            exif_dict = piexif.load(content)
+        except Exception:
+            exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
+        _fill_exif_dict(exif_dict, exif_data, shoottime, uploadtime, cameratype)
+        output = io.BytesIO()
+        piexif.insert(piexif.dump(exif_dict), content, output)
+        return output.getvalue()
+    except Exception as e:
+        logger.warning(f"[EXIF] 内存回写失败: {e}")
+        return content
 
 
 def get_script_directory() -> str:
@@ -383,281 +670,3662 @@ def _detect_image_extension(content: bytes) -> str:
     return ".jpeg"
 
 
+IMAGE_EXTENSIONS = (".jpeg", ".png", ".gif", ".webp")
+# HLS 视频按 MPEG-TS 分段拼接时保存为 .ts，fMP4 分段拼接后为 .mp4
+VIDEO_EXTENSIONS = (".mp4", ".ts")
+VIDEO_COVER_SUFFIX = "_视频封面"
+
+
+FILE_NAMING_MODES = ("index", "pic_key")
+FILE_NAME_PREFIXES = ("", "date", "name")
+
+
+def format_photo_base_filename(
+    photo_index: int, photo: QzonePhoto, naming: str = "index", prefix: str = ""
+) -> str:
+    """
+    按命名方式生成照片/视频不含扩展名的文件名：
+        index:   "{序号}_{照片名}"，序号是照片在当前列表中的位置，相册增删照片后会变化
+        pic_key: "[前缀_]{pic_key}"，由照片的唯一标识生成，不随相册内容变化；
+                 前缀 "date" 为拍摄（或上传）时间，"name" 为照片名，"" 不加前缀
+    """
+    if naming != "pic_key":
+        return f"{photo_index}_{sanitize_filename_component(photo.name)}"
+    # 极少数照片没有 pic_key，以 URL 的摘要代替
+    key = photo.pic_key or hashlib.sha1(photo.url.encode("utf-8")).hexdigest()[:16]
+    key = sanitize_filename_component(key)
+    if prefix == "date":
+        dt_str = _photo_datetime(photo.exif_data, photo.shoottime, photo.uploadtime)
+        if dt_str:
+            key = f"{dt_str.replace(':', '').replace(' ', '_')}_{key}"
+    elif prefix == "name" and photo.name:
+        key = f"{sanitize_filename_component(photo.name)}_{key}"
+    return key
+
+
+def photo_base_filename(photo_index: int, photo: QzonePhoto) -> str:
+    """照片/视频保存时不含扩展名的文件名，命名方式见配置 file_naming 与 file_name_prefix。"""
+    return format_photo_base_filename(
+        photo_index,
+        photo,
+        APP_CONFIG.get("file_naming", "index"),
+        APP_CONFIG.get("file_name_prefix", ""),
+    )
+
+
+def find_saved_photo(
+    album_save_path: str,
+    base_filename: str,
+    is_video: bool,
+    archive_names: set[str] | None = None,
+) -> str | None:
+    """
+    查找照片在本地（或归档索引中）已保存的文件名，不存在返回 None。
+
+    图片的扩展名在下载后才能通过文件头确定，因此逐一检查所有可能的扩展名；
+    视频还会检查 .mp4/.ts 与视频封面图。
+    """
+    candidates = [base_filename + ext for ext in IMAGE_EXTENSIONS]
+    if is_video:
+        candidates[:0] = [base_filename + ext for ext in VIDEO_EXTENSIONS]
+        candidates += [base_filename + VIDEO_COVER_SUFFIX + ext for ext in IMAGE_EXTENSIONS]
+    for name in candidates:
+        if archive_names is not None:
+            if name in archive_names:
+                return name
+        elif os.path.exists(os.path.join(album_save_path, name)):
+            return name
+    return None
+
+
 def get_save_directory(user_qq: str) -> str:
     """确定给定用户的照片保存目录。"""
     download_path = APP_CONFIG.get("download_path", "downloads")
     return os.path.join(get_script_directory(), download_path, str(user_qq))
 
 
-def download_photo_network_helper(
-    request_cookies: dict | None, url: str, timeout: int
-) -> requests.Response:
-    """
-    下载照片的辅助函数：优先携带 cookies 请求，失败时再回退到无 cookies 请求。
+# ---------------------------------------------------------------------------
+# 相册与日期筛选
+# ---------------------------------------------------------------------------
 
-    Raises:
-        requests.exceptions.RequestException: 当所有网络请求都失败时
-    """
-    try:
-        if request_cookies:
-            return requests.get(url, cookies=request_cookies, timeout=timeout)
-        return requests.get(url, timeout=timeout)
-    except requests.exceptions.RequestException as first_error:
-        if request_cookies:
-            logger.warning(f"[警告] 携带 cookies 下载失败，尝试无 cookies 重试: {first_error}")
-            try:
-                return requests.get(url, timeout=timeout)
-            except requests.exceptions.RequestException as second_error:
-                raise ConnectionError(
-                    f"[网络错误] 尝试下载 {url} 时出错（cookies/无cookies均失败）: {second_error}"
-                ) from first_error
-        raise ConnectionError(
-            f"[网络错误] 尝试下载 {url} 时出错: {first_error}"
-        ) from first_error
+DateWindow = namedtuple(
+    "DateWindow",
+    [
+        "start",  # float | None，时间戳下限（含）
+        "end",    # float | None，时间戳上限（不含）
+        "field",  # str，"upload" 按上传时间，"shoot" 按拍摄时间
+    ],
+)
 
+PHOTO_DATE_FIELDS = ("upload", "shoot")
 
-def save_photo_worker(args: tuple) -> None:
-    """
-    工作函数，用于下载并保存单张照片或视频。在线程池中运行。
 
-    args 元组字段：
-        request_cookies, user_qq, album_index, album_name, photo_index,
-        photo, log_func, progress_func, is_stopped_func, qzone_manager,
-        album_id, dest_user_qq
+def album_matches(pattern: str, album: QzoneAlbum) -> bool:
     """
-    (
-        request_cookies,
-        user_qq,
-        album_index,
-        album_name,
-        photo_index,
-        photo,
-        log_func,       # callable(str)，输出日志
-        progress_func,  # callable(int)，更新进度；CLI 模式传 None 或 noop
-        is_stopped_func,
-        qzone_manager,
-        album_id,
-        dest_user_qq,
-    ) = args
+    判断相册是否匹配一条规则：
+        "id:<相册 ID>"  按相册 ID 精确匹配
+        "re:<正则>"     在相册名中搜索正则表达式
+        其他            相册名的 glob 通配（*、?、[...]），不含通配符时即按名称精确匹配
+    """
+    pattern = str(pattern)
+    if pattern.startswith("id:"):
+        return album.uid == pattern[3:].strip()
+    if pattern.startswith("re:"):
+        try:
+            return re.search(pattern[3:], album.name) is not None
+        except re.error as e:
+            logger.warning(f"[筛选] 无效的相册正则 {pattern!r}: {e}")
+            return False
+    return album.name == pattern or fnmatch.fnmatchcase(album.name, pattern)
 
-    def _log(msg: str) -> None:
-        if log_func:
-            log_func(msg)
-        logger.info(msg)
 
-    def _progress(n: int) -> None:
-        if progress_func:
-            progress_func(n)
+def is_album_selected(album: QzoneAlbum) -> bool:
+    """按配置项 include_albums（为空表示全部）与 exclude_albums 判断是否处理该相册。"""
+    include = APP_CONFIG.get("include_albums", [])
+    if include and not any(album_matches(pattern, album) for pattern in include):
+        return False
+    exclude = APP_CONFIG.get("exclude_albums", [])
+    return not any(album_matches(pattern, album) for pattern in exclude)
 
-    if is_stopped_func():
-        _log(f"[停止] 照片下载任务已停止，跳过：相册 '{album_name}', 照片 {photo_index + 1}")
-        _progress(1)
-        return
 
-    album_save_path = os.path.join(
-        get_save_directory(user_qq), sanitize_filename_component(album_name.strip())
-    )
-    if not os.path.exists(album_save_path):
-        try:
-            os.makedirs(album_save_path, exist_ok=True)
-        except OSError as e:
-            _log(f"[错误] 无法创建目录 {album_save_path}: {e}")
-            return
+def parse_date_bound(value, end: bool = False) -> float | None:
+    """
+    解析日期筛选的边界，返回时间戳；空值返回 None，无法解析时抛出 ValueError。
+        "30d"                  距今 30 天
+        "2024-05-01"           当天 0 点；作为上限（end=True）时为次日 0 点，即包含当天
+        "2024-05-01 12:00:00"  精确到秒
+    """
+    text = str(value or "").strip()
+    if not text:
+        return None
+    m = re.fullmatch(r"(\d+)\s*d", text)
+    if m:
+        return time.time() - int(m.group(1)) * 86400
+    ts = _exif_datetime_to_timestamp(_datetime_str_to_exif(text))
+    if ts is None:
+        raise ValueError(f"无法解析日期 {text!r}，应为 YYYY-MM-DD、YYYY-MM-DD HH:MM:SS 或 30d")
+    if end and re.fullmatch(r"\d{4}-\d{2}-\d{2}", text):
+        ts += 86400
+    return ts
+
+
+def get_date_window() -> DateWindow | None:
+    """按配置项 photo_date_from / photo_date_to / photo_date_field 生成日期窗口，未配置时为 None。"""
+    start = parse_date_bound(APP_CONFIG.get("photo_date_from", ""))
+    end = parse_date_bound(APP_CONFIG.get("photo_date_to", ""), end=True)
+    if start is None and end is None:
+        return None
+    field = APP_CONFIG.get("photo_date_field", "upload")
+    if field not in PHOTO_DATE_FIELDS:
+        raise ValueError(f"photo_date_field 应为 {' 或 '.join(PHOTO_DATE_FIELDS)}，而不是 {field!r}")
+    return DateWindow(start, end, field)
 
-    photo_name_sanitized = sanitize_filename_component(photo.name)
-    base_filename = f"{photo_index}_{photo_name_sanitized}"
 
-    download_url = photo.url
-    file_extension = ".jpeg"
+def describe_date_window(window: DateWindow) -> str:
+    """日期窗口的可读描述，用于日志。"""
 
-    if photo.is_video:
-        _log(f"[检测到视频] 正在获取真实视频下载链接: '{photo.name}'")
-        video_url = qzone_manager.get_video_download_url(dest_user_qq, album_id, photo.pic_key)
+    def _fmt(ts: float | None) -> str:
+        return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts)) if ts is not None else "不限"
 
-        if video_url:
-            download_url = video_url
-            file_extension = ".mp4"
-            final_filename = f"{base_filename}{file_extension}"
-            full_photo_path = os.path.join(album_save_path, final_filename)
+    field = "拍摄时间" if window.field == "shoot" else "上传时间"
+    return f"{field}从 {_fmt(window.start)} 到 {_fmt(window.end)}"
 
-            if not is_path_valid(full_photo_path):
-                _log(f"[警告] 原始视频文件名无效: {final_filename}。将使用随机名称。")
-                final_filename = f"random_name_{album_index}_{photo_index}{file_extension}"
-                full_photo_path = os.path.join(album_save_path, final_filename)
-                if not is_path_valid(full_photo_path):
-                    _log(f"[错误] 备用视频文件名也无效，跳过视频: {photo.url}")
-                    _progress(1)
-                    return
 
-            if os.path.exists(full_photo_path):
-                _log(f"[本地已存在] 相册 '{album_name}', 视频 {photo_index + 1} ('{photo.name}')")
-                _progress(1)
-                return
+def photo_upload_timestamp(photo: QzonePhoto) -> float | None:
+    """照片上传时间的时间戳；上传时间缺失或无法解析时为 None。"""
+    return _exif_datetime_to_timestamp(_datetime_str_to_exif(photo.uploadtime))
 
-            _log(f"[成功] 获取到视频 {base_filename} 下载链接")
-        else:
-            _log(f"[失败] 无法获取视频 {base_filename} 下载链接，将下载视频封面图代替")
-            base_filename = f"{photo_index}_{photo_name_sanitized}_视频封面"
-            final_filename = ""
-            full_photo_path = ""
+
+def photo_in_window(photo: QzonePhoto, window: DateWindow) -> bool:
+    """照片时间是否落在窗口内；时间未知的照片保留。"""
+    if window.field == "shoot":
+        ts = _photo_timestamp(photo.exif_data, photo.shoottime, photo.uploadtime)
     else:
-        final_filename = ""
-        full_photo_path = ""
+        ts = photo_upload_timestamp(photo)
+    if ts is None:
+        return True
+    return (window.start is None or ts >= window.start) and (window.end is None or ts < window.end)
 
-    url = download_url.replace("\\", "")
-    attempts = 0
-    current_timeout = APP_CONFIG["timeout_init"]
 
-    download_type = "视频" if photo.is_video and file_extension == ".mp4" else "照片"
-    _log(f"[开始下载] 相册 '{album_name}', {download_type} {photo_index + 1} ('{photo.name}')")
+def album_may_overlap(album: QzoneAlbum, window: DateWindow) -> bool:
+    """
+    相册是否可能含有窗口内的照片。相册最后修改时间早于下限时，其中照片的上传时间都早于下限；
+    拍摄时间不晚于上传时间，按拍摄时间筛选时同样成立。修改时间未知时视为可能。
+    """
+    return window.start is None or not album.modifytime or album.modifytime >= window.start
 
-    while attempts < APP_CONFIG["max_attempts"]:
-        if is_stopped_func():
-            _log(f"[停止] 照片下载任务已停止，跳过重试：相册 '{album_name}', 照片 {photo_index + 1}")
-            _progress(1)
-            return
 
-        try:
-            response = download_photo_network_helper(request_cookies, url, current_timeout)
-            response.raise_for_status()
+# ---------------------------------------------------------------------------
+# API 限流
+# ---------------------------------------------------------------------------
 
-            if not (photo.is_video and file_extension == ".mp4"):
-                file_extension = _detect_image_extension(response.content)
-                final_filename = f"{base_filename}{file_extension}"
-                full_photo_path = os.path.join(album_save_path, final_filename)
 
-                if not is_path_valid(full_photo_path):
-                    _log(f"[警告] 原始文件名无效: {final_filename}。将使用随机名称。")
-                    final_filename = f"random_name_{album_index}_{photo_index}{file_extension}"
-                    full_photo_path = os.path.join(album_save_path, final_filename)
-                    if not is_path_valid(full_photo_path):
-                        _log(f"[错误] 备用文件名也无效，跳过照片: {photo.url}")
-                        _progress(1)
-                        return
-
-                if os.path.exists(full_photo_path):
-                    _log(f"[本地已存在] 相册 '{album_name}', 照片 {photo_index + 1} ('{photo.name}')")
-                    _progress(1)
-                    return
+class ApiRateLimiter:
+    """
+    QQ 空间 API 请求的并发与速率限制（信号量 + 令牌桶）。
 
-            with open(full_photo_path, "wb") as f:
-                f.write(response.content)
+    用作上下文管理器：进入时等待并发名额与令牌，退出时归还并发名额。
+    rate <= 0 表示不限制速率，仅限制并发。
+    """
 
-            write_exif_to_photo(
-                full_photo_path,
-                photo.exif_data,
-                photo.shoottime,
-                photo.uploadtime,
-                photo.cameratype,
-            )
+    def __init__(self, max_concurrency: int, rate: float):
+        self._semaphore = threading.BoundedSemaphore(max(1, int(max_concurrency)))
+        self.rate = float(rate)
+        self._capacity = max(1.0, float(max_concurrency))
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
 
-            _log(
-                f"[下载成功] 相册 '{album_name}', 照片 {photo_index + 1}。"
-                f"尝试次数: {attempts + 1}, 超时时间: {current_timeout}s"
-            )
-            _progress(1)
+    def _take_token(self) -> None:
+        if self.rate <= 0:
             return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
 
-        except (
-            requests.exceptions.ReadTimeout,
-            requests.exceptions.ConnectionError,
-        ) as e:
-            attempts += 1
-            current_timeout += 5
-            _log(
-                f"[重试下载] 相册 '{album_name}', 照片 {photo_index + 1}。"
-                f"尝试 {attempts}/{APP_CONFIG['max_attempts']}, "
-                f"新超时时间: {current_timeout}s。错误: {e}"
-            )
-        except requests.exceptions.HTTPError as e:
-            _log(
-                f"[HTTP 错误] 下载 {url} 失败 (相册 '{album_name}', 照片 {photo_index + 1})。"
-                f"状态码: {e.response.status_code}。中止下载此照片。"
-            )
-            _progress(1)
-            return
-        except Exception as e:
-            attempts += 1
-            _log(
-                f"[意外错误] 重试下载 {url}, 相册 '{album_name}', 照片 {photo_index + 1}。"
-                f"尝试 {attempts}/{APP_CONFIG['max_attempts']}。错误: {e}"
-            )
+    def __enter__(self) -> "ApiRateLimiter":
+        self._semaphore.acquire()
+        try:
+            self._take_token()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
 
-    _log(
-        f"[下载失败] 用户: {user_qq}, 相册 '{album_name}', 照片 {photo_index + 1} "
-        f"('{photo.name}') URL: {photo.url} (尝试 {APP_CONFIG['max_attempts']} 次后)"
-    )
-    _progress(1)
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._semaphore.release()
 
 
 # ---------------------------------------------------------------------------
-# QzonePhotoManager
+# 登录态失效处理
 # ---------------------------------------------------------------------------
 
+# QQ 空间 API 返回这些 code 表示未登录或登录态已失效
+AUTH_ERROR_CODES = (-3000,)
+# API 请求返回这些 HTTP 状态码时怀疑登录态失效（需二次验证确认）
+AUTH_SUSPECT_STATUS_CODES = (401, 403)
 
-class QzonePhotoManager:
-    """管理 QQ 空间相册和照片的获取与下载。"""
+# AuthCircuitBreaker.report_failure 的返回值
+AUTH_VALID = "valid"        # 验证后登录态仍有效，失败与登录无关
+AUTH_RENEWED = "renewed"    # 登录态已刷新，可以重试
+AUTH_BROKEN = "broken"      # 无法恢复登录态
+AUTH_UNKNOWN = "unknown"    # 验证请求本身失败，暂时无法确认登录态，退避后重试
 
-    ALBUM_LIST_URL_TEMPLATE = (
-        "https://user.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/fcg_list_album_v3?"
-        "g_tk={gtk}&t={t}&hostUin={dest_user}&uin={user}"
-        "&appid=4&inCharset=utf-8&outCharset=utf-8&source=qzone&plat=qzone&format=jsonp"
-        "&notice=0&filter=1&handset=4&pageNumModeSort=40&pageNumModeClass=15&needUserInfo=1"
-        "&idcNum=4&callbackFun=shine0&callback=shine0_Callback"
-    )
 
-    ALBUM_LIST_URL_WITH_PAGE_TEMPLATE = (
-        "https://user.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/fcg_list_album_v3?"
-        "g_tk={gtk}&t={t}&hostUin={dest_user}&uin={user}"
-        "&appid=4&inCharset=utf-8&outCharset=utf-8&source=qzone&plat=qzone&format=jsonp"
-        "&notice=0&filter=1&handset=4&pageNumModeSort=40&pageNumModeClass=15&needUserInfo=1"
-        "&idcNum=4&callbackFun=shine{fn}&mode=2&sortOrder=2"
-        "&pageStart={pageStart}&pageNum={pageNum}&callback=shine{fn}_Callback"
-    )
+def is_auth_failure(status_code: int | None = None, data: dict | None = None) -> bool:
+    """统一判断一次请求的失败是否（可能）由登录态失效引起。"""
+    if status_code is not None and status_code in AUTH_SUSPECT_STATUS_CODES:
+        return True
+    if isinstance(data, dict) and data.get("code") in AUTH_ERROR_CODES:
+        return True
+    return False
 
-    PHOTO_LIST_URL_TEMPLATE = (
-        "https://h5.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/"
-        "cgi_list_photo?g_tk={gtk}&t={t}&mode=0&idcNum=4&hostUin={dest_user}"
-        "&topicId={album_id}&noTopic=0&uin={user}&pageStart={pageStart}&pageNum={pageNum}"
-        "&skipCmtCount=0&singleurl=1&batchId=&notice=0&appid=4&inCharset=utf-8&outCharset=utf-8"
-        "&source=qzone&plat=qzone&outstyle=json&format=jsonp&json_esc=1&question=&answer="
-        "&callbackFun=shine0&callback=shine0_Callback"
-    )
 
-    VIDEO_DETAIL_URL_TEMPLATE = (
-        "https://user.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/"
-        "cgi_floatview_photo_list_v2?g_tk={gtk}&t={t}&topicId={album_id}&picKey={pic_key}"
-        "&shootTime=&cmtOrder=1&fupdate=1&plat=qzone&source=qzone&cmtNum=10&likeNum=5"
-        "&inCharset=utf-8&outCharset=utf-8&callbackFun=viewer&offset=0&number=15"
-        "&uin={user}&hostUin={dest_user}&appid=4&isFirst=1&sortOrder=1&showMode=1"
-        "&need_private_comment=1&prevNum=9&postNum=18"
-    )
+class AuthCircuitBreaker:
+    """
+    登录态失效熔断器。
 
-    def __init__(self, user_qq: str, log_signal=None, is_stopped_func=None):
-        """
-        初始化 QzonePhotoManager。
+    任一线程遇到疑似登录失效的响应时调用 report_failure()：首个调用者断开熔断器并
+    执行一次恢复流程（先验证 cookie，失效时再调用可插拔的重新登录钩子），其余线程在
+    wait_if_open() / report_failure() 中等待恢复结果，避免成千上万个注定失败的请求。
 
+    只有验证明确报告 cookie 失效时才重新登录；验证请求本身失败（网络错误等）时无法
+    判断登录态，返回 AUTH_UNKNOWN 并指数退避，退避期间的报告直接返回 AUTH_UNKNOWN。
+    """
+
+    VALID_CACHE_SECONDS = 30  # 验证为“有效”的结果在此时间内复用，避免反复验证
+    UNKNOWN_BACKOFF_BASE = 5  # 秒，无法确认登录态后的首次退避时间
+    UNKNOWN_BACKOFF_MAX = 120  # 秒，退避时间上限
+
+    def __init__(self, validate_func, reauth_func):
+        """
         Args:
-            user_qq:         登录用户的 QQ 号
-            log_signal:      可选，PyQt signal（有 .emit(str) 方法），用于 GUI 日志输出
-            is_stopped_func: 可选，无参可调用对象，返回 True 时中断操作
+            validate_func: 无参可调用对象，返回 True 表示当前 cookie 仍然有效，
+                           False 表示已失效，None 表示验证请求失败、无法判断
+            reauth_func:   无参可调用对象，重新获取登录态，成功返回 True
         """
-        self.user_qq = str(user_qq)
+        self.validate_func = validate_func
+        self.reauth_func = reauth_func
+        self.generation = 0  # 每次成功刷新登录态后递增
+        self._cond = threading.Condition()
+        self._recovering = False
+        self._broken = False
+        self._last_valid_at = 0.0
+        self._unknown_count = 0  # 连续无法确认登录态的次数
+        self._retry_after = 0.0
+
+    @property
+    def broken(self) -> bool:
+        return self._broken
+
+    def reset(self) -> None:
+        """清除“无法恢复”状态，之后再遇到登录失效时重新尝试恢复（如常驻服务开始新任务时）。"""
+        with self._cond:
+            if self._broken:
+                self._broken = False
+                self._last_valid_at = 0.0
+                self._unknown_count = 0
+                self._retry_after = 0.0
+                logger.info("[认证] 已重置登录态熔断器，之后的请求将重新尝试恢复登录态。")
+
+    def backoff_remaining(self) -> float:
+        """无法确认登录态后剩余的退避时间（秒）。"""
+        with self._cond:
+            return max(0.0, self._retry_after - time.monotonic())
+
+    def wait_if_open(self) -> bool:
+        """熔断器断开（正在恢复）时阻塞等待；返回 False 表示登录态已无法恢复。"""
+        with self._cond:
+            while self._recovering:
+                self._cond.wait()
+            return not self._broken
+
+    def report_failure(self, generation: int) -> str:
+        """
+        报告一次疑似登录失效。
+
+        Args:
+            generation: 发出该请求时的 self.generation；若之后已刷新过登录态，直接返回 AUTH_RENEWED
+
+        Returns:
+            AUTH_VALID / AUTH_RENEWED / AUTH_BROKEN / AUTH_UNKNOWN 之一。
+        """
+        with self._cond:
+            while self._recovering:
+                self._cond.wait()
+            if self._broken:
+                return AUTH_BROKEN
+            if generation != self.generation:
+                return AUTH_RENEWED
+            if time.monotonic() - self._last_valid_at < self.VALID_CACHE_SECONDS:
+                return AUTH_VALID
+            if time.monotonic() < self._retry_after:
+                return AUTH_UNKNOWN
+            self._recovering = True
+
+        result = AUTH_BROKEN
+        try:
+            logger.warning("[认证] 检测到疑似登录失效，暂停所有请求并验证登录态...")
+            try:
+                valid = self.validate_func()
+            except Exception as e:
+                logger.warning(f"[认证] 验证登录态时出错: {e}")
+                valid = None
+            if valid:
+                result = AUTH_VALID
+            elif valid is None:
+                result = AUTH_UNKNOWN
+            else:
+                logger.warning("[认证] 登录态已失效，尝试重新登录...")
+                result = AUTH_RENEWED if self.reauth_func() else AUTH_BROKEN
+        except Exception as e:
+            logger.exception(f"[认证] 恢复登录态时出错: {e}")
+            result = AUTH_BROKEN
+        finally:
+            with self._cond:
+                if result == AUTH_UNKNOWN:
+                    self._unknown_count += 1
+                    delay = min(
+                        self.UNKNOWN_BACKOFF_MAX,
+                        self.UNKNOWN_BACKOFF_BASE * 2 ** (self._unknown_count - 1),
+                    )
+                    self._retry_after = time.monotonic() + delay
+                    logger.warning(f"[认证] 暂时无法确认登录态，{delay} 秒后重试。")
+                else:
+                    self._unknown_count = 0
+                    self._retry_after = 0.0
+                if result == AUTH_VALID:
+                    self._last_valid_at = time.monotonic()
+                elif result == AUTH_RENEWED:
+                    self.generation += 1
+                    logger.warning("[认证] 登录态已刷新，恢复下载。")
+                elif result == AUTH_BROKEN:
+                    self._broken = True
+                    logger.error("[认证] 无法恢复登录态，终止后续请求。")
+                self._recovering = False
+                self._cond.notify_all()
+        return result
+
+
+# ---------------------------------------------------------------------------
+# 归档输出（output_mode = "zip" / "tar"）
+# ---------------------------------------------------------------------------
+
+ARCHIVE_MODES = ("zip", "tar")
+
+
+class AlbumArchiveWriter:
+    """
+    将单个相册的所有照片写入一个 ZIP/TAR 归档文件。
+
+    - 下载在线程池中并行进行，写入通过内部锁串行化；
+    - 旁路维护 JSONL 索引（<归档名>.index.jsonl），用于快速判断成员是否已存在及断点续传；
+    - 进程崩溃后 ZIP 缺少中央目录、TAR 末尾留有写了一半的成员，打开时按各成员的文件头
+      找回完整写入的成员，截掉残缺部分（ZIP 同时重建中央目录）后继续追加；
+      仍无法恢复时才将其改名备份后重新开始。
+    """
+
+    RECOVER_CHUNK_SIZE = 1024 * 1024  # 恢复时校验成员 CRC 每次读取的字节数
+
+    def __init__(self, archive_path: str, fmt: str):
+        if fmt not in ARCHIVE_MODES:
+            raise ValueError(f"不支持的归档格式: {fmt}")
+        self.archive_path = archive_path
+        self.index_path = archive_path + ".index.jsonl"
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        self._index: dict[str, dict] = {}
+        self._archive = None
+        self._index_file = None
+        self._open()
+
+    def _open(self) -> None:
+        """打开（或创建）归档与索引，并以归档中的实际成员校正索引。"""
+        if os.path.exists(self.archive_path):
+            self._load_index()
+        elif os.path.exists(self.index_path):
+            # 索引存在但归档已丢失，索引作废
+            os.remove(self.index_path)
+
+        try:
+            self._archive = self._open_archive()
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+            logger.warning(f"[归档] {self.archive_path} 无法直接打开 ({e})，尝试恢复已写入的成员...")
+            try:
+                recovered = self._recover_zip() if self.fmt == "zip" else self._recover_tar()
+                self._archive = self._open_archive()
+                logger.info(f"[归档] {self.archive_path} 已恢复 {recovered} 个成员。")
+            except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+                backup_path = f"{self.archive_path}.corrupt-{int(time.time())}"
+                logger.warning(
+                    f"[归档] {self.archive_path} 无法恢复 ({e})，已备份为 {backup_path} 并重建。"
+                )
+                os.replace(self.archive_path, backup_path)
+                if os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+                self._index = {}
+                self._archive = self._open_archive()
+
+        # 归档中的实际成员是权威列表：补充索引缺失的条目（如写入成员后、写索引前崩溃），
+        # 剔除已不存在的条目，避免重复写入或误判已存在
+        if self.fmt == "zip":
+            names = set(self._archive.namelist())
+        else:
+            names = set(self._archive.getnames())
+        self._index = {k: v for k, v in self._index.items() if k in names}
+        for name in names - self._index.keys():
+            self._index[name] = {"name": name}
+
+        self._index_file = open(self.index_path, "a", encoding="utf-8")
+
+    def _open_archive(self):
+        if self.fmt == "zip":
+            # 追加模式遇到非 ZIP 文件会在其后拼接新归档，这里显式视为损坏
+            if (
+                os.path.exists(self.archive_path)
+                and os.path.getsize(self.archive_path) > 0
+                and not zipfile.is_zipfile(self.archive_path)
+            ):
+                raise zipfile.BadZipFile("缺少 ZIP 中央目录")
+            return zipfile.ZipFile(self.archive_path, "a", compression=zipfile.ZIP_STORED)
+        return tarfile.open(self.archive_path, "a")
+
+    def _recover_zip(self) -> int:
+        """
+        按本地文件头找回缺少中央目录的 ZIP 中完整写入的成员，截掉残缺部分并重建中央目录。
+
+        成员以 ZIP_STORED 写入可寻址文件，zipfile 在成员写完后才回填头部的大小与 CRC，
+        因此大小越界、CRC 不符或其后不是下一个文件头的成员即为崩溃时未写完的成员。
+
+        Returns:
+            int: 恢复的成员数。
+        """
+        infos: list[zipfile.ZipInfo] = []
+        end = 0
+        file_size = os.path.getsize(self.archive_path)
+        with open(self.archive_path, "rb") as f:
+            while True:
+                f.seek(end)
+                header = f.read(zipfile.sizeFileHeader)
+                if len(header) < zipfile.sizeFileHeader:
+                    break
+                fields = struct.unpack(zipfile.structFileHeader, header)
+                if fields[0] != zipfile.stringFileHeader:
+                    break
+                flag_bits, compress_type = fields[3], fields[4]
+                if flag_bits & 0x08 or compress_type != zipfile.ZIP_STORED:
+                    break  # 本类只写不压缩、不带数据描述符的成员
+                raw_name = f.read(fields[10])
+                extra = f.read(fields[11])
+                crc, size = fields[7], fields[8]
+                if size == 0xFFFFFFFF:
+                    size = self._zip64_extra_size(extra)
+                    if size is None:
+                        break
+                data_start = end + zipfile.sizeFileHeader + fields[10] + fields[11]
+                data_end = data_start + size
+                if data_end > file_size:
+                    break
+                f.seek(data_end)
+                following = f.read(4)
+                if following and following not in (
+                    zipfile.stringFileHeader,
+                    zipfile.stringCentralDir,
+                ):
+                    break
+                f.seek(data_start)
+                digest = 0
+                remaining = size
+                while remaining:
+                    chunk = f.read(min(remaining, self.RECOVER_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    digest = zlib.crc32(chunk, digest)
+                    remaining -= len(chunk)
+                if remaining or digest != crc:
+                    break
+                name = raw_name.decode("utf-8" if flag_bits & 0x800 else "cp437")
+                info = zipfile.ZipInfo(name, date_time=self._dos_date_time(fields[6], fields[5]))
+                info.compress_type = zipfile.ZIP_STORED
+                info.flag_bits = flag_bits
+                info.extract_version = fields[1]
+                info.CRC = crc
+                info.compress_size = info.file_size = size
+                info.header_offset = end
+                info.extra = extra
+                infos.append(info)
+                end = data_end
+
+        # 截掉残缺部分，在其位置写入由已恢复成员组成的中央目录
+        with open(self.archive_path, "r+b") as f:
+            f.truncate(end)
+            f.seek(end)
+            archive = zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED)
+            for info in infos:
+                archive.filelist.append(info)
+                archive.NameToInfo[info.filename] = info
+            archive.close()
+        return len(infos)
+
+    @staticmethod
+    def _zip64_extra_size(extra: bytes) -> int | None:
+        """从本地文件头的 ZIP64 扩展字段中读取成员大小。"""
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, length = struct.unpack("<HH", extra[pos:pos + 4])
+            if tag == 0x0001 and length >= 16:
+                file_size, compress_size = struct.unpack("<QQ", extra[pos + 4:pos + 20])
+                return compress_size or file_size
+            pos += 4 + length
+        return None
+
+    @staticmethod
+    def _dos_date_time(date: int, dos_time: int) -> tuple:
+        return (
+            (date >> 9) + 1980,
+            max((date >> 5) & 0xF, 1),
+            max(date & 0x1F, 1),
+            dos_time >> 11,
+            (dos_time >> 5) & 0x3F,
+            (dos_time & 0x1F) * 2,
+        )
+
+    def _recover_tar(self) -> int:
+        """
+        找回 TAR 中完整写入的成员，截掉末尾写了一半的成员并补上结束块，使其可以继续追加。
+
+        TAR 的结束块只在关闭时写入，进程崩溃后追加模式会因末尾没有结束块而无法打开。
+
+        Returns:
+            int: 恢复的成员数。
+        """
+        end = 0
+        count = 0
+        file_size = os.path.getsize(self.archive_path)
+        with tarfile.open(self.archive_path, "r") as archive:
+            while True:
+                try:
+                    member = archive.next()
+                except (tarfile.TarError, EOFError, OSError):
+                    break
+                if member is None:
+                    break
+                data_end = member.offset_data + member.size
+                if data_end > file_size:
+                    break
+                end = member.offset_data + (
+                    -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                )
+                count += 1
+        with open(self.archive_path, "r+b") as f:
+            f.truncate(min(end, file_size))
+            f.seek(end)
+            f.write(b"\0" * (tarfile.BLOCKSIZE * 2))
+        return count
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时可能留下半行，忽略即可
+                        continue
+                    self._index[entry["name"]] = entry
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def read_member_names(archive_path: str) -> set[str]:
+        """只读地从索引文件读取已写入的成员名，不打开归档本身。"""
+        names: set[str] = set()
+        if not os.path.exists(archive_path):
+            return names
+        try:
+            with open(archive_path + ".index.jsonl", "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        names.add(json.loads(line)["name"])
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return names
+
+    def contains(self, member_name: str) -> bool:
+        """判断成员是否已写入归档。"""
+        with self._lock:
+            return member_name in self._index
+
+    def add(
+        self,
+        member_name: str,
+        content: bytes,
+        mtime: float | None = None,
+        pic_key: str = "",
+    ) -> None:
+        """向归档追加一个成员，并记录到索引。"""
+        self._add_stream(member_name, io.BytesIO(content), len(content), mtime, pic_key)
+
+    def add_file(
+        self,
+        member_name: str,
+        path: str,
+        mtime: float | None = None,
+        pic_key: str = "",
+    ) -> None:
+        """将磁盘上的文件流式追加为归档成员（用于不宜整体读入内存的大视频）。"""
+        with open(path, "rb") as f:
+            self._add_stream(member_name, f, os.path.getsize(path), mtime, pic_key)
+
+    def _add_stream(
+        self, member_name: str, fileobj, size: int, mtime: float | None, pic_key: str
+    ) -> None:
+        mtime = mtime if mtime is not None else time.time()
+        with self._lock:
+            if self._archive is None:
+                raise RuntimeError(f"归档 {self.archive_path} 已关闭")
+            if self.fmt == "zip":
+                info = zipfile.ZipInfo(
+                    member_name, date_time=time.localtime(max(mtime, 315619200))[:6]
+                )
+                info.compress_type = zipfile.ZIP_STORED
+                info.file_size = size
+                with self._archive.open(info, "w", force_zip64=size >= 2**31) as dst:
+                    shutil.copyfileobj(fileobj, dst, DOWNLOAD_CHUNK_SIZE)
+            else:
+                info = tarfile.TarInfo(member_name)
+                info.size = size
+                info.mtime = int(mtime)
+                self._archive.addfile(info, fileobj)
+                self._archive.fileobj.flush()
+
+            entry = {"name": member_name, "size": size, "mtime": int(mtime)}
+            if pic_key:
+                entry["pic_key"] = pic_key
+            self._index[member_name] = entry
+            self._index_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index_file.flush()
+
+    def close(self) -> None:
+        """关闭归档（ZIP 在此时写入中央目录）与索引文件。"""
+        with self._lock:
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
+            if self._index_file is not None:
+                self._index_file.close()
+                self._index_file = None
+
+
+_download_session: requests.Session | None = None
+_download_session_lock = threading.Lock()
+
+
+def get_download_session() -> requests.Session:
+    """
+    获取下载共用的 requests.Session（连接池大小与 max_workers 一致）。
+
+    会话不保存服务器下发的 cookie，每次请求的 cookie 完全由调用方决定，
+    以保证“无 cookies 回退请求”确实不携带 cookie。
+    """
+    global _download_session
+    with _download_session_lock:
+        if _download_session is None:
+            session = requests.Session()
+            pool_size = max(int(APP_CONFIG.get("max_workers", 10)), 10)
+            adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            _download_session = session
+        return _download_session
+
+
+def get_download_timeout() -> tuple[float, float]:
+    """返回下载使用的 (连接超时, 读取超时)，单位秒。"""
+    return (
+        APP_CONFIG.get("connect_timeout", 10),
+        APP_CONFIG.get("read_timeout", APP_CONFIG.get("timeout_init", 30)),
+    )
+
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# 响应没有 Content-Length 时预先预留的字节数，实际超出部分在读取时追加
+UNKNOWN_SIZE_RESERVE = 2 * 1024 * 1024
+# HLS 分段与归档模式下分段下载的临时目录（位于用户目录下），完成后自动清理
+DOWNLOAD_TMP_DIR = ".qzone_tmp"
+
+
+class ByteBudget:
+    """
+    全局下载内存预算：限制所有下载中以及等待写盘的数据总字节数。
+
+    新传输在读取响应体前按 Content-Length 预留容量，预算不足时等待，直到写盘完成
+    归还容量。读取中超出预留的部分直接追加而不等待，避免持有部分预留的传输互相
+    死锁；单个文件超过整个预算时，只要当前没有其他预留即可开始。
+    capacity <= 0 表示不限制。
+    """
+
+    WAIT_POLL_INTERVAL = 0.5  # 秒，等待期间检查停止标志的间隔
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._cond = threading.Condition()
+        self._used = 0
+        self.peak = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self, nbytes: int, is_stopped_func=None) -> bool:
+        """预留 nbytes 字节，必要时等待；等待期间收到停止请求时返回 False。"""
+        start = time.monotonic()
+        with self._cond:
+            while (
+                self.capacity > 0
+                and self._used > 0
+                and self._used + nbytes > self.capacity
+            ):
+                if is_stopped_func is not None and is_stopped_func():
+                    return False
+                self._cond.wait(self.WAIT_POLL_INTERVAL)
+            self._reserve(nbytes)
+            self.wait_seconds += time.monotonic() - start
+        return True
+
+    def grow(self, nbytes: int) -> None:
+        """在已有预留的基础上追加 nbytes 字节，不等待。"""
+        with self._cond:
+            self._reserve(nbytes)
+
+    def release(self, nbytes: int) -> None:
+        with self._cond:
+            self._used = max(self._used - nbytes, 0)
+            self._cond.notify_all()
+
+    def _reserve(self, nbytes: int) -> None:
+        self._used += nbytes
+        self.peak = max(self.peak, self._used)
+
+
+class RequestHedger:
+    """
+    对冲请求：等待响应头的时间超过近期延迟的 percentile 分位数时，再发出一个相同的请求，
+    使用先返回的响应，另一个返回后直接关闭。
+
+    延迟样本不足 MIN_SAMPLES 个时不对冲；对冲次数不超过请求总数的 max_ratio，
+    避免 CDN 整体变慢时流量翻倍。enabled 为 False 时直接在调用线程中发出请求。
+    """
+
+    MIN_SAMPLES = 20
+    WINDOW = 512        # 参与分位数计算的最近样本数
+    POOL_WORKERS = 64   # 对冲模式下发出请求的线程数上限（按需创建）
+    STOP_POLL_INTERVAL = 0.5  # 秒，等待响应时检查停止标志的间隔
+
+    def __init__(self, enabled: bool, percentile: float = 95, max_ratio: float = 0.05):
+        self.enabled = enabled and percentile > 0 and max_ratio > 0
+        self.percentile = min(float(percentile), 100.0)
+        self.max_ratio = max_ratio
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=self.WINDOW)
+        self._pool: ThreadPoolExecutor | None = None
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def threshold(self) -> float | None:
+        """当前触发对冲的等待时间（秒），样本不足时为 None。"""
+        with self._lock:
+            if len(self._samples) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
+    def fetch(
+        self,
+        request_func,
+        is_stopped_func=None,
+        transfers: "ActiveTransfers | None" = None,
+    ) -> requests.Response:
+        """
+        调用 request_func()（返回流式响应）获取响应，必要时发出对冲请求。
+
+        在线程池中发出的请求，响应一返回即登记到 transfers，停止时与其他传输一起被中断；
+        落败的响应返回后注销并关闭。等待期间收到停止请求时抛出 ConnectionError，
+        两个请求都失败时抛出最后一个异常。
+        """
+        with self._lock:
+            self.requests += 1
+        start = time.monotonic()
+        threshold = self.threshold() if self.enabled else None
+        if threshold is None:
+            response = request_func()
+            self._record(time.monotonic() - start)
+            return response
+
+        def _request() -> requests.Response:
+            response = request_func()
+            if transfers is not None:
+                transfers.add(response)
+            return response
+
+        def _close_loser(future) -> None:
+            if future.cancelled() or future.exception() is not None:
+                return
+            response = future.result()
+            if transfers is not None:
+                transfers.discard(response)
+            response.close()
+
+        pool = self._get_pool()
+        primary = pool.submit(_request)
+        pending = {primary}
+        done, _ = wait(pending, timeout=threshold)
+        if not done and self._allow_hedge():
+            pending.add(pool.submit(_request))
+        last_error: BaseException | None = None
+        while pending:
+            if is_stopped_func is not None and is_stopped_func():
+                for future in pending:
+                    future.cancel()
+                    future.add_done_callback(_close_loser)
+                raise requests.exceptions.ConnectionError("下载已停止，放弃等待响应")
+            done, pending = wait(
+                pending, timeout=self.STOP_POLL_INTERVAL, return_when=FIRST_COMPLETED
+            )
+            winner = None
+            for future in done:
+                if future.exception() is not None:
+                    last_error = future.exception()
+                elif winner is None:
+                    winner = future
+                else:
+                    _close_loser(future)
+            if winner is not None:
+                for future in pending:
+                    future.add_done_callback(_close_loser)
+                if winner is not primary:
+                    with self._lock:
+                        self.hedge_wins += 1
+                self._record(time.monotonic() - start)
+                return winner.result()
+        raise last_error
+
+    def close(self) -> None:
+        """关闭对冲请求的线程池，未开始的请求被取消；之后的对冲请求会重新创建线程池。"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.POOL_WORKERS, thread_name_prefix="qzone-hedge"
+                )
+            return self._pool
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.requests * self.max_ratio:
+                return False
+            self.hedged += 1
+            return True
+
+    def _record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+
+def abort_response(response: requests.Response) -> None:
+    """
+    从其他线程中断响应体的读取：shutdown 底层 socket，阻塞在读取上的线程随即出错或
+    读到 EOF 返回（仅 close 不会唤醒它）。响应仍由读取线程负责关闭。
+    """
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class ActiveTransfers:
+    """
+    正在读取响应体的下载连接。
+
+    停止时 abort_all() 中断所有登记的连接，下载线程不必等到当前文件传完或读超时；
+    此后 aborted 为 True，新登记的连接也会立即被中断，直到下一次运行前 reset()。
+    被中断的读取可能看起来"正常结束"，读取方必须在使用数据前检查停止标志。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses: set[requests.Response] = set()
+        self.aborted = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.aborted = False
+
+    def add(self, response: requests.Response) -> None:
+        with self._lock:
+            self._responses.add(response)
+            aborted = self.aborted
+        if aborted:
+            abort_response(response)
+
+    def discard(self, response: requests.Response) -> None:
+        with self._lock:
+            self._responses.discard(response)
+
+    def abort_all(self) -> int:
+        """中断所有进行中的传输，返回被中断的连接数。"""
+        with self._lock:
+            self.aborted = True
+            responses = list(self._responses)
+        for response in responses:
+            abort_response(response)
+        return len(responses)
+
+
+class HostCookiePolicy:
+    """
+    按 CDN 主机学习下载时是否需要携带 cookies。
+
+    对每个主机分别统计“携带 cookies”与“不带 cookies”两种请求的成功/失败次数，
+    之后的请求直接使用成功率更高的方式；已确认无效的方式不再作为回退，
+    使每次失败只消耗一次请求。统计结果保存在下载目录下，跨运行复用。
+    """
+
+    FILE_NAME = ".host_cookie_policy.json"
+    MAX_SAMPLES = 200     # 单个主机单种方式的样本上限，超过后减半以适应策略变化
+    KNOWN_BAD_MIN = 3     # 失败次数至少达到该值且无成功记录时，视为该方式不可用
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = {}
+        self._dirty = False
+        self._forward = None
+
+    @classmethod
+    def load(cls, path: str) -> "HostCookiePolicy":
+        policy = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                policy._stats = {
+                    host: {k: int(v) for k, v in stats.items()}
+                    for host, stats in data.items()
+                    if isinstance(stats, dict)
+                }
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取主机 cookie 策略 {path} 失败，将重新学习: {e}")
+        return policy
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._stats, ensure_ascii=False, indent=2)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存主机 cookie 策略 {self.path} 失败: {e}")
+
+    def forward_to(self, func) -> None:
+        """多进程下载的子进程中调用：每次 record 的参数同时交给 func，由主进程统一记录与保存。"""
+        self._forward = func
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urllib.parse.urlsplit(url).hostname or ""
+
+    def _score(self, stats: dict, variant: str) -> float:
+        ok = stats.get(f"{variant}_ok", 0)
+        fail = stats.get(f"{variant}_fail", 0)
+        return (ok + 1) / (ok + fail + 2)
+
+    def plan(self, url: str) -> list[bool]:
+        """返回本次请求依次尝试的方式列表，True 表示携带 cookies。"""
+        with self._lock:
+            stats = self._stats.get(self._host(url))
+            if not stats:
+                return [True, False]
+            order = [True, False]
+            if self._score(stats, "plain") > self._score(stats, "cookie"):
+                order = [False, True]
+            fallback = "cookie" if order[1] else "plain"
+            if (
+                stats.get(f"{fallback}_fail", 0) >= self.KNOWN_BAD_MIN
+                and stats.get(f"{fallback}_ok", 0) == 0
+            ):
+                order = order[:1]
+            return order
+
+    def record(self, url: str, with_cookies: bool, success: bool) -> None:
+        variant = "cookie" if with_cookies else "plain"
+        key = f"{variant}_{'ok' if success else 'fail'}"
+        with self._lock:
+            stats = self._stats.setdefault(self._host(url), {})
+            stats[key] = stats.get(key, 0) + 1
+            if stats.get(f"{variant}_ok", 0) + stats.get(f"{variant}_fail", 0) > self.MAX_SAMPLES:
+                for k in (f"{variant}_ok", f"{variant}_fail"):
+                    stats[k] = stats.get(k, 0) // 2
+            self._dirty = True
+        if self._forward is not None:
+            self._forward(url, with_cookies, success)
+
+
+def download_photo_network_helper(
+    request_cookies: dict | None,
+    url: str,
+    timeout: float | tuple[float, float],
+    cookie_policy: HostCookiePolicy | None = None,
+    stream: bool = False,
+    headers: dict | None = None,
+) -> requests.Response:
+    """
+    下载照片的辅助函数：按主机 cookie 策略选择首选方式（默认优先携带 cookies），
+    返回 401/403 时再回退到另一种方式（已确认不可用的方式不再尝试）。
+
+    只有 401/403 说明 cookie 的取舍有问题，才计入主机 cookie 策略并触发回退；超时、
+    连接错误与 cookie 无关，直接抛出，由调度器延迟重试，不影响策略统计。
+
+    stream 为 True 时只读取响应头，响应体由调用方读取并负责关闭响应；
+    headers 为附加的请求头（如 Range）。
+
+    Raises:
+        requests.exceptions.RequestException: 网络请求失败时
+    """
+    session = get_download_session()
+    if not request_cookies:
+        variants = [False]
+    elif cookie_policy is not None:
+        variants = cookie_policy.plan(url)
+    else:
+        variants = [True, False]
+
+    response = None
+    for i, with_cookies in enumerate(variants):
+        if i > 0:
+            logger.warning(
+                f"[警告] {'无' if with_cookies else '携带'} cookies 下载被拒绝，"
+                f"尝试{'携带' if with_cookies else '无'} cookies 重试: {response}"
+            )
+            response.close()
+        if with_cookies:
+            response = session.get(
+                url, cookies=request_cookies, timeout=timeout, stream=stream, headers=headers
+            )
+        else:
+            response = session.get(url, timeout=timeout, stream=stream, headers=headers)
+
+        rejected = response.status_code in AUTH_SUSPECT_STATUS_CODES
+        if cookie_policy is not None and request_cookies:
+            cookie_policy.record(url, with_cookies, not rejected)
+        if not rejected:
+            break
+    return response
+
+
+# ---------------------------------------------------------------------------
+# HLS（m3u8）视频下载
+# ---------------------------------------------------------------------------
+
+
+class HlsError(Exception):
+    """播放列表无效或使用了不支持的特性（加密、字节范围分段等），重试也无法成功。"""
+
+
+HlsPlaylist = namedtuple(
+    "HlsPlaylist",
+    [
+        "segments",      # list[str]，媒体分段的绝对 URL，按播放顺序
+        "init_segment",  # str，fMP4 的初始化分段（EXT-X-MAP）URL，TS 分段时为 ""
+        "variants",      # list[tuple[int, str]]，主播放列表中的 (带宽, URL)
+    ],
+)
+
+_HLS_ATTR_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def is_hls_url(url: str) -> bool:
+    return urllib.parse.urlsplit(url).path.lower().endswith(".m3u8")
+
+
+def _hls_attributes(line: str) -> dict[str, str]:
+    _, _, attrs = line.partition(":")
+    return {key: value.strip('"') for key, value in _HLS_ATTR_PATTERN.findall(attrs)}
+
+
+def parse_m3u8(text: str, base_url: str) -> HlsPlaylist:
+    """
+    解析 m3u8 播放列表（主播放列表或媒体播放列表），相对地址按 base_url 解析。
+
+    Raises:
+        HlsError: 不是 m3u8，或使用了加密 / 字节范围分段
+    """
+    lines = [line.strip() for line in text.lstrip("\ufeff").splitlines()]
+    if not lines or lines[0] != "#EXTM3U":
+        raise HlsError("不是有效的 m3u8 播放列表")
+
+    segments: list[str] = []
+    variants: list[tuple[int, str]] = []
+    init_segment = ""
+    pending_bandwidth = None
+    for line in lines[1:]:
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF"):
+            pending_bandwidth = _safe_int(_hls_attributes(line).get("BANDWIDTH"))
+        elif line.startswith("#EXT-X-KEY"):
+            if _hls_attributes(line).get("METHOD", "NONE") != "NONE":
+                raise HlsError("不支持加密的 HLS 视频")
+        elif line.startswith("#EXT-X-MAP"):
+            attrs = _hls_attributes(line)
+            if "BYTERANGE" in attrs:
+                raise HlsError("不支持按字节范围划分的 HLS 分段")
+            init_segment = urllib.parse.urljoin(base_url, attrs.get("URI", ""))
+        elif line.startswith("#EXT-X-BYTERANGE"):
+            raise HlsError("不支持按字节范围划分的 HLS 分段")
+        elif not line.startswith("#"):
+            uri = urllib.parse.urljoin(base_url, line)
+            if pending_bandwidth is not None:
+                variants.append((pending_bandwidth, uri))
+                pending_bandwidth = None
+            else:
+                segments.append(uri)
+    return HlsPlaylist(segments, init_segment, variants)
+
+
+def fetch_hls_playlist(
+    request_cookies: dict | None,
+    url: str,
+    timeout: float | tuple[float, float],
+    cookie_policy: HostCookiePolicy | None = None,
+) -> HlsPlaylist:
+    """获取并解析播放列表；主播放列表时选择带宽最高的码流。"""
+    for _ in range(2):
+        response = download_photo_network_helper(request_cookies, url, timeout, cookie_policy)
+        response.raise_for_status()
+        playlist = parse_m3u8(response.text, response.url or url)
+        if not playlist.variants:
+            break
+        url = max(playlist.variants)[1]
+    else:
+        raise HlsError("主播放列表嵌套过深")
+    if not playlist.segments:
+        raise HlsError("播放列表中没有媒体分段")
+    return playlist
+
+
+def _download_hls_segment(
+    request_cookies: dict | None,
+    url: str,
+    path: str,
+    timeout: float | tuple[float, float],
+    cookie_policy: HostCookiePolicy | None,
+    attempts: int,
+    is_stopped_func,
+    transfers: ActiveTransfers | None = None,
+) -> None:
+    """
+    下载单个分段到 path。数据先写入 path + ".part"，中断后从已有长度继续（Range 请求，
+    服务器不支持时重新下载）；长度校验通过后才重命名为 path。收到停止请求时直接返回。
+    """
+    part_path = path + ".part"
+    last_error: Exception | None = None
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(compute_retry_delay(attempt))
+        if is_stopped_func():
+            return
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        response = None
+        try:
+            response = download_photo_network_helper(
+                request_cookies, url, timeout, cookie_policy, stream=True, headers=headers
+            )
+            if transfers is not None:
+                transfers.add(response)
+            with response:
+                if offset and response.status_code == 416:
+                    # 已有部分即为完整分段
+                    os.replace(part_path, path)
+                    return
+                response.raise_for_status()
+                resumed = offset and response.status_code == 206
+                expected = _safe_int(response.headers.get("Content-Length"))
+                if response.headers.get("Content-Encoding"):
+                    expected = 0
+                written = 0
+                with open(part_path, "ab" if resumed else "wb") as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        if is_stopped_func():
+                            break
+                        f.write(chunk)
+                        written += len(chunk)
+            if is_stopped_func():
+                # 已写入的部分保留在 .part 中，下次从断点继续
+                return
+            if expected and written != expected:
+                raise ConnectionError(f"分段不完整: 收到 {written} 字节，应为 {expected} 字节")
+            os.replace(part_path, path)
+            return
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else 0
+            if status_code not in RETRYABLE_STATUS_CODES:
+                raise
+            last_error = e
+        except (requests.exceptions.RequestException, ConnectionError) as e:
+            last_error = e
+        finally:
+            if transfers is not None and response is not None:
+                transfers.discard(response)
+    raise ConnectionError(f"HLS 分段 {url} 下载失败: {last_error}") from last_error
+
+
+def download_hls_video(
+    request_cookies: dict | None,
+    playlist: HlsPlaylist,
+    work_dir: str,
+    output_path: str,
+    timeout: float | tuple[float, float],
+    cookie_policy: HostCookiePolicy | None = None,
+    is_stopped_func=None,
+    transfers: ActiveTransfers | None = None,
+) -> tuple[int, str] | None:
+    """
+    并发下载 HLS 分段并按顺序拼接为 output_path，返回 (文件大小, SHA-256)。
+
+    分段保存在 work_dir 中，已完成的分段在重试或下次运行时直接复用，拼接完成后删除；
+    拼接逐段流式复制，不会把整个视频读入内存。收到停止请求时返回 None（保留已下载分段）。
+
+    Raises:
+        ConnectionError / requests.exceptions.HTTPError: 分段下载失败
+    """
+    urls = ([playlist.init_segment] if playlist.init_segment else []) + playlist.segments
+    os.makedirs(work_dir, exist_ok=True)
+    # 播放列表变化时旧分段无法复用
+    manifest_path = os.path.join(work_dir, "playlist.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            reusable = json.load(f) == urls
+    except (OSError, ValueError):
+        reusable = False
+    if not reusable:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir, exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(urls, f)
+
+    segment_paths = [os.path.join(work_dir, f"{i:05d}.seg") for i in range(len(urls))]
+    pending = [i for i, path in enumerate(segment_paths) if not os.path.exists(path)]
+    is_stopped_func = is_stopped_func or (lambda: False)
+    attempts = max(int(APP_CONFIG.get("max_attempts", 3)), 1)
+
+    def _fetch(index: int) -> None:
+        if not is_stopped_func():
+            _download_hls_segment(
+                request_cookies,
+                urls[index],
+                segment_paths[index],
+                timeout,
+                cookie_policy,
+                attempts,
+                is_stopped_func,
+                transfers,
+            )
+
+    workers = max(1, int(APP_CONFIG.get("hls_segment_workers", 4)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qzone-hls") as pool:
+        futures = [pool.submit(_fetch, index) for index in pending]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    if is_stopped_func():
+        return None
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(output_path, "wb") as out:
+        for path in segment_paths:
+            with open(path, "rb") as segment:
+                while True:
+                    chunk = segment.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return size, digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# 多连接分段下载
+# ---------------------------------------------------------------------------
+
+
+def should_download_ranged(response: requests.Response) -> bool:
+    """服务器支持 Range 且文件不小于 ranged_download_min_mb 时，改用多连接分段下载。"""
+    connections = int(APP_CONFIG.get("ranged_download_connections", 4))
+    min_size = float(APP_CONFIG.get("ranged_download_min_mb", 16)) * 1024 * 1024
+    headers = response.headers
+    return (
+        connections > 1
+        and headers.get("Accept-Ranges", "").lower() == "bytes"
+        and not headers.get("Content-Encoding")
+        and _safe_int(headers.get("Content-Length")) >= max(min_size, connections)
+    )
+
+
+def _download_byte_range(
+    request_cookies: dict | None,
+    url: str,
+    path: str,
+    start: int,
+    end: int,
+    timeout: float | tuple[float, float],
+    cookie_policy: HostCookiePolicy | None,
+    attempts: int,
+    is_stopped_func,
+    transfers: ActiveTransfers | None = None,
+) -> bool:
+    """
+    下载 [start, end] 字节写入 path 的对应位置，失败时从已写入的位置继续重试。
+
+    Returns:
+        bool: 完成为 True，收到停止请求为 False。
+    """
+    position = start
+    last_error: Exception | None = None
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(compute_retry_delay(attempt))
+        if is_stopped_func():
+            return False
+        response = None
+        try:
+            response = download_photo_network_helper(
+                request_cookies,
+                url,
+                timeout,
+                cookie_policy,
+                stream=True,
+                headers={"Range": f"bytes={position}-{end}"},
+            )
+            if transfers is not None:
+                transfers.add(response)
+            with response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise ConnectionError("服务器未按 Range 返回部分内容")
+                with open(path, "r+b") as f:
+                    f.seek(position)
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        chunk = chunk[: end + 1 - position]
+                        f.write(chunk)
+                        position += len(chunk)
+                        if is_stopped_func():
+                            return False
+            if is_stopped_func():
+                return False
+            if position > end:
+                return True
+            raise ConnectionError(f"分段不完整: 已收到 {position - start} / {end + 1 - start} 字节")
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else 0
+            if status_code not in RETRYABLE_STATUS_CODES:
+                raise
+            last_error = e
+        except (requests.exceptions.RequestException, ConnectionError) as e:
+            last_error = e
+        finally:
+            if transfers is not None and response is not None:
+                transfers.discard(response)
+    raise ConnectionError(f"字节范围 {start}-{end} 下载失败: {last_error}") from last_error
+
+
+def download_ranged(
+    request_cookies: dict | None,
+    url: str,
+    total_size: int,
+    output_path: str,
+    timeout: float | tuple[float, float],
+    cookie_policy: HostCookiePolicy | None = None,
+    is_stopped_func=None,
+    transfers: ActiveTransfers | None = None,
+) -> str | None:
+    """
+    把 url 按字节范围分成 ranged_download_connections 段，并发写入预先分配好大小的
+    output_path，返回文件的 SHA-256。每段各自重试，只重新请求未收到的部分。
+    收到停止请求时返回 None。
+
+    Raises:
+        ConnectionError / requests.exceptions.HTTPError: 某一段重试后仍失败
+    """
+    is_stopped_func = is_stopped_func or (lambda: False)
+    connections = max(1, int(APP_CONFIG.get("ranged_download_connections", 4)))
+    attempts = max(int(APP_CONFIG.get("max_attempts", 3)), 1)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.truncate(total_size)
+
+    step = -(-total_size // connections)
+    ranges = [(start, min(start + step, total_size) - 1) for start in range(0, total_size, step)]
+    completed = []
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="qzone-range") as pool:
+            futures = [
+                pool.submit(
+                    _download_byte_range,
+                    request_cookies,
+                    url,
+                    output_path,
+                    start,
+                    end,
+                    timeout,
+                    cookie_policy,
+                    attempts,
+                    is_stopped_func,
+                    transfers,
+                )
+                for start, end in ranges
+            ]
+            try:
+                completed = [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        if not (completed and all(completed)):
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+    if not all(completed):
+        return None
+
+    # 各段乱序写入，完成后顺序读一遍计算校验和
+    digest = hashlib.sha256()
+    with open(output_path, "rb") as f:
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_temp_path(
+    user_qq: str, album_name: str, filename: str, final_path: str, archive
+) -> str:
+    """
+    直接写入文件的下载（HLS、分段下载）所用的临时路径：文件模式下为目标文件旁的 .part，
+    归档模式下（或未给出 final_path 时）位于用户目录的 DOWNLOAD_TMP_DIR 中。
+    """
+    if archive is None and final_path:
+        return final_path + ".part"
+    tmp_name = sanitize_filename_component(f"{album_name.strip()}-{filename}")
+    return os.path.join(get_save_directory(user_qq), DOWNLOAD_TMP_DIR, tmp_name)
+
+
+def _stream_response_to_file(
+    response: requests.Response, path: str, is_stopped_func
+) -> tuple[int, str] | None:
+    """
+    将响应体边读边写入临时文件，同时计算 SHA-256，数据不在内存中累积。
+
+    Returns:
+        tuple[int, str] | None: (写入的字节数, SHA-256)；收到停止请求时删除临时文件并返回 None。
+        读取或写入出错时同样删除临时文件，再抛出原异常。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                if is_stopped_func():
+                    break
+                f.write(chunk)
+                digest.update(chunk)
+                received += len(chunk)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+    # 被中断的读取可能像正常结束一样返回，数据不可用
+    if is_stopped_func():
+        os.remove(path)
+        return None
+    return received, digest.hexdigest()
+
+
+def save_photo_worker(args: PhotoTask) -> WriteJob | str:
+    """
+    工作函数，对单张照片或视频执行一次下载尝试。在线程池中运行。
+
+    重试不在此处进行：可恢复的错误返回 TASK_RETRY，由 DownloadScheduler
+    放入延迟重试队列，使工作线程始终在处理有效的传输。下载成功时返回 WriteJob，
+    落盘由写盘阶段（DiskWriter）完成，磁盘较慢时不会占用网络线程。
+
+    args 元组字段（见 PhotoTask）：
+        request_cookies, user_qq, album_index, album_name, photo_index,
+        photo, log_func, progress_func, is_stopped_func, qzone_manager,
+        album_id, dest_user_qq, attempt, video_url
+
+    Returns:
+        WriteJob: 下载成功，等待写盘；
+        str: 任务结果，TASK_SKIPPED / TASK_FAILED / TASK_STOPPED /
+             TASK_RETRY / TASK_AUTH_RETRY 之一。
+    """
+    (
+        request_cookies,
+        user_qq,
+        album_index,
+        album_name,
+        photo_index,
+        photo,
+        log_func,       # callable(str)，输出日志
+        progress_func,  # 由调度器在任务最终完成时调用，此处不使用
+        is_stopped_func,
+        qzone_manager,
+        album_id,
+        dest_user_qq,
+        attempt,
+        video_url,
+    ) = args
+
+    def _log(msg: str) -> None:
+        task_log(log_func, logging.INFO, msg)
+
+    if is_stopped_func():
+        _log(f"[停止] 照片下载任务已停止，跳过：相册 '{album_name}', 照片 {photo_index + 1}")
+        return TASK_STOPPED
+
+    album_save_path = os.path.join(
+        get_save_directory(user_qq), sanitize_filename_component(album_name.strip())
+    )
+    archive = None
+    if APP_CONFIG.get("output_mode", "files") in ARCHIVE_MODES:
+        # 归档模式下 album_save_path 仅用于校验文件名，实际写入归档
+        archive = qzone_manager.get_album_archive(user_qq, album_name)
+    elif not os.path.exists(album_save_path):
+        try:
+            os.makedirs(album_save_path, exist_ok=True)
+        except OSError as e:
+            _log(f"[错误] 无法创建目录 {album_save_path}: {e}")
+            return TASK_FAILED
+
+    def _already_saved(filename: str, path: str) -> bool:
+        if archive is not None:
+            return archive.contains(filename)
+        if not os.path.exists(path):
+            return False
+        manifest = qzone_manager.manifest
+        if manifest is not None and not manifest.is_intact(path):
+            _log(f"[文件不完整] {path} 与清单记录的大小不符，重新下载")
+            return False
+        return True
+
+    def _log_exists(kind: str) -> None:
+        task_log(
+            log_func,
+            logging.DEBUG,
+            "[本地已存在] 相册 '%s', %s %d ('%s')",
+            album_name,
+            kind,
+            photo_index + 1,
+            photo.name,
+        )
+
+    conditional = None  # 刷新已保存的文件时使用的条件请求头
+
+    def _keep_existing(filename: str, path: str, kind: str) -> bool:
+        """
+        文件已保存且不需刷新时返回 True。刷新模式下清单记录了 ETag / Last-Modified 的文件
+        改为发送条件请求，返回 False，远端未变化时由 304 响应跳过。
+        """
+        nonlocal conditional
+        if not _already_saved(filename, path):
+            return False
+        manifest = qzone_manager.manifest
+        if qzone_manager.refresh_existing and archive is None and manifest is not None:
+            conditional = manifest.conditional_headers(path)
+        if conditional is None:
+            _log_exists(kind)
+            return True
+        return False
+
+    base_filename = photo_base_filename(photo_index, photo)
+
+    download_url = photo.url
+    file_extension = ".jpeg"
+
+    if photo.is_video:
+        if video_url is None:
+            task_log(
+                log_func, logging.DEBUG, "[检测到视频] 正在获取真实视频下载链接: '%s'", photo.name
+            )
+            video_url = qzone_manager.get_video_download_url(dest_user_qq, album_id, photo.pic_key)
+            if not video_url and qzone_manager.is_stopped():
+                return TASK_STOPPED
+
+        if video_url:
+            download_url = video_url
+            file_extension = ".mp4"
+            final_filename = f"{base_filename}{file_extension}"
+            full_photo_path = os.path.join(album_save_path, final_filename)
+
+            if not is_path_valid(full_photo_path):
+                _log(f"[警告] 原始视频文件名无效: {final_filename}。将使用随机名称。")
+                final_filename = f"random_name_{album_index}_{photo_index}{file_extension}"
+                full_photo_path = os.path.join(album_save_path, final_filename)
+                if not is_path_valid(full_photo_path):
+                    _log(f"[错误] 备用视频文件名也无效，跳过视频: {photo.url}")
+                    return TASK_FAILED
+
+            if _keep_existing(final_filename, full_photo_path, "视频"):
+                return TASK_SKIPPED
+
+            task_log(log_func, logging.DEBUG, "[成功] 获取到视频 %s 下载链接", base_filename)
+        else:
+            _log(f"[失败] 无法获取视频 {base_filename} 下载链接，将下载视频封面图代替")
+            base_filename = f"{base_filename}{VIDEO_COVER_SUFFIX}"
+            final_filename = ""
+            full_photo_path = ""
+    else:
+        final_filename = ""
+        full_photo_path = ""
+        # 图片扩展名要下载后才能确定，先按所有可能的扩展名检查，已存在时不必下载
+        for ext in IMAGE_EXTENSIONS:
+            filename = base_filename + ext
+            path = os.path.join(album_save_path, filename)
+            if _keep_existing(filename, path, "照片"):
+                return TASK_SKIPPED
+            if conditional is not None:
+                # 刷新时沿用已保存的文件名
+                final_filename, full_photo_path = filename, path
+                break
+
+    url = download_url.replace("\\", "")
+    timeout = get_download_timeout()
+
+    breaker = qzone_manager.auth_breaker
+    if not breaker.wait_if_open():
+        return TASK_STOPPED
+    auth_generation = breaker.generation
+    # 登录态可能在运行中被刷新，始终使用管理器当前的 cookie
+    request_cookies = qzone_manager.cookies or request_cookies
+
+    download_type = "视频" if photo.is_video and file_extension == ".mp4" else "照片"
+    task_log(
+        log_func,
+        logging.DEBUG,
+        "[开始下载] 相册 '%s', %s %d ('%s')%s",
+        album_name,
+        download_type,
+        photo_index + 1,
+        photo.name,
+        f"，第 {attempt + 1} 次尝试" if attempt else "",
+    )
+
+    budget = qzone_manager.byte_budget
+    reserved = 0
+    try:
+        if photo.is_video and file_extension == ".mp4" and is_hls_url(url):
+            # HLS 视频：分段并发下载到临时目录后拼接，不经过内存预算
+            playlist = fetch_hls_playlist(
+                request_cookies, url, timeout, qzone_manager.host_cookie_policy
+            )
+            if not playlist.init_segment:
+                final_filename = f"{os.path.splitext(final_filename)[0]}.ts"
+                full_photo_path = os.path.join(album_save_path, final_filename)
+                if _keep_existing(final_filename, full_photo_path, "视频"):
+                    return TASK_SKIPPED
+            output_path = _download_temp_path(
+                user_qq, album_name, final_filename, full_photo_path, archive
+            )
+            result = download_hls_video(
+                request_cookies,
+                playlist,
+                _download_temp_path(user_qq, album_name, final_filename, "", archive) + ".hls",
+                output_path,
+                timeout,
+                qzone_manager.host_cookie_policy,
+                is_stopped_func,
+                qzone_manager.transfers,
+            )
+            if result is None:
+                return TASK_STOPPED
+            return WriteJob(
+                task=args,
+                content=b"",
+                filename=final_filename,
+                path=full_photo_path,
+                archive=archive,
+                sha256=result[1],
+                temp_path=output_path,
+            )
+
+        transfers = qzone_manager.transfers
+        response = qzone_manager.hedger.fetch(
+            lambda: download_photo_network_helper(
+                request_cookies,
+                url,
+                timeout,
+                qzone_manager.host_cookie_policy,
+                stream=True,
+                headers=conditional,
+            ),
+            is_stopped_func,
+            transfers,
+        )
+        transfers.add(response)
+        try:
+            if conditional is not None and response.status_code == 304:
+                task_log(
+                    log_func,
+                    logging.DEBUG,
+                    "[未变化] 相册 '%s', 照片 %d ('%s')",
+                    album_name,
+                    photo_index + 1,
+                    photo.name,
+                )
+                return TASK_SKIPPED
+            response.raise_for_status()
+            etag = response.headers.get("ETag", "")
+            last_modified = response.headers.get("Last-Modified", "")
+            if photo.is_video and file_extension == ".mp4" and should_download_ranged(response):
+                # 大视频改为多连接分段下载，直接写入临时文件
+                total_size = _safe_int(response.headers.get("Content-Length"))
+                response.close()
+                output_path = _download_temp_path(
+                    user_qq, album_name, final_filename, full_photo_path, archive
+                )
+                sha256 = download_ranged(
+                    request_cookies,
+                    url,
+                    total_size,
+                    output_path,
+                    timeout,
+                    qzone_manager.host_cookie_policy,
+                    is_stopped_func,
+                    transfers,
+                )
+                if sha256 is None:
+                    return TASK_STOPPED
+                return WriteJob(
+                    task=args,
+                    content=b"",
+                    filename=final_filename,
+                    path=full_photo_path,
+                    archive=archive,
+                    sha256=sha256,
+                    temp_path=output_path,
+                    etag=etag,
+                    last_modified=last_modified,
+                )
+            expected_length = _safe_int(response.headers.get("Content-Length"))
+            # 压缩传输时 Content-Length 为压缩后的大小，无法与解码后的长度比较
+            check_length = expected_length > 0 and not response.headers.get("Content-Encoding")
+            if photo.is_video and file_extension == ".mp4":
+                # 视频不写 EXIF，直接流式写入临时文件，不经过内存预算
+                output_path = _download_temp_path(
+                    user_qq, album_name, final_filename, full_photo_path, archive
+                )
+                streamed = _stream_response_to_file(response, output_path, is_stopped_func)
+                if streamed is None:
+                    return TASK_STOPPED
+                received, sha256 = streamed
+                if check_length and received != expected_length:
+                    os.remove(output_path)
+                else:
+                    return WriteJob(
+                        task=args,
+                        content=b"",
+                        filename=final_filename,
+                        path=full_photo_path,
+                        archive=archive,
+                        sha256=sha256,
+                        temp_path=output_path,
+                        etag=etag,
+                        last_modified=last_modified,
+                    )
+            else:
+                # 按 Content-Length 预留内存预算，预算不足时在读取响应体前等待
+                reserved = expected_length or UNKNOWN_SIZE_RESERVE
+                if not budget.acquire(reserved, qzone_manager.is_stopped):
+                    reserved = 0
+                    return TASK_STOPPED
+                digest = hashlib.sha256()
+                # 按 Content-Length 预先分配缓冲区，逐块填入，避免先缓存分块再拼接时
+                # 内存峰值达到响应体的两倍；超出部分由切片赋值自动扩展
+                content = bytearray(expected_length)
+                received = 0
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    if is_stopped_func():
+                        break
+                    content[received:received + len(chunk)] = chunk
+                    digest.update(chunk)
+                    received += len(chunk)
+                    if received > reserved:
+                        budget.grow(received - reserved)
+                        reserved = received
+                # 被中断的读取可能像正常结束一样返回，数据不可用
+                if is_stopped_func():
+                    return TASK_STOPPED
+                del content[received:]
+        finally:
+            transfers.discard(response)
+            response.close()
+
+        if check_length and received != expected_length:
+            _log(
+                f"[数据不完整] 相册 '{album_name}', 照片 {photo_index + 1}: "
+                f"收到 {received} 字节，应为 {expected_length} 字节，稍后重试。"
+            )
+            return TASK_RETRY
+
+        if not (photo.is_video and file_extension == ".mp4") and conditional is None:
+            file_extension = _detect_image_extension(content)
+            final_filename = f"{base_filename}{file_extension}"
+            full_photo_path = os.path.join(album_save_path, final_filename)
+
+            if not is_path_valid(full_photo_path):
+                _log(f"[警告] 原始文件名无效: {final_filename}。将使用随机名称。")
+                final_filename = f"random_name_{album_index}_{photo_index}{file_extension}"
+                full_photo_path = os.path.join(album_save_path, final_filename)
+                if not is_path_valid(full_photo_path):
+                    _log(f"[错误] 备用文件名也无效，跳过照片: {photo.url}")
+                    return TASK_FAILED
+
+            if _already_saved(final_filename, full_photo_path):
+                _log_exists("照片")
+                return TASK_SKIPPED
+
+        # 重命名、EXIF 与 mtime 由写盘阶段完成，网络线程直接返回继续下载
+        job = WriteJob(
+            task=args,
+            content=content,
+            filename=final_filename,
+            path=full_photo_path,
+            archive=archive,
+            sha256=digest.hexdigest(),
+            budget=budget,
+            reserved=reserved,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        reserved = 0  # 预留随写盘任务转交，写盘完成后归还
+        return job
+
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else 0
+        if is_auth_failure(status_code):
+            auth_result = breaker.report_failure(auth_generation)
+            if auth_result == AUTH_RENEWED:
+                _log(f"[认证] 登录态已刷新，重新下载: 相册 '{album_name}', 照片 {photo_index + 1}")
+                return TASK_AUTH_RETRY
+            if auth_result == AUTH_BROKEN:
+                return TASK_STOPPED
+            if auth_result == AUTH_UNKNOWN:
+                _log(
+                    f"[认证] 暂时无法确认登录态，稍后重试: 相册 '{album_name}', "
+                    f"照片 {photo_index + 1}"
+                )
+                return TASK_RETRY
+            # AUTH_VALID：登录态正常，按普通 HTTP 错误处理
+        if status_code in RETRYABLE_STATUS_CODES:
+            _log(
+                f"[HTTP 错误] 下载 {url} 暂时失败 (相册 '{album_name}', 照片 {photo_index + 1})。"
+                f"状态码: {status_code}。稍后重试。"
+            )
+            return TASK_RETRY
+        _log(
+            f"[HTTP 错误] 下载 {url} 失败 (相册 '{album_name}', 照片 {photo_index + 1})。"
+            f"状态码: {status_code}。中止下载此照片。"
+        )
+        return TASK_FAILED
+    except HlsError as e:
+        _log(f"[HLS 错误] 相册 '{album_name}', 视频 {photo_index + 1} ('{photo.name}'): {e}")
+        return TASK_FAILED
+    except Exception as e:
+        if is_stopped_func():
+            # 停止时传输被主动中断，不是下载错误
+            return TASK_STOPPED
+        # 超时、连接错误以及其他意外错误都交给调度器延迟重试
+        _log(
+            f"[下载出错] 相册 '{album_name}', 照片 {photo_index + 1} "
+            f"第 {attempt + 1} 次尝试失败，稍后重试。错误: {e}"
+        )
+        return TASK_RETRY
+    finally:
+        if reserved:
+            budget.release(reserved)
+
+
+def resolve_video_worker(task: PhotoTask) -> PhotoTask | str:
+    """
+    视频解析通道的工作函数：获取视频的真实下载地址。
+
+    本地已存在 .mp4/.ts 时直接返回 TASK_SKIPPED，省去解析 API 调用；否则返回填充了
+    video_url 的新任务（解析失败时为 ""，随后改为下载视频封面图）。
+    """
+    photo = task.photo
+    qzone_manager = task.qzone_manager
+    if task.is_stopped_func():
+        return TASK_STOPPED
+
+    base_filename = photo_base_filename(task.photo_index, photo)
+    if APP_CONFIG.get("output_mode", "files") in ARCHIVE_MODES:
+        archive = qzone_manager.get_album_archive(task.user_qq, task.album_name)
+        exists = any(archive.contains(base_filename + ext) for ext in VIDEO_EXTENSIONS)
+    else:
+        album_save_path = os.path.join(
+            get_save_directory(task.user_qq), sanitize_filename_component(task.album_name.strip())
+        )
+        manifest = qzone_manager.manifest
+        exists = False
+        for ext in VIDEO_EXTENSIONS:
+            video_path = os.path.join(album_save_path, base_filename + ext)
+            if os.path.exists(video_path) and (manifest is None or manifest.is_intact(video_path)):
+                # 刷新模式下记录了校验信息的视频仍需解析地址，以便发送条件请求
+                exists = not (
+                    qzone_manager.refresh_existing
+                    and manifest is not None
+                    and manifest.conditional_headers(video_path)
+                )
+                break
+    if exists:
+        task_log(
+            task.log_func,
+            logging.DEBUG,
+            "[本地已存在] 相册 '%s', 视频 %d ('%s')",
+            task.album_name,
+            task.photo_index + 1,
+            photo.name,
+        )
+        return TASK_SKIPPED
+
+    task_log(
+        task.log_func, logging.DEBUG, "[检测到视频] 正在获取真实视频下载链接: '%s'", photo.name
+    )
+    video_url = qzone_manager.get_video_download_url(
+        task.dest_user_qq, task.album_id, photo.pic_key
+    )
+    if not video_url and qzone_manager.is_stopped():
+        return TASK_STOPPED
+    return task._replace(video_url=video_url or "")
+
+
+# ---------------------------------------------------------------------------
+# 任务日志（journal）
+# ---------------------------------------------------------------------------
+
+
+def photo_task_key(album_id: str, photo: QzonePhoto) -> str:
+    """生成照片任务在 journal 中的唯一键（相册 ID + pic_key，缺失时退化为 URL）。"""
+    return f"{album_id}/{photo.pic_key or photo.url}"
+
+
+def _ends_with_newline(path: str) -> bool:
+    """文件以换行结尾（或为空、不存在）时返回 True；用于判断追加写入的最后一行是否完整。"""
+    try:
+        with open(path, "rb") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    except OSError:
+        return True
+
+
+JournalState = namedtuple(
+    "JournalState",
+    [
+        "albums",    # list[QzoneAlbum] | None，None 表示尚未记录相册列表
+        "photos",    # dict[album_uid, list[QzonePhoto]]
+        "outcomes",  # dict[task_key, str]，每个任务最近一次的结果
+        "complete",  # bool，上次运行是否已完整结束
+    ],
+)
+
+
+class DownloadJournal:
+    """
+    追加写入的 JSONL 任务日志，用于进程崩溃后不重新列举即可续传。
+
+    每行一条记录：
+        {"type": "albums", "albums": [...]}
+        {"type": "photos", "album_uid": ..., "photos": [...]}
+        {"type": "task", "key": ..., "outcome": ...}
+        {"type": "complete"}
+        {"type": "reopen"}   # verify 重新排队了部分任务，撤销之前的 complete
+    每条记录写入后立即 flush，进程崩溃最多丢失最后一条未写完的记录（读取时忽略）。
+    """
+
+    FILE_NAME = ".qzone_journal.jsonl"
+    FSYNC_INTERVAL = 5.0  # 秒，任务结果记录的 fsync 间隔
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._forward = None
+        self._last_fsync = 0.0
+
+    @classmethod
+    def for_user(cls, dest_user_qq: str) -> "DownloadJournal":
+        return cls(os.path.join(get_save_directory(dest_user_qq), cls.FILE_NAME))
+
+    def load(self) -> JournalState:
+        """读取现有日志并重建状态；文件不存在时返回空状态。"""
+        albums = None
+        photos: dict[str, list[QzonePhoto]] = {}
+        outcomes: dict[str, str] = {}
+        complete = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    kind = record.get("type")
+                    if kind == "albums":
+                        albums = [QzoneAlbum(**a) for a in record["albums"]]
+                    elif kind == "photos":
+                        photos[record["album_uid"]] = [
+                            QzonePhoto(**p) for p in record["photos"]
+                        ]
+                    elif kind == "task":
+                        outcomes[record["key"]] = record["outcome"]
+                    elif kind == "complete":
+                        complete = True
+                    elif kind == "reopen":
+                        complete = False
+        except FileNotFoundError:
+            pass
+        return JournalState(albums, photos, outcomes, complete)
+
+    def open(self, truncate: bool = False) -> None:
+        """打开日志以追加记录；truncate=True 时清空旧日志。"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            torn = not truncate and not _ends_with_newline(self.path)
+            self._file = open(self.path, "w" if truncate else "a", encoding="utf-8")
+            if torn:
+                # 上次运行在写入最后一条记录时中断，新记录须从新的一行开始
+                self._file.write("\n")
+
+    def forward_to(self, func) -> None:
+        """
+        多进程下载的子进程中调用：不打开日志文件，把每条记录交给 func（经事件队列
+        发给主进程）。日志只由主进程写入，避免多个进程的缓冲写入交错成损坏的行。
+        """
+        self._forward = func
+
+    def apply(self, record: dict) -> None:
+        """写入子进程转发来的记录；任务结果以外的记录立即 fsync，与直接写入时一致。"""
+        self._append(record, fsync=record.get("type") != "task")
+
+    def _append(self, record: dict, fsync: bool = False) -> None:
+        if self._forward is not None:
+            self._forward(record)
+            return
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            now = time.monotonic()
+            if fsync or now - self._last_fsync >= self.FSYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+    def record_albums(self, albums: list[QzoneAlbum]) -> None:
+        self._append({"type": "albums", "albums": [a._asdict() for a in albums]}, fsync=True)
+
+    def record_photos(self, album: QzoneAlbum, photos: list[QzonePhoto]) -> None:
+        self._append(
+            {
+                "type": "photos",
+                "album_uid": album.uid,
+                "photos": [p._asdict() for p in photos],
+            },
+            fsync=True,
+        )
+
+    def record_outcome(self, task_key: str, outcome: str) -> None:
+        self._append({"type": "task", "key": task_key, "outcome": outcome})
+
+    def mark_complete(self) -> None:
+        self._append({"type": "complete"}, fsync=True)
+
+    def sync(self) -> None:
+        """立即把已写入的记录刷到磁盘。"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+
+    def requeue(self, task_keys: list[str]) -> None:
+        """将指定任务重新标记为失败，使下次续传时重新下载；日志不存在时无需处理。"""
+        if not task_keys or not os.path.exists(self.path):
+            return
+        self.open()
+        try:
+            for key in task_keys:
+                self.record_outcome(key, TASK_FAILED)
+            self._append({"type": "reopen"}, fsync=True)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+# ---------------------------------------------------------------------------
+# 文件清单与完整性校验
+# ---------------------------------------------------------------------------
+
+
+class DownloadManifest:
+    """
+    每个用户的已下载文件清单（JSONL，追加写入），记录文件的大小与 SHA-256。
+
+    每行一条记录，同一路径以最后一条为准：
+        {"type": "file", "path": 相对用户目录的路径, "size": ..., "sha256": ...,
+         "key": 任务键, "album_id": ..., "pic_key": ..., "url": ...,
+         "etag": ..., "last_modified": ...}   # 后两项仅在服务器返回时记录
+        {"type": "remove", "path": ...}
+    仅在 output_mode 为 files 时使用；归档模式由归档旁的索引文件记录。
+    """
+
+    FILE_NAME = ".qzone_manifest.jsonl"
+    FSYNC_INTERVAL = 5.0  # 秒
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, self.FILE_NAME)
+        self.entries: dict[str, dict] = {}
+        self._line_count = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._forward = None
+        self._last_fsync = 0.0
+
+    @classmethod
+    def for_user(cls, dest_user_qq: str) -> "DownloadManifest":
+        return cls(get_save_directory(dest_user_qq))
+
+    def load(self) -> dict[str, dict]:
+        """读取清单，返回 {相对路径: 记录}；文件不存在时返回空字典。"""
+        entries: dict[str, dict] = {}
+        lines = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    kind = record.pop("type", None)
+                    if kind == "file":
+                        entries[record["path"]] = record
+                    elif kind == "remove":
+                        entries.pop(record.get("path"), None)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.entries = entries
+        self._line_count = lines
+        return entries
+
+    def open(self, compact: bool = True) -> None:
+        """
+        加载现有清单并打开以追加记录；compact 为 True 且冗余记录过多时先压缩重写。
+
+        多个进程共享同一清单时只能由一个进程压缩，其余进程以追加方式写入。
+        """
+        os.makedirs(self.root, exist_ok=True)
+        self.load()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            if compact and self._line_count > 2 * len(self.entries) + 100:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for entry in self.entries.values():
+                        f.write(json.dumps({"type": "file", **entry}, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.path)
+            torn = not _ends_with_newline(self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if torn:
+                # 上次写入中断留下了不完整的最后一行，新记录从下一行开始
+                self._file.write("\n")
+
+    def relpath(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def get(self, path: str) -> dict | None:
+        with self._lock:
+            return self.entries.get(self.relpath(path))
+
+    def is_intact(self, path: str) -> bool:
+        """文件存在且大小与清单记录一致（清单中没有记录的旧文件视为完好）。"""
+        entry = self.get(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        return entry is None or entry.get("size") == size
+
+    def forward_to(self, func) -> None:
+        """
+        多进程下载的子进程中调用：只在内存中更新记录，写入的记录交给 func 由主进程
+        追加到清单文件。调用前应先 load()，以便判断已有文件是否完好。
+        """
+        self._forward = func
+
+    def apply(self, record: dict) -> None:
+        """写入子进程转发来的记录，并同步更新内存中的清单。"""
+        with self._lock:
+            if record.get("type") == "file":
+                entry = dict(record)
+                del entry["type"]
+                self.entries[entry["path"]] = entry
+            elif record.get("type") == "remove":
+                self.entries.pop(record.get("path"), None)
+            self._append(record)
+
+    def _append(self, record: dict) -> None:
+        # 调用方需持有锁
+        if self._forward is not None:
+            self._forward(record)
+            return
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        now = time.monotonic()
+        if now - self._last_fsync >= self.FSYNC_INTERVAL:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    def record_file(
+        self,
+        path: str,
+        size: int,
+        sha256: str,
+        task_key: str,
+        photo: QzonePhoto,
+        album_id: str,
+        etag: str = "",
+        last_modified: str = "",
+    ) -> None:
+        entry = {
+            "path": self.relpath(path),
+            "size": size,
+            "sha256": sha256,
+            "key": task_key,
+            "album_id": album_id,
+            "pic_key": photo.pic_key,
+            "url": photo.url,
+        }
+        # 服务器返回的校验信息，刷新时用于条件请求
+        if etag:
+            entry["etag"] = etag
+        if last_modified:
+            entry["last_modified"] = last_modified
+        with self._lock:
+            self.entries[entry["path"]] = entry
+            self._append({"type": "file", **entry})
+
+    def sync(self) -> None:
+        """立即把已写入的记录刷到磁盘。"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+
+    def conditional_headers(self, path: str) -> dict | None:
+        """按记录的 ETag / Last-Modified 生成条件请求头；没有记录时返回 None。"""
+        entry = self.get(path)
+        if entry is None:
+            return None
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers or None
+
+    def rename(self, old_path: str, new_path: str) -> None:
+        """文件改名后把记录移到新路径；旧路径没有记录时忽略。"""
+        old_rel, new_rel = self.relpath(old_path), self.relpath(new_path)
+        with self._lock:
+            entry = self.entries.pop(old_rel, None)
+            if entry is None:
+                return
+            entry = {**entry, "path": new_rel}
+            self.entries[new_rel] = entry
+            self._append({"type": "remove", "path": old_rel})
+            self._append({"type": "file", **entry})
+
+    def remove(self, path: str) -> None:
+        rel = self.relpath(path)
+        with self._lock:
+            self.entries.pop(rel, None)
+            self._append({"type": "remove", "path": rel})
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+VERIFY_CHUNK_SIZE = 1024 * 1024
+DAMAGED_SUFFIX = ".damaged"
+
+
+def hash_file(path: str) -> tuple[int, str] | None:
+    """返回文件的 (大小, SHA-256)；文件不存在或无法读取时返回 None。"""
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(VERIFY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+    except OSError:
+        return None
+    return size, digest.hexdigest()
+
+
+def verify_user_library(dest_user_qq: str, workers: int | None = None, log_func=None) -> dict:
+    """
+    按清单重新计算用户已下载文件的 SHA-256（多进程并行），找出缺失或损坏的文件。
+
+    损坏的文件重命名为 <原文件名>.damaged 保留备查，缺失与损坏的文件从清单中移除，
+    并在任务日志中重新标记为未完成，随后以 --resume 运行即可只重新下载这些文件。
+
+    Returns:
+        dict: {"checked", "ok", "missing", "damaged"} 各类文件数量。
+    """
+
+    def _log(msg: str) -> None:
+        if log_func:
+            log_func(msg)
+        logger.info(msg)
+
+    manifest = DownloadManifest.for_user(dest_user_qq)
+    entries = list(manifest.load().values())
+    summary = {"checked": len(entries), "ok": 0, "missing": 0, "damaged": 0}
+    if not entries:
+        _log(f"[校验] 用户 {dest_user_qq} 没有文件清单，跳过。")
+        return summary
+
+    workers = workers or os.cpu_count() or 1
+    paths = [os.path.join(manifest.root, entry["path"]) for entry in entries]
+    _log(f"[校验] 用户 {dest_user_qq}: 使用 {workers} 个进程校验 {len(paths)} 个文件...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(
+            pool.map(hash_file, paths, chunksize=max(1, len(paths) // (workers * 8)))
+        )
+
+    bad_entries = []
+    for entry, path, result in zip(entries, paths, results):
+        if result is None:
+            summary["missing"] += 1
+            _log(f"[校验] 文件缺失: {entry['path']}")
+        elif result != (entry.get("size"), entry.get("sha256")):
+            summary["damaged"] += 1
+            _log(f"[校验] 文件已损坏: {entry['path']}")
+            try:
+                os.replace(path, path + DAMAGED_SUFFIX)
+            except OSError as e:
+                _log(f"[校验] 无法隔离损坏文件 {path}: {e}")
+        else:
+            summary["ok"] += 1
+            continue
+        bad_entries.append((entry, path))
+
+    if bad_entries:
+        manifest.open()
+        try:
+            for _, path in bad_entries:
+                manifest.remove(path)
+        finally:
+            manifest.close()
+        DownloadJournal.for_user(dest_user_qq).requeue(
+            [entry["key"] for entry, _ in bad_entries if entry.get("key")]
+        )
+    return summary
+
+
+def _saved_file_candidates(photo_index: int, photo: QzonePhoto) -> list[str]:
+    """照片在各种命名方式下可能使用的不含扩展名的文件名（去重，保持顺序）。"""
+    bases = [format_photo_base_filename(photo_index, photo, "index")]
+    bases += [
+        format_photo_base_filename(photo_index, photo, "pic_key", prefix)
+        for prefix in FILE_NAME_PREFIXES
+    ]
+    return list(dict.fromkeys(bases))
+
+
+def migrate_file_names(dest_user_qq: str, log_func=None) -> dict:
+    """
+    按当前 file_naming / file_name_prefix 配置就地重命名用户已下载的文件，无需重新下载。
+
+    照片元数据（所属相册、列表中的位置、pic_key、时间等）取自任务日志；
+    已有文件优先按清单中记录的任务键定位，其次按各种命名方式的候选文件名查找。
+    扩展名与视频封面后缀保持不变；目标文件名已被占用时不覆盖，计入 conflicts。
+    仅支持 output_mode 为 files；清单中的路径同步更新。
+
+    Returns:
+        dict: {"renamed", "unchanged", "missing", "conflicts"} 各类照片数量。
+    """
+
+    def _log(msg: str) -> None:
+        if log_func:
+            log_func(msg)
+        logger.info(msg)
+
+    summary = {"renamed": 0, "unchanged": 0, "missing": 0, "conflicts": 0}
+    if APP_CONFIG.get("output_mode", "files") in ARCHIVE_MODES:
+        _log("[重命名] 归档模式下不支持重命名已下载的文件，跳过。")
+        return summary
+    state = DownloadJournal.for_user(dest_user_qq).load()
+    if not state.albums:
+        _log(f"[重命名] 用户 {dest_user_qq} 没有任务日志，无法确定照片信息，跳过。")
+        return summary
+
+    manifest = DownloadManifest.for_user(dest_user_qq)
+    manifest.open()
+    try:
+        paths_by_key = {
+            entry["key"]: os.path.join(manifest.root, entry["path"])
+            for entry in manifest.entries.values()
+            if entry.get("key")
+        }
+        suffixes = set(IMAGE_EXTENSIONS) | set(VIDEO_EXTENSIONS)
+        suffixes |= {VIDEO_COVER_SUFFIX + ext for ext in IMAGE_EXTENSIONS}
+        user_dir = get_save_directory(dest_user_qq)
+        for album in state.albums:
+            album_path = os.path.join(user_dir, sanitize_filename_component(album.name.strip()))
+            for photo_index, photo in enumerate(state.photos.get(album.uid, [])):
+                new_base = photo_base_filename(photo_index, photo)
+                bases = list(dict.fromkeys([new_base] + _saved_file_candidates(photo_index, photo)))
+                old_name = None
+                old_base = None
+                file_dir = album_path
+                recorded = paths_by_key.get(photo_task_key(album.uid, photo))
+                if recorded and os.path.exists(recorded):
+                    name = os.path.basename(recorded)
+                    for base in bases:
+                        if name.startswith(base) and name[len(base):] in suffixes:
+                            # 相册改名后文件仍在原目录中，就地重命名
+                            old_name, old_base = name, base
+                            file_dir = os.path.dirname(recorded)
+                            break
+                if old_name is None:
+                    for base in bases:
+                        old_name = find_saved_photo(album_path, base, photo.is_video)
+                        if old_name is not None:
+                            old_base = base
+                            break
+                if old_name is None:
+                    summary["missing"] += 1
+                    continue
+                if old_base == new_base:
+                    summary["unchanged"] += 1
+                    continue
+                old_path = os.path.join(file_dir, old_name)
+                new_path = os.path.join(file_dir, new_base + old_name[len(old_base):])
+                if os.path.exists(new_path):
+                    summary["conflicts"] += 1
+                    _log(f"[重命名] 目标已存在，保留原文件: {old_path} -> {new_path}")
+                    continue
+                try:
+                    os.rename(old_path, new_path)
+                except OSError as e:
+                    summary["conflicts"] += 1
+                    _log(f"[重命名] 无法重命名 {old_path}: {e}")
+                    continue
+                manifest.rename(old_path, new_path)
+                summary["renamed"] += 1
+    finally:
+        manifest.close()
+    _log(
+        f"[重命名] 用户 {dest_user_qq}: 重命名 {summary['renamed']}，无需改动 "
+        f"{summary['unchanged']}，未找到 {summary['missing']}，冲突 {summary['conflicts']}。"
+    )
+    return summary
+
+
+# ---------------------------------------------------------------------------
+# 列表缓存
+# ---------------------------------------------------------------------------
+
+
+def merge_album_pages(pages: dict[int, list[QzoneAlbum]]) -> list[QzoneAlbum]:
+    """按页序合并相册分页，并去掉相邻分页边界上重复返回的相册。"""
+    albums: list[QzoneAlbum] = []
+    seen_uids: set[str] = set()
+    for page_start in sorted(pages):
+        for album in pages[page_start]:
+            if album.uid in seen_uids:
+                continue
+            seen_uids.add(album.uid)
+            albums.append(album)
+    return albums
+
+
+class ListingCache:
+    """
+    相册/照片列表的磁盘缓存，避免每次运行都完整调用列举 API。
+
+    - 缓存项按 (目标用户, 相册 ID, 页码起点) 组织：每个相册一个文件，内含各分页；
+      相册列表本身以特殊 ID "__albums__" 保存；
+    - 照片列表超过 ttl 秒即失效，并在相册的照片数或修改时间变化时提前失效；
+      相册列表没有这样的变化依据（新建的相册不会让旧列表失效），使用更短的 album_ttl；
+    - 与任务日志一样以 JSON 保存 namedtuple 的字段（_asdict()），读取缓存不会执行代码。
+    """
+
+    DIR_NAME = ".qzone_cache"
+    ALBUMS_KEY = "__albums__"
+    VERSION = 3  # QzoneAlbum/QzonePhoto 字段或缓存格式变化时递增，使旧缓存失效
+
+    def __init__(self, ttl: float, album_ttl: float | None = None):
+        self.ttl = ttl
+        self.album_ttl = ttl if album_ttl is None else min(ttl, album_ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _path(self, dest_user_qq: str, key: str) -> str:
+        filename = sanitize_filename_component(str(key)) + ".json"
+        return os.path.join(get_save_directory(dest_user_qq), self.DIR_NAME, filename)
+
+    def _load(self, dest_user_qq: str, key: str, ttl: float) -> dict | None:
+        path = self._path(dest_user_qq, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[缓存] 读取 {path} 失败，忽略缓存: {e}")
+            return None
+        if not isinstance(entry, dict) or entry.get("version") != self.VERSION:
+            return None
+        if time.time() - entry.get("saved_at", 0) > ttl:
+            return None
+        return entry
+
+    def _store(self, dest_user_qq: str, key: str, entry: dict) -> None:
+        path = self._path(dest_user_qq, key)
+        entry = dict(entry, version=self.VERSION, saved_at=time.time())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[缓存] 写入 {path} 失败: {e}")
+
+    def get_albums(self, dest_user_qq: str) -> list[QzoneAlbum] | None:
+        """返回缓存的相册列表；未命中返回 None。"""
+        if self.album_ttl <= 0:
+            return None
+        entry = self._load(dest_user_qq, self.ALBUMS_KEY, self.album_ttl)
+        if entry is None:
+            return None
+        # JSON 对象的键是字符串，页码起点需转回整数
+        pages = entry["pages"]
+        return merge_album_pages(
+            {int(start): [QzoneAlbum(**row) for row in rows] for start, rows in pages.items()}
+        )
+
+    def put_albums(self, dest_user_qq: str, pages: dict[int, list[QzoneAlbum]]) -> None:
+        if self.album_ttl <= 0:
+            return
+        self._store(
+            dest_user_qq,
+            self.ALBUMS_KEY,
+            {"pages": {start: [a._asdict() for a in albums] for start, albums in pages.items()}},
+        )
+
+    def get_photos(
+        self, dest_user_qq: str, album: QzoneAlbum
+    ) -> dict[int, list[QzonePhoto]] | None:
+        """返回缓存的 {页码起点: 照片列表}；未命中或相册已变化返回 None。"""
+        if not self.enabled:
+            return None
+        entry = self._load(dest_user_qq, album.uid, self.ttl)
+        if entry is None:
+            return None
+        if entry.get("count") != album.count or entry.get("modifytime") != album.modifytime:
+            return None
+        return {
+            int(start): [QzonePhoto(**row) for row in rows]
+            for start, rows in entry["pages"].items()
+        }
+
+    def put_photos(
+        self, dest_user_qq: str, album: QzoneAlbum, pages: dict[int, list[QzonePhoto]]
+    ) -> None:
+        if not self.enabled:
+            return
+        self._store(
+            dest_user_qq,
+            album.uid,
+            {
+                "count": album.count,
+                "modifytime": album.modifytime,
+                "pages": {
+                    start: [p._asdict() for p in photos] for start, photos in pages.items()
+                },
+            },
+        )
+
+
+# ---------------------------------------------------------------------------
+# 增量同步快照
+# ---------------------------------------------------------------------------
+
+
+class SyncSnapshot:
+    """
+    watch 模式的增量同步快照：记录每个相册上次同步时的照片数、修改时间与已完成的照片。
+
+    下一轮只需重新获取相册列表，照片数与修改时间都没有变化、且上次已全部完成的相册
+    不再列举；有变化的相册只下载快照中没有的照片。配置了日期窗口时，“完成”指窗口内的
+    照片均已完成，快照同时记录当时的窗口，窗口扩大后这些相册重新列举。
+    """
+
+    FILE_NAME = ".qzone_snapshot.json"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.albums: dict[str, dict] = {}
+
+    @classmethod
+    def for_user(cls, dest_user_qq: str) -> "SyncSnapshot":
+        return cls(os.path.join(get_save_directory(dest_user_qq), cls.FILE_NAME))
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            albums = data.get("albums") if isinstance(data, dict) else None
+            self.albums = albums if isinstance(albums, dict) else {}
+        except FileNotFoundError:
+            self.albums = {}
+        except Exception as e:
+            logger.warning(f"读取同步快照 {self.path} 失败，将完整同步: {e}")
+            self.albums = {}
+
+    def save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"saved_at": time.time(), "albums": self.albums}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存同步快照 {self.path} 失败: {e}")
+
+    @staticmethod
+    def _window_covers(saved, window: DateWindow | None) -> bool:
+        """快照记录的窗口（None 表示不限）是否包含当前窗口。"""
+        if saved is None:
+            return True
+        if window is None:
+            return False
+        start, end, field = saved
+        return (
+            field == window.field
+            and (start is None or (window.start is not None and start <= window.start))
+            and (end is None or (window.end is not None and end >= window.end))
+        )
+
+    def is_changed(self, album: QzoneAlbum, window: DateWindow | None = None) -> bool:
+        entry = self.albums.get(album.uid)
+        return (
+            entry is None
+            or not entry.get("complete")
+            or entry.get("count") != album.count
+            or entry.get("modifytime") != album.modifytime
+            or not self._window_covers(entry.get("window"), window)
+        )
+
+    def known_keys(self) -> set[str]:
+        """快照中所有已完成照片的任务键（见 photo_task_key）。"""
+        return {key for entry in self.albums.values() for key in entry.get("keys", [])}
+
+    def update_album(
+        self,
+        album: QzoneAlbum,
+        done_keys: set[str],
+        complete: bool,
+        window: DateWindow | None = None,
+    ) -> None:
+        """记录相册的同步结果；未全部完成时下一轮仍会检查该相册。"""
+        self.albums[album.uid] = {
+            "name": album.name,
+            "count": album.count,
+            "modifytime": album.modifytime,
+            "complete": complete,
+            "keys": sorted(done_keys),
+            "window": list(window) if window is not None else None,
+        }
+
+    def prune(self, albums: list[QzoneAlbum]) -> None:
+        """移除已不存在的相册。"""
+        current = {album.uid for album in albums}
+        self.albums = {uid: entry for uid, entry in self.albums.items() if uid in current}
+
+
+# ---------------------------------------------------------------------------
+# 元数据导出（SQLite）
+# ---------------------------------------------------------------------------
+
+
+class PhotoMetadataStore:
+    """
+    把列举得到的相册与照片元数据批量写入 SQLite，便于不打开文件即可检索与统计。
+
+    EXIF 只写入 JPEG 文件本身，PNG/GIF/视频的拍摄时间、设备等信息不会保留；
+    这里按相册整体替换：每个相册一个事务，先删除该相册的旧记录再批量插入。
+    所有用户共用一个数据库，多进程分片下载时由 SQLite 的文件锁串行化写入。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS albums (
+            user_qq     TEXT NOT NULL,
+            album_id    TEXT NOT NULL,
+            name        TEXT NOT NULL,
+            photo_count INTEGER NOT NULL,
+            modifytime  INTEGER NOT NULL,
+            listed_at   REAL NOT NULL,
+            PRIMARY KEY (user_qq, album_id)
+        );
+        CREATE TABLE IF NOT EXISTS photos (
+            user_qq     TEXT NOT NULL,
+            album_id    TEXT NOT NULL,
+            photo_key   TEXT NOT NULL,
+            photo_index INTEGER NOT NULL,
+            name        TEXT NOT NULL,
+            is_video    INTEGER NOT NULL,
+            pic_key     TEXT NOT NULL,
+            url         TEXT NOT NULL,
+            shoottime   TEXT NOT NULL,
+            uploadtime  TEXT NOT NULL,
+            cameratype  TEXT NOT NULL,
+            width       INTEGER NOT NULL,
+            height      INTEGER NOT NULL,
+            exif        TEXT NOT NULL,
+            PRIMARY KEY (user_qq, album_id, photo_key)
+        );
+        CREATE INDEX IF NOT EXISTS photos_shoottime ON photos (user_qq, shoottime);
+    """
+    BUSY_TIMEOUT = 30.0  # 秒，其他进程持有写锁时的等待时间
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @classmethod
+    def from_config(cls) -> "PhotoMetadataStore | None":
+        """按配置项 metadata_db 创建，相对路径位于下载目录下；为空时返回 None。"""
+        name = APP_CONFIG.get("metadata_db", "")
+        if not name:
+            return None
+        download_path = APP_CONFIG.get("download_path", "downloads")
+        return cls(os.path.join(get_script_directory(), download_path, name))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._initialized = True
+        return conn
+
+    def write_album(self, user_qq: str, album: QzoneAlbum, photos: list[QzonePhoto]) -> None:
+        """在一个事务中替换相册及其全部照片的记录。"""
+        rows = [
+            (
+                user_qq,
+                album.uid,
+                photo.pic_key or photo.url,
+                index,
+                photo.name,
+                int(bool(photo.is_video)),
+                photo.pic_key or "",
+                photo.url,
+                photo.shoottime or "",
+                photo.uploadtime or "",
+                photo.cameratype or "",
+                int(photo.width or 0),
+                int(photo.height or 0),
+                json.dumps(photo.exif_data or {}, ensure_ascii=False),
+            )
+            for index, photo in enumerate(photos)
+        ]
+        now = time.time()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO albums VALUES (?, ?, ?, ?, ?, ?)",
+                        (user_qq, album.uid, album.name, album.count, album.modifytime, now),
+                    )
+                    conn.execute(
+                        "DELETE FROM photos WHERE user_qq = ? AND album_id = ?",
+                        (user_qq, album.uid),
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO photos VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            finally:
+                conn.close()
+
+
+def export_user_metadata(dest_user_qq: str, log_func=None) -> int:
+    """
+    把任务日志中已记录的相册与照片列表导出到元数据数据库，无需登录或重新列举。
+
+    Returns:
+        int: 导出的照片数量。
+    """
+
+    def _log(msg: str) -> None:
+        if log_func:
+            log_func(msg)
+        logger.info(msg)
+
+    store = PhotoMetadataStore.from_config()
+    if store is None:
+        _log("[元数据] 未配置 metadata_db，跳过导出。")
+        return 0
+    state = DownloadJournal.for_user(dest_user_qq).load()
+    if not state.albums:
+        _log(f"[元数据] 用户 {dest_user_qq} 没有任务日志，跳过。")
+        return 0
+    exported = 0
+    for album in state.albums:
+        photos = state.photos.get(album.uid)
+        if photos is None:
+            continue
+        store.write_album(dest_user_qq, album, photos)
+        exported += len(photos)
+    _log(f"[元数据] 用户 {dest_user_qq}: 已导出 {exported} 张照片的元数据到 {store.path}")
+    return exported
+
+
+# ---------------------------------------------------------------------------
+# 写盘阶段
+# ---------------------------------------------------------------------------
+
+# 阶段指标名称
+STAGE_RESOLVE = "resolve"        # 视频地址解析
+STAGE_NETWORK = "network"        # 网络传输（含跳过与失败的尝试）
+STAGE_WRITE_WAIT = "write_wait"  # 网络线程等待写盘队列空位
+STAGE_WRITE = "write"            # EXIF、写入临时文件、mtime、重命名
+STAGE_FSYNC = "fsync"            # 批量刷盘
+
+STAGE_LABELS = {
+    STAGE_RESOLVE: "视频解析",
+    STAGE_NETWORK: "网络传输",
+    STAGE_WRITE_WAIT: "写盘排队",
+    STAGE_WRITE: "写盘",
+    STAGE_FSYNC: "刷盘",
+}
+
+
+class StageMetrics:
+    """线程安全的各阶段耗时统计（次数、累计秒数、字节数）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, list] = {}
+
+    def record(self, stage: str, seconds: float, nbytes: int = 0) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(stage, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += nbytes
+
+    def snapshot(self) -> dict[str, dict]:
+        """返回 {stage: {"count", "seconds", "bytes"}} 的副本。"""
+        with self._lock:
+            return {
+                stage: {"count": count, "seconds": seconds, "bytes": nbytes}
+                for stage, (count, seconds, nbytes) in self._stats.items()
+            }
+
+    def format_summary(self) -> str:
+        parts = []
+        for stage, stats in self.snapshot().items():
+            if not stats["count"]:
+                continue
+            text = (
+                f"{STAGE_LABELS.get(stage, stage)} {stats['count']} 次，"
+                f"累计 {stats['seconds']:.1f}s，平均 {stats['seconds'] / stats['count']:.3f}s"
+            )
+            if stats["bytes"]:
+                text += f"，{stats['bytes'] / (1024 * 1024):.1f} MB"
+            parts.append(text)
+        return "；".join(parts)
+
+
+def finalize_write_job(job: WriteJob, fsync: bool = False) -> str:
+    """
+    完成一次下载的落盘：写入 EXIF，设置 mtime，并原子地放到最终位置。
+
+    文件模式下先写入同目录的 .part 临时文件，设置 mtime 后再重命名，因此中途出错
+    或进程被终止不会留下不完整的目标文件。归档模式下直接追加到归档。
+    job.temp_path 非空时内容已在该临时文件中（如 HLS 视频），不写 EXIF，直接移动或归档。
+
+    Returns:
+        str: TASK_DONE 或 TASK_FAILED。
+    """
+    task = job.task
+    photo = task.photo
+    if job.temp_path:
+        content = job.content
+    else:
+        content = apply_exif_to_bytes(
+            job.content, photo.exif_data, photo.shoottime, photo.uploadtime, photo.cameratype
+        )
+    mtime = _photo_timestamp(photo.exif_data, photo.shoottime, photo.uploadtime)
+    try:
+        if job.archive is not None and job.temp_path:
+            job.archive.add_file(job.filename, job.temp_path, mtime=mtime, pic_key=photo.pic_key)
+            os.remove(job.temp_path)
+        elif job.archive is not None:
+            job.archive.add(job.filename, content, mtime=mtime, pic_key=photo.pic_key)
+        else:
+            temp_path = job.temp_path or job.path + ".part"
+            try:
+                if job.temp_path:
+                    if fsync:
+                        with open(temp_path, "rb+") as f:
+                            os.fsync(f.fileno())
+                else:
+                    with open(temp_path, "wb") as f:
+                        f.write(content)
+                        if fsync:
+                            f.flush()
+                            os.fsync(f.fileno())
+                if mtime is not None:
+                    os.utime(temp_path, (mtime, mtime))
+                size = os.path.getsize(temp_path)
+                os.replace(temp_path, job.path)
+            except OSError:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+            manifest = task.qzone_manager.manifest
+            if manifest is not None:
+                # 写入 EXIF 后内容改变，清单记录的是最终文件的校验和
+                if (content is job.content or job.temp_path) and job.sha256:
+                    sha256 = job.sha256
+                else:
+                    sha256 = hashlib.sha256(content).hexdigest()
+                manifest.record_file(
+                    job.path,
+                    size,
+                    sha256,
+                    photo_task_key(task.album_id, photo),
+                    photo,
+                    task.album_id,
+                    job.etag,
+                    job.last_modified,
+                )
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+        task_log(
+            task.log_func,
+            logging.ERROR,
+            f"[写入失败] 相册 '{task.album_name}', 照片 {task.photo_index + 1} ({job.path}): {e}",
+        )
+        return TASK_FAILED
+
+    task_log(
+        task.log_func,
+        logging.DEBUG,
+        "[下载成功] 相册 '%s', 照片 %d。尝试次数: %d",
+        task.album_name,
+        task.photo_index + 1,
+        task.attempt + 1,
+    )
+    return TASK_DONE
+
+
+class DiskWriter:
+    """
+    写盘阶段：网络线程把 WriteJob 放入有界队列后立即返回，由少量写盘线程完成落盘。
+
+    队列满时 submit() 阻塞，形成背压，避免磁盘跟不上时下载内容在内存中无限堆积。
+    fsync_batch 为 0 时不主动刷盘；为 1 时每个文件在重命名前 fsync；
+    大于 1 时每完成 fsync_batch 个文件统一刷盘一次。
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        metrics: StageMetrics | None = None,
+        fsync_batch: int = 0,
+    ):
+        self.workers = max(1, workers)
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.fsync_batch = max(0, fsync_batch)
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._threads: list[threading.Thread] = []
+        self._batch_lock = threading.Lock()
+        self._unsynced: list[str] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"qzone-writer-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job: WriteJob, on_done) -> None:
+        """提交写盘任务；完成后在写盘线程中调用 on_done(task, outcome, nbytes)。"""
+        start = time.monotonic()
+        self._queue.put((job, on_done))
+        self.metrics.record(STAGE_WRITE_WAIT, time.monotonic() - start)
+
+    def close(self) -> None:
+        """等待队列中的任务全部完成后结束写盘线程，并刷新未同步的文件。"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        self._sync_batch(force=True)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job, on_done = item
+            nbytes = len(job.content)
+            if job.temp_path and os.path.exists(job.temp_path):
+                nbytes = os.path.getsize(job.temp_path)
+            start = time.monotonic()
+            try:
+                outcome = finalize_write_job(job, fsync=self.fsync_batch == 1)
+            except Exception as e:
+                logger.exception(f"写盘任务出现未处理的异常: {e}")
+                outcome = TASK_FAILED
+            self.metrics.record(STAGE_WRITE, time.monotonic() - start, nbytes)
+            if job.budget is not None:
+                job.budget.release(job.reserved)
+            if outcome == TASK_DONE and self.fsync_batch > 1 and job.archive is None:
+                with self._batch_lock:
+                    self._unsynced.append(job.path)
+                self._sync_batch()
+            try:
+                on_done(job.task, outcome, nbytes)
+            except Exception as e:
+                logger.exception(f"写盘完成回调出现异常: {e}")
+
+    def _sync_batch(self, force: bool = False) -> None:
+        with self._batch_lock:
+            if not self._unsynced or (not force and len(self._unsynced) < self.fsync_batch):
+                return
+            paths, self._unsynced = self._unsynced, []
+        start = time.monotonic()
+        # 只刷本批写入的文件及其所在目录（使重命名持久化），不用 os.sync() 刷整个系统的缓存
+        for path in paths:
+            try:
+                with open(path, "ab") as f:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logger.warning(f"[fsync] 刷盘失败，文件 {path}: {e}")
+        if os.name == "posix":
+            for directory in {os.path.dirname(path) for path in paths}:
+                try:
+                    fd = os.open(directory or ".", os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    logger.warning(f"[fsync] 刷盘失败，目录 {directory}: {e}")
+        self.metrics.record(STAGE_FSYNC, time.monotonic() - start)
+
+
+# ---------------------------------------------------------------------------
+# 下载调度
+# ---------------------------------------------------------------------------
+
+
+def compute_retry_delay(attempt: int) -> float:
+    """
+    计算第 attempt 次失败后的重试等待时间（指数退避 + 抖动）。
+
+    等待时间在 [d/2, d] 之间均匀分布，其中 d = min(retry_backoff_max, base * 2^(attempt-1))，
+    以避免大量任务在同一时刻集中重试。
+    """
+    base = APP_CONFIG.get("retry_backoff_base", 2)
+    cap = APP_CONFIG.get("retry_backoff_max", 60)
+    delay = min(cap, base * (2 ** max(attempt - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+# 调度通道：视频地址解析、视频传输、图片传输分别使用独立的并发度
+LANE_IMAGE = "image"
+LANE_VIDEO_RESOLVE = "video_resolve"
+LANE_VIDEO = "video"
+LANES = (LANE_IMAGE, LANE_VIDEO_RESOLVE, LANE_VIDEO)
+
+# task_order 可选值
+TASK_ORDERS = ("album", "small_first", "newest_first")
+
+
+def get_lane_workers() -> dict[str, int]:
+    """读取各调度通道的并发数；图片通道默认使用 max_workers。"""
+    configured = APP_CONFIG.get("lane_workers") or {}
+    defaults = {
+        LANE_IMAGE: APP_CONFIG.get("max_workers", 10),
+        LANE_VIDEO_RESOLVE: 2,
+        LANE_VIDEO: 2,
+    }
+    return {lane: max(1, int(configured.get(lane, default))) for lane, default in defaults.items()}
+
+
+def task_lane(task: PhotoTask) -> str:
+    """根据任务当前状态确定其所在的调度通道。"""
+    if task.photo.is_video:
+        if task.video_url is None:
+            return LANE_VIDEO_RESOLVE
+        if task.video_url:
+            return LANE_VIDEO
+    # 普通图片以及视频地址解析失败后回退下载的封面图
+    return LANE_IMAGE
+
+
+def order_tasks(tasks: list[PhotoTask], order: str) -> list[PhotoTask]:
+    """
+    按 task_order 对任务排序（各通道内保持该相对顺序）。
+
+    - album:        相册与列表原始顺序
+    - small_first:  按图片像素数从小到大，尺寸未知的排在最后
+    - newest_first: 按上传时间（缺失时为拍摄时间）从新到旧
+    """
+    if order == "small_first":
+        return sorted(
+            tasks,
+            key=lambda t: (t.photo.width * t.photo.height) or float("inf"),
+        )
+    if order == "newest_first":
+        return sorted(
+            tasks,
+            key=lambda t: _datetime_str_to_exif(t.photo.uploadtime or t.photo.shoottime) or "",
+            reverse=True,
+        )
+    return list(tasks)
+
+
+class DownloadScheduler:
+    """
+    下载任务调度器。
+
+    任务按类型进入独立的调度通道（视频地址解析 / 视频传输 / 图片传输），各通道拥有
+    自己的线程池与并发上限，少数大视频不会占满所有线程而让大量小图片排队等待。
+    视频任务先在解析通道获取真实地址，再转入视频传输通道。
+
+    下载完成的数据交给写盘阶段（DiskWriter）落盘，网络线程随即处理下一个任务；
+    任务在写盘完成后才算结束。
+
+    工作线程只执行单次尝试；返回 TASK_RETRY 的任务进入按就绪时间排序的延迟队列，
+    等待退避时间结束后再回到原通道，期间工作线程继续处理其他任务。任务在尝试次数
+    达到 max_attempts 或自首次尝试起超过 task_deadline 秒后判定为失败。
+    """
+
+    STOP_POLL_INTERVAL = 0.5  # 秒，主循环检查停止标志的间隔
+
+    def __init__(
+        self,
+        lane_workers: dict[str, int],
+        is_stopped_func=None,
+        on_outcome=None,
+        order: str = "album",
+        metrics: StageMetrics | None = None,
+        on_stop=None,
+    ):
+        """
+        Args:
+            lane_workers:    各通道的并发数，见 get_lane_workers()
+            is_stopped_func: 可选，无参可调用对象，返回 True 时不再提交新任务
+            on_outcome:      可选，callable(task, outcome)，任务最终完成时调用
+            order:           任务顺序，TASK_ORDERS 之一
+            metrics:         可选，记录各阶段耗时的 StageMetrics
+            on_stop:         可选，无参可调用对象，检测到停止或 run() 因异常（如 Ctrl+C）
+                             退出时调用一次，用于中断进行中的传输
+        """
+        self.lane_workers = {lane: lane_workers.get(lane, 1) for lane in LANES}
+        self.is_stopped_func = is_stopped_func if is_stopped_func is not None else (lambda: False)
+        self.on_outcome = on_outcome
+        self.order = order if order in TASK_ORDERS else "album"
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.on_stop = on_stop
+        self.stopped_at: float | None = None
+        self.stop_latency: float | None = None  # 从检测到停止到 run() 返回的秒数
+        self._writer: DiskWriter | None = None
+        self._cond = threading.Condition()
+        self._ready: dict[str, deque[PhotoTask]] = {lane: deque() for lane in LANES}
+        self._in_flight: dict[str, int] = {lane: 0 for lane in LANES}
+        self._delayed: list[tuple[float, int, PhotoTask]] = []
+        self._seq = 0
+        self._remaining = 0
+        self._first_attempt_at: dict[str, float] = {}
+        self.outcome_counts: dict[str, int] = {}
+
+    def run(self, tasks: list[PhotoTask]) -> dict[str, int]:
+        """执行全部任务，阻塞直至所有任务完成或停止，返回各结果的计数。"""
+        executors = {
+            lane: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"qzone-{lane}")
+            for lane, workers in self.lane_workers.items()
+        }
+        self._writer = DiskWriter(
+            APP_CONFIG.get("writer_workers", 2),
+            APP_CONFIG.get("writer_queue_size", 32),
+            self.metrics,
+            APP_CONFIG.get("fsync_batch", 0),
+        )
+        self._writer.start()
+        completed = False
+        try:
+            with self._cond:
+                for task in order_tasks(tasks, self.order):
+                    self._ready[task_lane(task)].append(task)
+                self._remaining = len(tasks)
+                while self._remaining > 0:
+                    if self.is_stopped_func():
+                        self._notify_stop()
+                        self._drain_stopped()
+                        if self._remaining == 0:
+                            break
+
+                    now = time.monotonic()
+                    while self._delayed and self._delayed[0][0] <= now:
+                        task = heapq.heappop(self._delayed)[2]
+                        self._ready[task_lane(task)].append(task)
+
+                    for lane, ready in self._ready.items():
+                        while ready and self._in_flight[lane] < self.lane_workers[lane]:
+                            task = ready.popleft()
+                            key = photo_task_key(task.album_id, task.photo)
+                            self._first_attempt_at.setdefault(key, now)
+                            self._in_flight[lane] += 1
+                            executors[lane].submit(self._execute, lane, task)
+
+                    timeout = self.STOP_POLL_INTERVAL
+                    if self._delayed:
+                        timeout = min(timeout, max(self._delayed[0][0] - now, 0))
+                    self._cond.wait(timeout)
+            completed = True
+        finally:
+            if not completed:
+                self._notify_stop()
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+            self._writer.close()
+            if self.stopped_at is not None:
+                self.stop_latency = time.monotonic() - self.stopped_at
+        return dict(self.outcome_counts)
+
+    def _notify_stop(self) -> None:
+        if self.stopped_at is not None:
+            return
+        self.stopped_at = time.monotonic()
+        if self.on_stop is not None:
+            try:
+                self.on_stop()
+            except Exception as e:
+                logger.exception(f"停止回调出现异常: {e}")
+
+    def _execute(self, lane: str, task: PhotoTask) -> None:
+        start = time.monotonic()
+        try:
+            if lane == LANE_VIDEO_RESOLVE:
+                result = resolve_video_worker(task)
+            else:
+                result = save_photo_worker(task)
+        except Exception as e:
+            logger.exception(f"下载任务出现未处理的异常: {e}")
+            result = TASK_RETRY
+        if lane == LANE_VIDEO_RESOLVE:
+            self.metrics.record(STAGE_RESOLVE, time.monotonic() - start)
+        else:
+            nbytes = len(result.content) if isinstance(result, WriteJob) else 0
+            self.metrics.record(STAGE_NETWORK, time.monotonic() - start, nbytes)
+        if isinstance(result, WriteJob):
+            # 写盘队列满时在此阻塞，网络通道的并发槽位随之占用，形成背压
+            self._writer.submit(result, self._on_written)
+        with self._cond:
+            self._in_flight[lane] -= 1
+            if isinstance(result, WriteJob):
+                pass  # 任务在写盘完成后由 _on_written 结束
+            elif isinstance(result, PhotoTask):
+                # 视频地址解析完成，转入下一个通道
+                self._ready[task_lane(result)].appendleft(result)
+            elif result == TASK_AUTH_RETRY:
+                self._ready[lane].appendleft(task)
+            elif result == TASK_RETRY:
+                self._schedule_retry(task)
+            else:
+                self._finish(task, result)
+            self._cond.notify()
+
+    def _on_written(self, task: PhotoTask, outcome: str, nbytes: int = 0) -> None:
+        """写盘线程完成落盘后的回调。"""
+        with self._cond:
+            self._finish(task, outcome, nbytes)
+            self._cond.notify()
+
+    def _schedule_retry(self, task: PhotoTask) -> None:
+        """将失败的任务放入延迟队列；超出次数或截止时间时判定为失败。调用方需持有锁。"""
+        attempt = task.attempt + 1
+        now = time.monotonic()
+        key = photo_task_key(task.album_id, task.photo)
+        elapsed = now - self._first_attempt_at.get(key, now)
+        deadline = APP_CONFIG.get("task_deadline", 600)
+        if self.is_stopped_func():
+            self._finish(task, TASK_STOPPED)
+            return
+        if attempt >= APP_CONFIG["max_attempts"] or elapsed >= deadline:
+            task_log(
+                task.log_func,
+                logging.WARNING,
+                "[下载失败] 用户: %s, 相册 '%s', 照片 %d ('%s') 尝试 %d 次、耗时 %.0fs 后仍失败。URL: %s",
+                task.user_qq,
+                task.album_name,
+                task.photo_index + 1,
+                task.photo.name,
+                attempt,
+                elapsed,
+                task.photo.url,
+            )
+            self._finish(task, TASK_FAILED)
+            return
+        delay = min(compute_retry_delay(attempt), max(deadline - elapsed, 0))
+        self._seq += 1
+        heapq.heappush(self._delayed, (now + delay, self._seq, task._replace(attempt=attempt)))
+
+    def _drain_stopped(self) -> None:
+        """停止时将所有尚未开始的任务（含延迟队列）标记为已停止。调用方需持有锁。"""
+        pending = [task for ready in self._ready.values() for task in ready]
+        pending += [item[2] for item in self._delayed]
+        for ready in self._ready.values():
+            ready.clear()
+        self._delayed.clear()
+        for task in pending:
+            self._finish(task, TASK_STOPPED)
+
+    def _finish(self, task: PhotoTask, outcome: str, nbytes: int = 0) -> None:
+        """记录任务的最终结果、结构化事件并更新进度。调用方需持有锁。"""
+        self._remaining -= 1
+        started = self._first_attempt_at.pop(photo_task_key(task.album_id, task.photo), None)
+        self.outcome_counts[outcome] = self.outcome_counts.get(outcome, 0) + 1
+        log_event(
+            "photo",
+            user=task.user_qq,
+            album=task.album_name,
+            album_id=task.album_id,
+            pic_key=task.photo.pic_key,
+            bytes=nbytes,
+            duration=round(time.monotonic() - started, 3) if started is not None else 0,
+            attempts=task.attempt + 1,
+            outcome=outcome,
+        )
+        if task.progress_func:
+            task.progress_func(1)
+        if self.on_outcome:
+            self.on_outcome(task, outcome)
+
+
+# ---------------------------------------------------------------------------
+# QzonePhotoManager
+# ---------------------------------------------------------------------------
+
+
+class QzonePhotoManager:
+    """管理 QQ 空间相册和照片的获取与下载。"""
+
+    ALBUM_LIST_URL_TEMPLATE = (
+        "https://user.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/fcg_list_album_v3?"
+        "g_tk={gtk}&t={t}&hostUin={dest_user}&uin={user}"
+        "&appid=4&inCharset=utf-8&outCharset=utf-8&source=qzone&plat=qzone&format=jsonp"
+        "&notice=0&filter=1&handset=4&pageNumModeSort=40&pageNumModeClass=15&needUserInfo=1"
+        "&idcNum=4&callbackFun=shine0&callback=shine0_Callback"
+    )
+
+    ALBUM_LIST_URL_WITH_PAGE_TEMPLATE = (
+        "https://user.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/fcg_list_album_v3?"
+        "g_tk={gtk}&t={t}&hostUin={dest_user}&uin={user}"
+        "&appid=4&inCharset=utf-8&outCharset=utf-8&source=qzone&plat=qzone&format=jsonp"
+        "&notice=0&filter=1&handset=4&pageNumModeSort=40&pageNumModeClass=15&needUserInfo=1"
+        "&idcNum=4&callbackFun=shine{fn}&mode=2&sortOrder=2"
+        "&pageStart={pageStart}&pageNum={pageNum}&callback=shine{fn}_Callback"
+    )
+
+    PHOTO_LIST_URL_TEMPLATE = (
+        "https://h5.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/"
+        "cgi_list_photo?g_tk={gtk}&t={t}&mode=0&idcNum=4&hostUin={dest_user}"
+        "&topicId={album_id}&noTopic=0&uin={user}&pageStart={pageStart}&pageNum={pageNum}"
+        "&skipCmtCount=0&singleurl=1&batchId=&notice=0&appid=4&inCharset=utf-8&outCharset=utf-8"
+        "&source=qzone&plat=qzone&outstyle=json&format=jsonp&json_esc=1&question=&answer="
+        "&callbackFun=shine0&callback=shine0_Callback"
+    )
+
+    VIDEO_DETAIL_URL_TEMPLATE = (
+        "https://user.qzone.qq.com/proxy/domain/photo.qzone.qq.com/fcgi-bin/"
+        "cgi_floatview_photo_list_v2?g_tk={gtk}&t={t}&topicId={album_id}&picKey={pic_key}"
+        "&shootTime=&cmtOrder=1&fupdate=1&plat=qzone&source=qzone&cmtNum=10&likeNum=5"
+        "&inCharset=utf-8&outCharset=utf-8&callbackFun=viewer&offset=0&number=15"
+        "&uin={user}&hostUin={dest_user}&appid=4&isFirst=1&sortOrder=1&showMode=1"
+        "&need_private_comment=1&prevNum=9&postNum=18"
+    )
+
+    def __init__(
+        self, user_qq: str, log_signal=None, is_stopped_func=None, reauth_hook=None
+    ):
+        """
+        初始化 QzonePhotoManager。
+
+        Args:
+            user_qq:         登录用户的 QQ 号
+            log_signal:      可选，PyQt signal（有 .emit(str) 方法），用于 GUI 日志输出
+            is_stopped_func: 可选，无参可调用对象，返回 True 时中断操作
+            reauth_hook:     可选，callable(manager) -> bool，登录态失效时调用以重新登录；
+                             默认在 auth_auto_relogin 开启时重新打开浏览器登录
+        """
+        self.user_qq = str(user_qq)
         self.cookies: dict = {}
         self.session = requests.Session()
         self.qzone_g_tk = ""
         self.log_signal = log_signal
         self.is_stopped_func = is_stopped_func if is_stopped_func is not None else (lambda: False)
+        self.reauth_hook = reauth_hook
+        self.auth_breaker = AuthCircuitBreaker(self._check_cookie_validity, self._reauthenticate)
+        self.listing_cache = ListingCache(
+            APP_CONFIG.get("listing_cache_ttl", 3600), APP_CONFIG.get("album_list_cache_ttl", 300)
+        )
+        self.api_limiter = ApiRateLimiter(
+            APP_CONFIG.get("api_max_concurrency", 4), APP_CONFIG.get("api_rate_limit", 5)
+        )
+        self.host_cookie_policy = HostCookiePolicy.load(
+            os.path.join(
+                get_script_directory(),
+                APP_CONFIG.get("download_path", "qzone_photo"),
+                HostCookiePolicy.FILE_NAME,
+            )
+        )
+        self.byte_budget = ByteBudget(
+            int(APP_CONFIG.get("memory_budget_mb", 256) * 1024 * 1024)
+        )
+        self.hedger = RequestHedger(
+            APP_CONFIG.get("hedge_enabled", False),
+            APP_CONFIG.get("hedge_percentile", 95),
+            APP_CONFIG.get("hedge_max_ratio", 0.05),
+        )
+        self.transfers = ActiveTransfers()
+        self.manifest: DownloadManifest | None = None  # 下载运行期间当前用户的文件清单
+        self.metadata_store = PhotoMetadataStore.from_config()  # 未配置 metadata_db 时为 None
+        self.refresh_existing = False  # 为 True 时对已保存的文件发送条件请求检查远端是否变化
+        self.listing_failures = 0  # 本次运行中照片列表获取失败的相册数，不为 0 时不标记任务日志完成
         self.total_albums = 0
+        self._archives: dict[tuple[str, str], AlbumArchiveWriter] = {}
+        self._archives_lock = threading.Lock()
+
+    def get_album_archive(self, dest_user_qq: str, album_name: str) -> AlbumArchiveWriter:
+        """获取（必要时创建）指定相册的归档写入器，同一相册在整个运行期间复用同一实例。"""
+        key = (str(dest_user_qq), album_name)
+        with self._archives_lock:
+            archive = self._archives.get(key)
+            if archive is None:
+                fmt = APP_CONFIG["output_mode"]
+                archive_path = os.path.join(
+                    get_save_directory(dest_user_qq),
+                    f"{sanitize_filename_component(album_name.strip())}.{fmt}",
+                )
+                archive = AlbumArchiveWriter(archive_path, fmt)
+                self._archives[key] = archive
+            return archive
+
+    def close_archives(self) -> None:
+        """关闭本次运行中打开的所有相册归档。"""
+        with self._archives_lock:
+            archives = list(self._archives.values())
+            self._archives.clear()
+        for archive in archives:
+            try:
+                archive.close()
+            except Exception as e:
+                self._emit_log(f"[归档] 关闭归档 {archive.archive_path} 失败: {e}")
+
+    def is_stopped(self) -> bool:
+        """是否应中断当前操作：用户请求停止、传输已被中断，或登录态已无法恢复。"""
+        return self.auth_breaker.broken or self.transfers.aborted or self.is_stopped_func()
+
+    def for_job(self, log_signal=None, is_stopped_func=None) -> "QzonePhotoManager":
+        """
+        创建共享本实例登录态与全局资源的任务级管理器，用于并发执行多个下载任务。
 
-    def _emit_log(self, message: str) -> None:
-        """向 GUI 信号和 logger 双路输出日志。"""
-        if self.log_signal:
-            self.log_signal.emit(message)  # type: ignore[attr-defined]
-        logger.info(message)
+        共享：cookie/g_tk、API 会话与限流、登录态熔断、列表缓存、主机 cookie 策略、
+        内存预算；独立：日志输出、停止标志与进行中的传输、文件清单与归档等单次运行状态。
+        """
+        return ScopedQzonePhotoManager(self, log_signal, is_stopped_func)
+
+    def close(self) -> None:
+        """不再使用管理器时调用，关闭对冲请求的线程池。"""
+        self.hedger.close()
+
+    def _reauthenticate(self) -> bool:
+        """登录态失效时由 AuthCircuitBreaker 调用（同一时刻只会执行一次）。"""
+        if self.reauth_hook is not None:
+            return bool(self.reauth_hook(self))
+        if not APP_CONFIG.get("auth_auto_relogin", True):
+            self._emit_log("[认证] 登录态已失效，且未开启 auth_auto_relogin，停止下载。")
+            return False
+        self._emit_log("[认证] 登录态已失效，请在弹出的浏览器窗口中重新登录。")
+        try:
+            self._login_and_get_cookies()
+        except Exception as e:
+            self._emit_log(f"[认证] 重新登录失败: {e}")
+            return False
+        return True
+
+    def _emit_log(self, message: str, *args, level: int = logging.INFO) -> None:
+        """向 GUI 信号和 logger 双路输出日志；级别未启用时不输出，args 延迟格式化。"""
+        log_func = self.log_signal.emit if self.log_signal else None  # type: ignore[attr-defined]
+        task_log(log_func, level, message, *args)
+
+    def _check_cookie_validity(self) -> bool | None:
+        """
+        通过相册列表 API 验证当前 cookie 是否仍有效。
 
-    def _check_cookie_validity(self) -> bool:
-        """通过相册列表 API 验证当前 cookie 是否仍有效。"""
+        Returns:
+            bool | None: True 有效；False 明确失效（无 cookie、HTTP 401/403 或 API 返回错误码）；
+                         None 验证请求失败或响应无法解析，无法判断。
+        """
         if not self.cookies or not self.qzone_g_tk:
             self._emit_log("Cookie 或 g_tk 为空，无法验证有效性。")
             return False
@@ -680,17 +4348,21 @@ class QzonePhotoManager:
             elif text.startswith("_Callback(") and text.endswith(");"):
                 json_str = text[len("_Callback("):-2]
             if json_str is None:
-                self._emit_log("Cookie 验证失败，API 响应格式不正确。")
-                return False
+                self._emit_log("Cookie 验证失败，API 响应格式不正确，无法判断登录态。")
+                return None
             data = json.loads(json_str)
             if data.get("code", -1) == 0:
                 self._emit_log("Cookie 验证成功，可以继续使用。")
                 return True
             self._emit_log(f"Cookie 验证失败，API 返回错误码: {data.get('code', '未知')}")
             return False
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            self._emit_log(f"Cookie 验证请求失败: {e}")
+            return False if is_auth_failure(status_code) else None
         except Exception as e:
-            self._emit_log(f"Cookie 验证过程中发生错误: {e}")
-            return False
+            self._emit_log(f"Cookie 验证过程中发生错误，无法判断登录态: {e}")
+            return None
 
     def _set_cookies_and_gtk(self, cookies: dict, g_tk: str) -> None:
         """直接注入 cookie 和 g_tk，用于复用已有登录信息。"""
@@ -828,19 +4500,56 @@ class QzonePhotoManager:
             hash_val += (hash_val << 5) + ord(char)
         return hash_val & 0x7FFFFFFF
 
-    def _access_qzone_api(self, url: str, timeout_seconds: int | None = None) -> dict:
-        """访问 QQ 空间 API 端点并解析 JSONP 响应。"""
+    def _access_qzone_api(self, url: str, timeout_seconds: int | None = None) -> dict:
+        """
+        访问 QQ 空间 API 端点并解析 JSONP 响应。
+
+        遇到登录失效（见 is_auth_failure）时交由 auth_breaker 统一恢复，
+        恢复成功后以新的 g_tk 重试一次，暂时无法确认登录态时等待退避结束后重试一次；
+        无法恢复时返回 {}。
+        """
+        for _ in range(2):
+            if not self.auth_breaker.wait_if_open():
+                return {}
+            generation = self.auth_breaker.generation
+            data, status_code = self._access_qzone_api_once(url, timeout_seconds)
+            if not is_auth_failure(status_code, data):
+                return data
+            self._emit_log(f"[认证] API 返回登录失效 (HTTP {status_code}, code {data.get('code')})")
+            auth_result = self.auth_breaker.report_failure(generation)
+            if auth_result == AUTH_UNKNOWN:
+                deadline = time.monotonic() + self.auth_breaker.backoff_remaining()
+                while not self.is_stopped() and time.monotonic() < deadline:
+                    time.sleep(
+                        min(DownloadScheduler.STOP_POLL_INTERVAL, deadline - time.monotonic())
+                    )
+                continue
+            if auth_result != AUTH_RENEWED:
+                return {}
+            url = re.sub(r"g_tk=\d+", f"g_tk={self.qzone_g_tk}", url)
+        return {}
+
+    def _access_qzone_api_once(
+        self, url: str, timeout_seconds: int | None = None
+    ) -> tuple[dict, int | None]:
+        """单次 API 请求，返回 (解析后的数据, HTTP 状态码)；请求失败时数据为 {}。"""
         if timeout_seconds is None:
             timeout_seconds = APP_CONFIG["timeout_init"]
 
         try:
-            response = requests.get(url, cookies=self.cookies, timeout=timeout_seconds)
+            with self.api_limiter:
+                response = requests.get(url, cookies=self.cookies, timeout=timeout_seconds)
             response.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            self._emit_log(f"API 请求失败，URL: {url}: {e}")
+            return {}, e.response.status_code if e.response is not None else None
         except requests.exceptions.RequestException as e:
             self._emit_log(f"API 请求失败，URL: {url}: {e}")
-            return {}
+            return {}, None
+        return self._parse_jsonp(response.text), response.status_code
 
-        text_content = response.text
+    def _parse_jsonp(self, text_content: str) -> dict:
+        """解析 QQ 空间 API 的 JSONP 响应，失败时尝试修复，仍失败返回 {}。"""
         if text_content.startswith("shine0_Callback(") and text_content.endswith(");"):
             json_str = text_content[len("shine0_Callback("):-2]
         elif text_content.startswith("viewer_Callback(") and text_content.endswith(");"):
@@ -877,7 +4586,7 @@ class QzonePhotoManager:
     def get_video_download_url(
         self, dest_user_qq: str, album_id: str, pic_key: str
     ) -> str:
-        """获取视频的真实下载 URL（MP4）。失败返回空字符串。"""
+        """获取视频的真实下载 URL（MP4，没有时为 HLS m3u8 播放列表）。失败返回空字符串。"""
         url = self.VIDEO_DETAIL_URL_TEMPLATE.format(
             gtk=self.qzone_g_tk,
             t=random.random(),
@@ -932,9 +4641,10 @@ class QzonePhotoManager:
                 self._emit_log(f"成功获取视频下载 URL: {download_url[:100]}...")
                 return download_url
 
-            if video_info.get("video_url"):
-                self._emit_log("警告: 仅找到 m3u8 格式的视频 URL，当前版本暂不支持下载")
-                return ""
+            hls_url = video_info.get("video_url", "")
+            if hls_url:
+                self._emit_log(f"仅找到 m3u8 (HLS) 视频地址，将分段下载: {hls_url[:100]}...")
+                return hls_url
 
             self._emit_log("video_info 中没有可用的下载 URL")
             return ""
@@ -944,26 +4654,83 @@ class QzonePhotoManager:
             logger.exception("解析视频详情时出错")
             return ""
 
-    def get_albums_by_page(self, dest_user_qq: str) -> list[QzoneAlbum]:
-        """分页获取目标用户的所有相册列表。"""
-        self.total_albums = 0
-        page_start = 0
-        all_albums: list[QzoneAlbum] = []
+    def get_albums_by_page(self, dest_user_qq: str, use_cache: bool = True) -> list[QzoneAlbum]:
+        """
+        分页获取目标用户的所有相册列表。
 
-        while True:
-            if self.is_stopped_func():
-                self._emit_log("[停止] 相册获取任务已停止。")
-                break
-            albums = self.get_albums(dest_user_qq, page_start)
-            if not albums:
-                break
-            all_albums.extend(albums)
-            page_start += len(albums)
-            # 已获取到全部相册（total_albums 首次从 API 中读取）
-            if self.total_albums > 0 and page_start >= self.total_albums:
-                break
+        第一页返回 albumsInUser 后并发请求其余分页（受 API 并发/速率限制），
+        按页序合并并按相册 ID 去重；总数未知时退化为逐页获取。
+        use_cache=False 时忽略列表缓存，强制重新请求（结果仍会写回缓存）。
+        """
+        self.total_albums = 0
+        page_num = 32
+
+        if self.is_stopped():
+            self._emit_log("[停止] 相册获取任务已停止。")
+            return []
+
+        if use_cache:
+            cached_albums = self.listing_cache.get_albums(dest_user_qq)
+            if cached_albums is not None:
+                self._emit_log(f"[缓存] 使用缓存的相册列表 ({len(cached_albums)} 个相册)。")
+                self.total_albums = len(cached_albums)
+                return cached_albums
+        first_page = self.get_albums(dest_user_qq, 0, page_num)
+        if not first_page:
+            return []
+
+        pages: dict[int, list[QzoneAlbum]] = {0: first_page}
+        complete = True
+        if self.total_albums > len(first_page):
+            page_starts = list(range(len(first_page), self.total_albums, page_num))
+            pages.update(self._fetch_album_pages_concurrently(dest_user_qq, page_starts, page_num))
+            missing = [start for start in page_starts if start not in pages]
+            if missing and not self.is_stopped():
+                complete = False
+                self._emit_log(
+                    f"[警告] 有 {len(missing)} 页相册列表获取失败，本次结果不完整，不写入缓存。"
+                )
+        elif self.total_albums == 0:
+            # 部分响应格式不含 albumsInUser，只能逐页获取直到返回空页
+            page_start = len(first_page)
+            while not self.is_stopped():
+                albums = self.get_albums(dest_user_qq, page_start, page_num)
+                if not albums:
+                    break
+                pages[page_start] = albums
+                page_start += len(albums)
+
+        if complete and not self.is_stopped():
+            self.listing_cache.put_albums(dest_user_qq, pages)
+        return merge_album_pages(pages)
+
+    def _fetch_album_pages_concurrently(
+        self, dest_user_qq: str, page_starts: list[int], page_num: int
+    ) -> dict[int, list[QzoneAlbum]]:
+        """并发获取多个相册分页，返回 {页码起点: 相册列表}；收到停止请求时取消未开始的分页。"""
+        def _fetch(page_start: int) -> list[QzoneAlbum]:
+            if self.is_stopped():
+                return []
+            return self.get_albums(dest_user_qq, page_start, page_num)
+
+        pages: dict[int, list[QzoneAlbum]] = {}
+        workers = max(1, min(APP_CONFIG.get("api_max_concurrency", 4), len(page_starts)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qzone-albums")
+        futures = {executor.submit(_fetch, page_start): page_start for page_start in page_starts}
+        try:
+            for future in as_completed(futures):
+                albums = future.result()
+                if albums:
+                    pages[futures[future]] = albums
+                if self.is_stopped():
+                    break
+        finally:
+            # 停止或出错时不再等待：未开始的分页直接取消，进行中的请求在后台结束
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        return all_albums
+        if self.is_stopped():
+            self._emit_log("[停止] 相册获取任务已停止，相册列表可能不完整。")
+        return pages
 
     def get_albums(
         self, dest_user_qq: str, pageStart: int = 0, pageNum: int = 32
@@ -1020,7 +4787,12 @@ class QzonePhotoManager:
         if album_list:
             for album in album_list:
                 albums.append(
-                    QzoneAlbum(uid=album["id"], name=album["name"], count=album["total"])
+                    QzoneAlbum(
+                        uid=album["id"],
+                        name=album["name"],
+                        count=album["total"],
+                        modifytime=album.get("modifytime", 0),
+                    )
                 )
         elif "albumlist" in album_data:
             for album in album_data["albumlist"]:
@@ -1029,6 +4801,7 @@ class QzonePhotoManager:
                         uid=album["albumid"],
                         name=album["name"],
                         count=album.get("total", album.get("picnum", 0)),
+                        modifytime=album.get("modifytime", album.get("lastupdatetime", 0)),
                     )
                 )
 
@@ -1036,134 +4809,576 @@ class QzonePhotoManager:
             self._emit_log(f"找到的相册: {albums}")
         return albums
 
-    def get_photos_from_album(
-        self, dest_user_qq: str, album: QzoneAlbum
-    ) -> list[QzonePhoto]:
-        """从特定相册获取所有照片，支持分页。"""
-        photos: list[QzonePhoto] = []
-        page_start = 0
-        page_num_to_fetch = 500
-
-        while True:
-            if self.is_stopped_func():
-                self._emit_log(
-                    f"[停止] 照片获取任务已停止，跳过相册 '{album.name}' 的后续页面。"
-                )
-                break
+    def _fetch_photo_page(
+        self, dest_user_qq: str, album: QzoneAlbum, page_start: int, page_num: int
+    ) -> dict | None:
+        """获取相册的一页照片列表，返回 API 的 data 字段；失败或无数据返回 None。"""
+        url = self.PHOTO_LIST_URL_TEMPLATE.format(
+            gtk=self.qzone_g_tk,
+            t=random.random(),
+            dest_user=dest_user_qq,
+            user=self.user_qq,
+            album_id=album.uid,
+            pageStart=page_start,
+            pageNum=page_num,
+        )
+        if APP_CONFIG.get("is_api_debug"):
+            self._emit_log(f"正在从以下地址获取照片: {url}")
 
-            url = self.PHOTO_LIST_URL_TEMPLATE.format(
-                gtk=self.qzone_g_tk,
-                t=random.random(),
-                dest_user=dest_user_qq,
-                user=self.user_qq,
-                album_id=album.uid,
-                pageStart=page_start,
-                pageNum=page_num_to_fetch,
+        data = self._access_qzone_api(url)
+        if APP_CONFIG.get("is_api_debug"):
+            self._emit_log(
+                f"相册 '{album.name}' (页码起点 {page_start}) 的照片列表 API 响应: "
+                f"{json.dumps(data, indent=2, ensure_ascii=False)}"
             )
-            if APP_CONFIG.get("is_api_debug"):
-                self._emit_log(f"正在从以下地址获取照片: {url}")
 
-            data = self._access_qzone_api(url)
-            if APP_CONFIG.get("is_api_debug"):
+        if not data or not data.get("data"):
+            if data and data.get("code", 0) != 0:
                 self._emit_log(
-                    f"相册 '{album.name}' (页码起点 {page_start}) 的照片列表 API 响应: "
-                    f"{json.dumps(data, indent=2, ensure_ascii=False)}"
+                    f"相册 '{album.name}' API 错误: code {data.get('code')}, "
+                    f"message: {data.get('message')}, subcode: {data.get('subcode')}"
                 )
+            return None
+        return data["data"]
+
+    def _parse_photo_list(self, photo_list_data: list, album: QzoneAlbum) -> list[QzonePhoto]:
+        """将 API 返回的 photoList 转换为 QzonePhoto 列表，跳过没有 URL 的条目。"""
+        photos: list[QzonePhoto] = []
+        for photo_data in photo_list_data:
+            pic_url = (
+                photo_data.get("raw")
+                or photo_data.get("origin_url")
+                or photo_data.get("url")
+                or photo_data.get("custom_url")
+            )
+            if not pic_url and "lloc" in photo_data:
+                pic_url = photo_data["lloc"]
+            if not pic_url and "sloc" in photo_data:
+                pic_url = photo_data["sloc"]
 
-            if not data or not data.get("data"):
-                if data and data.get("code", 0) != 0:
+            if not pic_url:
+                if APP_CONFIG.get("is_api_debug"):
                     self._emit_log(
-                        f"相册 '{album.name}' API 错误: code {data.get('code')}, "
-                        f"message: {data.get('message')}, subcode: {data.get('subcode')}"
+                        f"跳过没有 URL 的照片: {photo_data.get('name')}, 数据: {photo_data}"
                     )
-                break
+                continue
 
-            api_data = data["data"]
-            total_in_album = api_data.get("totalInAlbum", 0)
-            photos_in_page = api_data.get("totalInPage", 0)
+            pic_key = photo_data.get("lloc") or photo_data.get("sloc") or ""
+            photos.append(
+                QzonePhoto(
+                    url=pic_url,
+                    name=photo_data.get("name", "untitled").strip(),
+                    album_name=album.name,
+                    is_video=bool(
+                        photo_data.get("is_video", False)
+                        or photo_data.get("phototype") == "video"
+                    ),
+                    pic_key=pic_key,
+                    exif_data=photo_data.get("exif", {}),
+                    shoottime=photo_data.get("rawshoottime", ""),
+                    uploadtime=photo_data.get("uploadtime", ""),
+                    cameratype=photo_data.get("cameratype", "").strip(),
+                    width=_safe_int(photo_data.get("width")),
+                    height=_safe_int(photo_data.get("height")),
+                )
+            )
+        return photos
 
-            if total_in_album == 0:
-                self._emit_log(f"相册 '{album.name}' (ID: {album.uid}) 为空或没有可访问的照片。")
-                break
+    def get_photos_from_album(
+        self, dest_user_qq: str, album: QzoneAlbum
+    ) -> list[QzonePhoto] | None:
+        """从特定相册获取照片，见 list_album_photos；请求失败或被停止时返回 None。"""
+        listing = self.list_album_photos(dest_user_qq, album)
+        return listing[0] if listing is not None else None
 
-            photo_list_data = api_data.get("photoList")
-            if not photo_list_data:
-                if photos_in_page == 0 and page_start > 0:
-                    self._emit_log(
-                        f"在相册 '{album.name}' 中，页码起点 {page_start} 之后未找到更多照片。"
-                    )
-                elif photos_in_page == 0 and page_start == 0:
-                    self._emit_log(f"在相册 '{album.name}' 的第一页未找到照片。")
-                break
+    def list_album_photos(
+        self, dest_user_qq: str, album: QzoneAlbum
+    ) -> tuple[list[QzonePhoto], bool] | None:
+        """
+        从特定相册获取照片，支持分页；请求失败或被停止时返回 None（空相册返回空列表）。
+
+        第一页返回 totalInAlbum 后，其余页的起点即可确定，随后在 API 并发/速率限制内
+        并发请求剩余页面，按页序合并并按 lloc 去重。配置了日期下限时改为逐页获取，
+        越过下限后提前结束，此时只返回列表开头的部分照片（序号与完整列表一致）。
+
+        Returns:
+            tuple: (照片列表, 是否为完整列表)；因日期下限提前结束时为 False
+        """
+        if self.is_stopped():
+            self._emit_log(f"[停止] 照片获取任务已停止，跳过相册 '{album.name}'。")
+            return None
+
+        complete = True
+        pages = self.listing_cache.get_photos(dest_user_qq, album)
+        if pages is not None:
+            self._emit_log(f"[缓存] 相册 '{album.name}' 未变化，使用缓存的照片列表。")
+        else:
+            result = self._fetch_all_photo_pages(dest_user_qq, album)
+            if result is None:
+                return None
+            pages, complete = result
+
+        # 按页序合并，同一张照片可能因列表变动出现在相邻两页中，按 lloc 去重
+        photos: list[QzonePhoto] = []
+        seen_keys: set[str] = set()
+        for page_start in sorted(pages):
+            for photo in pages[page_start]:
+                key = photo.pic_key or photo.url
+                if key in seen_keys:
+                    continue
+                seen_keys.add(key)
+                photos.append(photo)
+        return photos, complete
+
+    def _fetch_all_photo_pages(
+        self, dest_user_qq: str, album: QzoneAlbum
+    ) -> tuple[dict[int, list[QzonePhoto]], bool] | None:
+        """
+        通过 API 获取相册的分页，返回 ({页码起点: 照片列表}, 是否获取了全部分页)。
 
-            for photo_data in photo_list_data:
-                if self.is_stopped_func():
+        完整获取时写入列表缓存；因日期下限提前结束时只含开头的连续分页；
+        任意一页请求失败或被停止返回 None。
+        """
+        page_num_to_fetch = 500
+
+        api_data = self._fetch_photo_page(dest_user_qq, album, 0, page_num_to_fetch)
+        if api_data is None:
+            return None
+
+        total_in_album = api_data.get("totalInAlbum", 0)
+        if total_in_album == 0:
+            self._emit_log(f"相册 '{album.name}' (ID: {album.uid}) 为空或没有可访问的照片。")
+            self.listing_cache.put_photos(dest_user_qq, album, {0: []})
+            return {0: []}, True
+
+        photo_list_data = api_data.get("photoList")
+        if not photo_list_data:
+            self._emit_log(f"在相册 '{album.name}' 的第一页未找到照片。")
+            return None
+
+        # 服务端可能限制单页数量，以实际返回的条数作为步长
+        page_step = api_data.get("totalInPage", 0) or len(photo_list_data)
+        pages: dict[int, list[QzonePhoto]] = {0: self._parse_photo_list(photo_list_data, album)}
+
+        all_starts = list(range(page_step, total_in_album, page_step))
+        remaining_starts = all_starts
+        window = get_date_window()
+        if remaining_starts and window is not None and window.start is not None:
+            # 有日期下限时逐页获取，越过下限后不再请求更早的页（列表不完整，不写入缓存）
+            remaining_starts = self._fetch_photo_pages_until(
+                dest_user_qq, album, pages, remaining_starts, page_step, window.start
+            )
+            if remaining_starts is None:
+                if not self.is_stopped():
+                    self._emit_log(f"[错误] 相册 '{album.name}' 的照片列表获取失败。")
+                return None
+        if remaining_starts:
+            pages.update(
+                self._fetch_photo_pages_concurrently(
+                    dest_user_qq, album, remaining_starts, page_step
+                )
+            )
+            # 缺页会使之后所有照片的序号错位，整个相册按获取失败处理
+            missing = [start for start in remaining_starts if start not in pages]
+            if missing:
+                if not self.is_stopped():
                     self._emit_log(
-                        f"[停止] 照片获取任务已停止，跳过相册 '{album.name}' 中的剩余照片。"
+                        f"[错误] 相册 '{album.name}' 有 {len(missing)} 页照片列表获取失败。"
                     )
-                    return photos
+                return None
+
+        if self.is_stopped():
+            return None
+        complete = len(pages) == len(all_starts) + 1
+        if complete:
+            self.listing_cache.put_photos(dest_user_qq, album, pages)
+        return pages, complete
+
+    def _fetch_photo_list_page(
+        self, dest_user_qq: str, album: QzoneAlbum, page_start: int, page_num: int
+    ) -> list[QzonePhoto] | None:
+        """获取并解析一页照片；请求失败返回 None，没有更多照片时返回空列表。"""
+        api_data = self._fetch_photo_page(dest_user_qq, album, page_start, page_num)
+        if api_data is None:
+            return None
+        photo_list_data = api_data.get("photoList")
+        if not photo_list_data:
+            self._emit_log(f"在相册 '{album.name}' 中，页码起点 {page_start} 之后未找到更多照片。")
+            return []
+        return self._parse_photo_list(photo_list_data, album)
+
+    def _fetch_photo_pages_until(
+        self,
+        dest_user_qq: str,
+        album: QzoneAlbum,
+        pages: dict[int, list[QzonePhoto]],
+        page_starts: list[int],
+        page_num: int,
+        start_ts: float,
+    ) -> list[int] | None:
+        """
+        逐页获取照片并写入 pages，直到某一页出现早于日期下限 start_ts 的照片为止。
 
-                pic_url = (
-                    photo_data.get("raw")
-                    or photo_data.get("origin_url")
-                    or photo_data.get("url")
-                    or photo_data.get("custom_url")
+        照片列表按上传时间倒序排列时，之后的页只会更早，无需再请求。发现列表不是倒序
+        （如相册使用了自定义排序）时无法提前结束，返回尚未获取的页码起点，由调用方并发获取。
+        某一页请求失败或被停止时返回 None，不能与越过下限混为一谈。
+        """
+        todo = list(page_starts)
+        previous = float("inf")
+        page = pages[0]
+        while True:
+            stamps = [ts for ts in map(photo_upload_timestamp, page) if ts is not None]
+            if any(later > earlier for earlier, later in zip([previous] + stamps, stamps)):
+                self._emit_log(
+                    f"[筛选] 相册 '{album.name}' 的照片不是按上传时间倒序排列，将获取全部分页。"
                 )
-                if not pic_url and "lloc" in photo_data:
-                    pic_url = photo_data["lloc"]
-                if not pic_url and "sloc" in photo_data:
-                    pic_url = photo_data["sloc"]
-
-                if not pic_url:
-                    if APP_CONFIG.get("is_api_debug"):
+                return todo
+            if stamps:
+                previous = stamps[-1]
+                # 倒序排列时本页最早的照片已早于下限，之后的页不会再有窗口内的照片
+                if stamps[-1] < start_ts:
+                    if todo:
                         self._emit_log(
-                            f"跳过没有 URL 的照片: {photo_data.get('name')}, 数据: {photo_data}"
+                            f"[筛选] 相册 '{album.name}' 已越过日期下限，跳过剩余 {len(todo)} 页。"
                         )
-                    continue
+                    return []
+            if not todo:
+                return []
+            if self.is_stopped():
+                return None
+            page_start = todo.pop(0)
+            page = self._fetch_photo_list_page(dest_user_qq, album, page_start, page_num)
+            if page is None:
+                return None
+            pages[page_start] = page
+
+    def _fetch_photo_pages_concurrently(
+        self,
+        dest_user_qq: str,
+        album: QzoneAlbum,
+        page_starts: list[int],
+        page_num: int,
+    ) -> dict[int, list[QzonePhoto]]:
+        """并发获取多个照片页，返回 {页码起点: 照片列表}；被停止或失败的页不在结果中。"""
+        def _fetch(page_start: int) -> list[QzonePhoto] | None:
+            if self.is_stopped():
+                return None
+            return self._fetch_photo_list_page(dest_user_qq, album, page_start, page_num)
 
-                pic_key = photo_data.get("lloc") or photo_data.get("sloc") or ""
-                photos.append(
-                    QzonePhoto(
-                        url=pic_url,
-                        name=photo_data.get("name", "untitled").strip(),
-                        album_name=album.name,
-                        is_video=bool(
-                            photo_data.get("is_video", False)
-                            or photo_data.get("phototype") == "video"
-                        ),
-                        pic_key=pic_key,
-                        exif_data=photo_data.get("exif", {}),
-                        shoottime=photo_data.get("rawshoottime", ""),
-                        uploadtime=photo_data.get("uploadtime", ""),
-                        cameratype=photo_data.get("cameratype", "").strip(),
-                    )
-                )
+        self._emit_log(
+            f"相册 '{album.name}' 共 {len(page_starts) + 1} 页，并发获取剩余 {len(page_starts)} 页..."
+        )
+        pages: dict[int, list[QzonePhoto]] = {}
+        workers = max(1, min(APP_CONFIG.get("api_max_concurrency", 4), len(page_starts)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_fetch, start): start for start in page_starts}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=DownloadScheduler.STOP_POLL_INTERVAL)
+                for future in done:
+                    result = future.result()
+                    if result is not None:
+                        pages[futures[future]] = result
+                if self.is_stopped():
+                    # 尚未开始的页不再请求，进行中的请求受 API 超时限制
+                    for future in pending:
+                        future.cancel()
+                    break
+
+        if self.is_stopped():
+            self._emit_log(f"[停止] 照片获取任务已停止，相册 '{album.name}' 的照片列表可能不完整。")
+        return pages
+
+    def plan_downloads_for_user(self, dest_user_qq: str, head: bool = False) -> dict:
+        """
+        试运行：列举目标用户的相册与照片并与本地状态比对，不下载任何文件。
+
+        Args:
+            dest_user_qq: 目标用户 QQ 号
+            head:         为 True 时并发发送 HEAD 请求获取待下载文件的大小
+                          （视频需先调用 API 解析真实下载地址）
+
+        Returns:
+            dict: albums / photos / videos / present / new_photos / new_videos /
+                  new_photo_bytes / new_video_bytes / unknown_size（HEAD 未取得大小的新文件数）
+        """
+        summary = {
+            "albums": 0,
+            "photos": 0,
+            "videos": 0,
+            "present": 0,
+            "new_photos": 0,
+            "new_videos": 0,
+            "new_photo_bytes": 0,
+            "new_video_bytes": 0,
+            "unknown_size": 0,
+        }
+        albums = self.get_albums_by_page(dest_user_qq)
+        user_save_dir = get_save_directory(dest_user_qq)
+        archive_mode = APP_CONFIG.get("output_mode", "files") in ARCHIVE_MODES
+        pending: list[tuple[QzoneAlbum, QzonePhoto]] = []
 
-            if len(photos) >= total_in_album or photos_in_page == 0:
+        window = get_date_window()
+        for album in albums:
+            if self.is_stopped():
                 break
+            if not is_album_selected(album):
+                continue
+            if window is not None and not album_may_overlap(album, window):
+                continue
+            summary["albums"] += 1
+            album_dir_name = sanitize_filename_component(album.name.strip())
+            album_save_path = os.path.join(user_save_dir, album_dir_name)
+            archive_names = None
+            if archive_mode:
+                archive_names = AlbumArchiveWriter.read_member_names(
+                    f"{album_save_path}.{APP_CONFIG['output_mode']}"
+                )
 
-            page_start += photos_in_page
+            photos = self.get_photos_from_album(dest_user_qq, album)
+            if photos is None:
+                self._emit_log(f"[错误] 未能获取相册 '{album.name}' 的照片列表，统计中不包含该相册。")
+                continue
+            for photo_idx, photo in enumerate(photos):
+                if window is not None and not photo_in_window(photo, window):
+                    continue
+                summary["videos" if photo.is_video else "photos"] += 1
+                base_filename = photo_base_filename(photo_idx, photo)
+                if find_saved_photo(album_save_path, base_filename, photo.is_video, archive_names):
+                    summary["present"] += 1
+                    continue
+                summary["new_videos" if photo.is_video else "new_photos"] += 1
+                pending.append((album, photo))
+
+        if head and pending and not self.is_stopped():
+            self._emit_log(f"正在通过 HEAD 请求获取 {len(pending)} 个新文件的大小...")
+            with ThreadPoolExecutor(max_workers=APP_CONFIG["max_workers"]) as executor:
+                sizes = executor.map(
+                    lambda item: self._head_content_length(dest_user_qq, *item), pending
+                )
+                for (album, photo), size in zip(pending, sizes):
+                    if size is None:
+                        summary["unknown_size"] += 1
+                    elif photo.is_video:
+                        summary["new_video_bytes"] += size
+                    else:
+                        summary["new_photo_bytes"] += size
+        else:
+            summary["unknown_size"] = len(pending)
+        return summary
 
-        return photos
+    def _head_content_length(
+        self, dest_user_qq: str, album: QzoneAlbum, photo: QzonePhoto
+    ) -> int | None:
+        """
+        发送 HEAD 请求获取文件大小，失败或服务端未返回 Content-Length 时返回 None。
+        HLS 视频的播放列表大小不代表视频大小，不发送请求，同样返回 None。
+        """
+        if self.is_stopped():
+            return None
+        url = photo.url
+        if photo.is_video:
+            url = self.get_video_download_url(dest_user_qq, album.uid, photo.pic_key) or url
+        url = url.replace("\\", "")
+        if is_hls_url(url):
+            return None
+        with_cookies = self.host_cookie_policy.plan(url)[0] and bool(self.cookies)
+        try:
+            response = get_download_session().head(
+                url,
+                cookies=self.cookies if with_cookies else None,
+                timeout=get_download_timeout(),
+                allow_redirects=True,
+            )
+            response.raise_for_status()
+            return int(response.headers["Content-Length"])
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            return None
 
     def download_all_photos_for_user(
         self,
         dest_user_qq: str,
         progress_func=None,
-    ) -> None:
+        resume: bool = False,
+        processes: int | None = None,
+        refresh: bool = False,
+    ) -> dict[str, int]:
         """
-        下载目标用户所有可访问的照片。
+        下载目标用户所有可访问的照片，返回各任务结果（TASK_DONE 等）的数量。
 
         Args:
             dest_user_qq:  目标用户 QQ 号
             progress_func: 可选，callable(int)，接收负数表示任务总量，正数 1 表示完成一个
+            resume:        为 True 时从任务日志（journal）继续上次中断的运行，
+                           已记录的相册与照片列表不再调用列举 API
+            processes:     大于 1 时按相册把下载分给多个子进程并行执行，
+                           默认使用配置项 processes
+            refresh:       为 True 时对已保存且记录了 ETag / Last-Modified 的文件发送条件请求，
+                           远端未变化（304）时跳过，已被替换时重新下载并覆盖
         """
-        albums = self.get_albums_by_page(dest_user_qq)
+        user_save_dir = get_save_directory(dest_user_qq)
+        os.makedirs(user_save_dir, exist_ok=True)
+        self.transfers.reset()  # 上一次运行中断传输后的停止状态不影响本次运行
+        self.refresh_existing = refresh
+        self.listing_failures = 0
+        self._log_date_window()
+
+        if processes is None:
+            processes = APP_CONFIG.get("processes", 1)
+        journal = DownloadJournal.for_user(dest_user_qq)
+        state = journal.load() if resume else None
+        if state is not None and state.complete:
+            self._emit_log(f"用户 {dest_user_qq} 的上次运行已完整结束，将重新列举相册。")
+            state = None
+        if state is not None and state.albums is None:
+            self._emit_log(f"未找到用户 {dest_user_qq} 可续传的任务日志，将从头开始。")
+            state = None
+        journal.open(truncate=state is None)
+        if APP_CONFIG.get("output_mode", "files") not in ARCHIVE_MODES:
+            self.manifest = DownloadManifest.for_user(dest_user_qq)
+            self.manifest.open()
+
+        try:
+            return self._download_all_photos_with_journal(
+                dest_user_qq, progress_func, journal, state, processes
+            )
+        finally:
+            journal.close()
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+            self.refresh_existing = False
+            self.host_cookie_policy.save()
+
+    def sync_user(self, dest_user_qq: str, progress_func=None) -> dict[str, int]:
+        """
+        增量同步目标用户（watch 模式使用），返回各任务结果的数量。
+
+        强制重新获取相册列表并与上次的同步快照比较：没有变化时本轮只消耗相册列表
+        请求；有变化的相册重新列举（列表缓存随照片数/修改时间变化自动失效），
+        只为快照中没有的照片创建下载任务。首次同步时以文件清单中的记录作为已完成照片。
+        """
+        os.makedirs(get_save_directory(dest_user_qq), exist_ok=True)
+        self.transfers.reset()
+        self.listing_failures = 0
+        self._log_date_window()
+        albums = self.get_albums_by_page(dest_user_qq, use_cache=False)
+        if not albums:
+            self._emit_log(f"未找到用户 {dest_user_qq} 的相册或无法访问。")
+            return {}
+
+        snapshot = SyncSnapshot.for_user(dest_user_qq)
+        snapshot.load()
+        known_keys = snapshot.known_keys()
+        if not snapshot.albums:
+            known_keys |= {
+                entry["key"]
+                for entry in DownloadManifest.for_user(dest_user_qq).load().values()
+                if entry.get("key")
+            }
+        snapshot.prune(albums)
+        window = get_date_window()
+        changed = [
+            album
+            for album in albums
+            if is_album_selected(album) and snapshot.is_changed(album, window)
+        ]
+        if not changed:
+            self._emit_log(f"[同步] 用户 {dest_user_qq} 的 {len(albums)} 个相册均无变化。")
+            snapshot.save()
+            return {}
+        self._emit_log(
+            f"[同步] 用户 {dest_user_qq} 有 {len(changed)} 个相册发生变化: "
+            + "、".join(f"'{album.name}'" for album in changed)
+        )
+
+        # 任务日志只记录本轮有变化的相册，中断后 --resume 同样只处理这些相册
+        journal = DownloadJournal.for_user(dest_user_qq)
+        journal.open(truncate=True)
+        journal.record_albums(changed)
+        if APP_CONFIG.get("output_mode", "files") not in ARCHIVE_MODES:
+            self.manifest = DownloadManifest.for_user(dest_user_qq)
+            self.manifest.open()
+        try:
+            state = JournalState(None, {}, dict.fromkeys(known_keys, TASK_DONE), False)
+            tasks: list[PhotoTask] = []
+            listed: dict[str, set[str]] = {}
+            for album_index, album in enumerate(albums):
+                if self.is_stopped():
+                    break
+                if album in changed:
+                    album_tasks, _ = self._collect_album_tasks(
+                        dest_user_qq, album_index, album, progress_func, journal, state, listed
+                    )
+                    tasks.extend(album_tasks)
+
+            outcome_counts: dict[str, int] = {}
+            if tasks:
+                if progress_func:
+                    progress_func(-len(tasks))
+                outcome_counts = self._run_photo_tasks(tasks, journal)
+            else:
+                self._emit_log(f"[同步] 用户 {dest_user_qq} 没有新照片。")
+
+            # 以本轮列举到的窗口内照片与任务日志中的结果更新快照；
+            # 列举失败或被中断而未处理完的相册保持原状
+            result = journal.load()
+            for album in changed:
+                album_keys = listed.get(album.uid)
+                if album_keys is None:
+                    continue
+                done_keys = {
+                    key
+                    for key in album_keys
+                    if key in known_keys or result.outcomes.get(key) in (TASK_DONE, TASK_SKIPPED)
+                }
+                complete = done_keys == album_keys
+                if window is not None:
+                    # 窗口外的照片本轮没有检查，保留之前已完成的记录
+                    prefix = f"{album.uid}/"
+                    done_keys |= {key for key in known_keys if key.startswith(prefix)}
+                snapshot.update_album(album, done_keys, complete, window)
+            snapshot.save()
+
+            if (
+                not self.is_stopped()
+                and not outcome_counts.get(TASK_FAILED)
+                and not self.listing_failures
+            ):
+                journal.mark_complete()
+            self._emit_log(
+                f"[同步] 用户 {dest_user_qq}: 新下载 {outcome_counts.get(TASK_DONE, 0)}，"
+                f"已存在 {outcome_counts.get(TASK_SKIPPED, 0)}，失败 {outcome_counts.get(TASK_FAILED, 0)}"
+            )
+            return outcome_counts
+        finally:
+            journal.close()
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+            self.host_cookie_policy.save()
+
+    def _download_all_photos_with_journal(
+        self,
+        dest_user_qq: str,
+        progress_func,
+        journal: DownloadJournal,
+        state: JournalState | None,
+        processes: int = 1,
+    ) -> dict[str, int]:
+        """download_all_photos_for_user 的主体；state 不为 None 时表示续传。"""
+        if state is not None:
+            albums = state.albums
+            self._emit_log(f"[续传] 从任务日志恢复用户 {dest_user_qq} 的 {len(albums)} 个相册。")
+        else:
+            albums = self.get_albums_by_page(dest_user_qq)
+            if albums and not self.is_stopped():
+                journal.record_albums(albums)
         if not albums:
             self._emit_log(f"未找到用户 {dest_user_qq} 的相册或无法访问。")
             if progress_func:
                 progress_func(0)
-            return
+            return {}
 
         self._emit_log(f"为用户 {dest_user_qq} 找到 {len(albums)} 个相册:")
         for i, album_item in enumerate(albums):
@@ -1171,72 +5386,538 @@ class QzonePhotoManager:
                 f"  {i+1}. {album_item.name} (ID: {album_item.uid}, 照片数量: {album_item.count})"
             )
 
-        all_photo_tasks = []
-        user_save_dir = get_save_directory(dest_user_qq)
-        os.makedirs(user_save_dir, exist_ok=True)
+        if processes > 1 and len(albums) > 1:
+            outcome_counts = self._download_albums_sharded(
+                dest_user_qq, albums, progress_func, journal, state, processes
+            )
+            if not sum(outcome_counts.values()):
+                self._emit_log(f"没有为用户 {dest_user_qq} 下载的照片。")
+                if progress_func:
+                    progress_func(0)
+        else:
+            all_photo_tasks: list[PhotoTask] = []
+            resumed_done = 0
+            for album_index, album in enumerate(albums):
+                if self.is_stopped():
+                    self._emit_log("[停止] 相册处理任务已停止，跳过后续相册。")
+                    break
+                album_tasks, album_resumed = self._collect_album_tasks(
+                    dest_user_qq, album_index, album, progress_func, journal, state
+                )
+                all_photo_tasks.extend(album_tasks)
+                resumed_done += album_resumed
 
-        for album_index, album in enumerate(albums):
-            if self.is_stopped_func():
-                self._emit_log("[停止] 相册处理任务已停止，跳过后续相册。")
-                break
+            if resumed_done:
+                self._emit_log(f"[续传] 任务日志中已有 {resumed_done} 张照片完成，跳过。")
 
-            if album.name in APP_CONFIG.get("exclude_albums", []):
-                self._emit_log(f"跳过排除的相册: '{album.name}'")
-                continue
+            if not all_photo_tasks:
+                self._emit_log(f"没有为用户 {dest_user_qq} 下载的照片。")
+                if progress_func:
+                    progress_func(0)
+                if not self.is_stopped() and not self.listing_failures:
+                    journal.mark_complete()
+                return {}
 
+            if progress_func:
+                progress_func(-len(all_photo_tasks))
+            outcome_counts = self._run_photo_tasks(all_photo_tasks, journal)
+
+        self._emit_log(
+            f"用户 {dest_user_qq} 下载结果: 成功 {outcome_counts.get(TASK_DONE, 0)}，"
+            f"已存在 {outcome_counts.get(TASK_SKIPPED, 0)}，失败 {outcome_counts.get(TASK_FAILED, 0)}，"
+            f"停止 {outcome_counts.get(TASK_STOPPED, 0)}"
+        )
+        log_event("user", user=dest_user_qq, outcomes=outcome_counts)
+
+        if not self.is_stopped():
+            # 存在失败任务或未能列举的相册时不标记完成，便于 --resume 仅重试这些部分
+            if not outcome_counts.get(TASK_FAILED) and not self.listing_failures:
+                journal.mark_complete()
+            self._emit_log(f"\n完成处理用户 {dest_user_qq} 的所有照片。")
+        return outcome_counts
+
+    def _collect_album_tasks(
+        self,
+        dest_user_qq: str,
+        album_index: int,
+        album: QzoneAlbum,
+        progress_func,
+        journal: DownloadJournal,
+        state: JournalState | None,
+        listed: dict[str, set[str]] | None = None,
+    ) -> tuple[list[PhotoTask], int]:
+        """
+        列举单个相册（续传时从任务日志恢复）并生成下载任务。
+
+        listed 不为 None 时，相册完整处理后把日期窗口内照片的任务键记入 listed[相册 ID]，
+        供同步快照判断相册是否已全部完成；列举失败或被停止时不记录。
+
+        Returns:
+            tuple: (待执行的任务列表, 任务日志中已完成而跳过的数量)
+        """
+        if not is_album_selected(album):
+            self._emit_log(f"跳过排除的相册: '{album.name}'")
+            return [], 0
+        window = get_date_window()
+        if window is not None and not album_may_overlap(album, window):
+            self._emit_log(f"[筛选] 相册 '{album.name}' 最后修改时间早于日期下限，跳过。")
+            if listed is not None:
+                listed[album.uid] = set()
+            return [], 0
+
+        if APP_CONFIG.get("output_mode", "files") not in ARCHIVE_MODES:
             album_path = os.path.join(
-                user_save_dir, sanitize_filename_component(album.name.strip())
+                get_save_directory(dest_user_qq), sanitize_filename_component(album.name.strip())
             )
             try:
                 os.makedirs(album_path, exist_ok=True)
             except OSError as e:
                 self._emit_log(f"为相册 '{album.name}' 创建目录时出错: {e}。跳过此相册。")
-                continue
+                return [], 0
 
+        if state is not None and album.uid in state.photos:
+            photos_in_album = state.photos[album.uid]
+            self._emit_log(
+                f"\n[续传] 相册 '{album.name}' 从任务日志恢复 {len(photos_in_album)} 个照片条目。"
+            )
+        else:
             self._emit_log(f"\n正在获取相册 '{album.name}' 的照片 (预计 {album.count} 张)...")
-            photos_in_album = self.get_photos_from_album(dest_user_qq, album)
+            listing = self.list_album_photos(dest_user_qq, album)
+            if listing is None:
+                # 获取失败与空相册不同：不写入任务日志，续传时重新列举该相册
+                if not self.is_stopped():
+                    self.listing_failures += 1
+                    self._emit_log(
+                        f"[错误] 未能获取相册 '{album.name}' 的照片列表，跳过，续传时将重新列举。"
+                    )
+                return [], 0
+            photos_in_album, complete = listing
+            # 因日期下限只列举了一部分的相册不能当作完整列表写入任务日志或替换元数据，
+            # 续传与同步时重新列举（有日期下限时只需很少的请求）
+            if complete and not self.is_stopped():
+                journal.record_photos(album, photos_in_album)
+                self._export_metadata(dest_user_qq, album, photos_in_album)
             self._emit_log(
                 f"为相册 '{album.name}' 找到 {len(photos_in_album)} 个照片条目。准备下载。"
             )
 
-            for photo_idx, photo_item in enumerate(photos_in_album):
-                if self.is_stopped_func():
-                    self._emit_log(
-                        f"[停止] 照片任务添加已停止，跳过相册 '{album.name}' 中的剩余照片。"
-                    )
-                    break
-                all_photo_tasks.append(
-                    (
-                        dict(self.cookies),
-                        dest_user_qq,
-                        album_index,
-                        album.name,
-                        photo_idx,
-                        photo_item,
-                        self.log_signal.emit if self.log_signal else None,
-                        progress_func,
-                        self.is_stopped_func,
-                        self,
-                        album.uid,
-                        dest_user_qq,
-                    )
+        tasks: list[PhotoTask] = []
+        resumed_done = 0
+        outside_window = 0
+        window_keys: set[str] = set()
+        for photo_idx, photo_item in enumerate(photos_in_album):
+            if self.is_stopped():
+                self._emit_log(
+                    f"[停止] 照片任务添加已停止，跳过相册 '{album.name}' 中的剩余照片。"
                 )
-
-        if not all_photo_tasks:
-            self._emit_log(f"没有为用户 {dest_user_qq} 下载的照片。")
-            if progress_func:
-                progress_func(0)
+                break
+            # 跳过窗口外的照片但保留序号，文件名与完整下载时一致
+            if window is not None and not photo_in_window(photo_item, window):
+                outside_window += 1
+                continue
+            task_key = photo_task_key(album.uid, photo_item)
+            window_keys.add(task_key)
+            if state is not None and state.outcomes.get(task_key) in (TASK_DONE, TASK_SKIPPED):
+                resumed_done += 1
+                continue
+            tasks.append(
+                PhotoTask(
+                    request_cookies=dict(self.cookies),
+                    user_qq=dest_user_qq,
+                    album_index=album_index,
+                    album_name=album.name,
+                    photo_index=photo_idx,
+                    photo=photo_item,
+                    log_func=self.log_signal.emit if self.log_signal else None,
+                    progress_func=progress_func,
+                    is_stopped_func=self.is_stopped,
+                    qzone_manager=self,
+                    album_id=album.uid,
+                    dest_user_qq=dest_user_qq,
+                )
+            )
+        else:
+            if listed is not None:
+                listed[album.uid] = window_keys
+        if outside_window:
+            self._emit_log(f"[筛选] 相册 '{album.name}' 中 {outside_window} 张照片不在日期范围内，跳过。")
+        return tasks, resumed_done
+
+    def _log_date_window(self) -> None:
+        """输出生效的日期筛选；配置无法解析时在开始下载前抛出 ValueError。"""
+        window = get_date_window()
+        if window is not None:
+            self._emit_log(f"[筛选] 只处理{describe_date_window(window)}的照片。")
+
+    def _export_metadata(
+        self, dest_user_qq: str, album: QzoneAlbum, photos: list[QzonePhoto]
+    ) -> None:
+        """把刚列举的相册写入元数据数据库；失败只记录日志，不影响下载。"""
+        if self.metadata_store is None:
             return
+        try:
+            self.metadata_store.write_album(dest_user_qq, album, photos)
+        except (sqlite3.Error, OSError) as e:
+            self._emit_log(
+                f"[元数据] 写入相册 '{album.name}' 的元数据失败: {e}", level=logging.WARNING
+            )
 
+    def _run_photo_tasks(self, tasks: list[PhotoTask], journal: DownloadJournal) -> dict[str, int]:
+        """用 DownloadScheduler 执行下载任务，结果写入任务日志，返回各结果的计数。"""
+        lane_workers = get_lane_workers()
         self._emit_log(
-            f"\n开始下载 {len(all_photo_tasks)} 张照片，"
-            f"使用 {APP_CONFIG['max_workers']} 个线程..."
+            f"\n开始下载 {len(tasks)} 张照片，"
+            f"图片 {lane_workers[LANE_IMAGE]} 个线程，视频解析 {lane_workers[LANE_VIDEO_RESOLVE]} 个线程，"
+            f"视频传输 {lane_workers[LANE_VIDEO]} 个线程..."
+        )
+
+        def _record_outcome(task: PhotoTask, outcome: str) -> None:
+            if outcome != TASK_STOPPED:
+                journal.record_outcome(photo_task_key(task.album_id, task.photo), outcome)
+
+        def _on_stop() -> None:
+            aborted = self.transfers.abort_all()
+            # 立即落盘已完成任务的记录，之后即使进程被强制结束也能续传
+            journal.sync()
+            if self.manifest is not None:
+                self.manifest.sync()
+            self._emit_log(f"[停止] 已中断 {aborted} 个进行中的传输，任务日志已保存。")
+
+        scheduler = DownloadScheduler(
+            lane_workers,
+            self.is_stopped,
+            on_outcome=_record_outcome,
+            order=APP_CONFIG.get("task_order", "album"),
+            on_stop=_on_stop,
         )
-        if progress_func:
-            progress_func(-len(all_photo_tasks))
+        hedge_before = self.hedger.snapshot()
+        try:
+            outcome_counts = scheduler.run(tasks)
+        finally:
+            self.close_archives()
+
+        if scheduler.stop_latency is not None:
+            self._emit_log(f"[停止] 下载已在 {scheduler.stop_latency:.1f}s 内停止。")
+        metrics_summary = scheduler.metrics.format_summary()
+        if metrics_summary:
+            self._emit_log(f"阶段耗时: {metrics_summary}")
+        hedge_stats = self.hedger.snapshot()
+        hedged = hedge_stats["hedged"] - hedge_before["hedged"]
+        if hedged:
+            requests_made = hedge_stats["requests"] - hedge_before["requests"]
+            self._emit_log(
+                f"对冲请求 {hedged} 次（占请求 {hedged / max(requests_made, 1):.1%}），"
+                f"其中 {hedge_stats['hedge_wins'] - hedge_before['hedge_wins']} 次先于原请求返回"
+            )
+        if self.byte_budget.capacity > 0:
+            self._emit_log(
+                f"下载缓冲峰值 {self.byte_budget.peak / (1024 * 1024):.1f} MB"
+                f" / 预算 {self.byte_budget.capacity / (1024 * 1024):.0f} MB，"
+                f"等待预算累计 {self.byte_budget.wait_seconds:.1f}s"
+            )
+        return outcome_counts
 
-        with ThreadPoolExecutor(max_workers=APP_CONFIG["max_workers"]) as executor:
-            list(executor.map(save_photo_worker, all_photo_tasks))
+    def _download_albums_sharded(
+        self,
+        dest_user_qq: str,
+        albums: list[QzoneAlbum],
+        progress_func,
+        journal: DownloadJournal,
+        state: JournalState | None,
+        processes: int,
+    ) -> dict[str, int]:
+        """
+        以相册为单位把下载分给 processes 个子进程，返回汇总的结果计数。
 
-        if not self.is_stopped_func():
-            self._emit_log(f"\n完成处理用户 {dest_user_qq} 的所有照片。")
+        相册按照片数从多到少放入共享队列，子进程空闲时领取下一个相册，各自使用
+        独立的连接池与调度器。子进程的日志、进度、结果，以及任务日志、文件清单与
+        主机 cookie 策略的记录都通过事件队列回传，由主进程汇总并作为唯一的写入方。
+        """
+        ctx = multiprocessing.get_context("spawn")
+        work_queue = ctx.Queue()
+        event_queue = ctx.Queue()
+        stop_event = ctx.Event()
+
+        order = sorted(range(len(albums)), key=lambda i: albums[i].count, reverse=True)
+        for album_index in order:
+            album = albums[album_index]
+            if not is_album_selected(album):
+                self._emit_log(f"跳过排除的相册: '{album.name}'")
+                continue
+            photos = state.photos.get(album.uid) if state is not None else None
+            done_keys = []
+            if state is not None:
+                prefix = f"{album.uid}/"
+                done_keys = [
+                    key
+                    for key, outcome in state.outcomes.items()
+                    if key.startswith(prefix) and outcome in (TASK_DONE, TASK_SKIPPED)
+                ]
+            work_queue.put((album_index, album, photos, done_keys))
+
+        self._emit_log(f"\n使用 {processes} 个进程按相册并行下载...")
+        shard_config = _shard_app_config(processes)
+        workers = [
+            ctx.Process(
+                target=_shard_worker_main,
+                args=(
+                    shard_index,
+                    shard_config,
+                    self.user_qq,
+                    dict(self.cookies),
+                    str(self.qzone_g_tk),
+                    dest_user_qq,
+                    work_queue,
+                    event_queue,
+                    stop_event,
+                    self.refresh_existing,
+                ),
+                name=f"qzone-shard-{shard_index}",
+                daemon=True,
+            )
+            for shard_index in range(processes)
+        ]
+        for _ in workers:
+            work_queue.put(None)
+        for worker in workers:
+            worker.start()
+
+        outcome_counts: dict[str, int] = {}
+        total_tasks = 0
+        finished = 0
+
+        def _handle(event: tuple) -> None:
+            nonlocal total_tasks, finished
+            kind = event[0]
+            if kind == "log":
+                self._emit_log(event[1])
+            elif kind == "progress":
+                if not progress_func:
+                    return
+                # 子进程各自报告任务量（负数），主进程累加后以总量转发
+                if event[1] < 0:
+                    total_tasks -= event[1]
+                    progress_func(-total_tasks)
+                elif event[1] > 0:
+                    progress_func(event[1])
+            elif kind == "event":
+                log_event(event[1], **event[2])
+            elif kind == "journal":
+                journal.apply(event[1])
+            elif kind == "manifest":
+                if self.manifest is not None:
+                    self.manifest.apply(event[1])
+            elif kind == "cookie":
+                self.host_cookie_policy.record(*event[1:])
+            elif kind == "counts":
+                for outcome, count in event[1].items():
+                    outcome_counts[outcome] = outcome_counts.get(outcome, 0) + count
+            elif kind == "listing_failures":
+                self.listing_failures += event[1]
+            elif kind == "exit":
+                finished += 1
+
+        try:
+            while finished < len(workers):
+                if self.is_stopped() and not stop_event.is_set():
+                    self._emit_log("[停止] 正在通知下载子进程停止...")
+                    stop_event.set()
+                try:
+                    _handle(event_queue.get(timeout=DownloadScheduler.STOP_POLL_INTERVAL))
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+        except BaseException:
+            # 主进程被中断（如 Ctrl+C）时通知子进程停止，再等待其写完日志退出
+            stop_event.set()
+            raise
+        finally:
+            # 子进程退出前要把已写入事件队列的数据送进管道，管道满时会一直阻塞，
+            # 因此等待退出期间也要持续读取事件，不能直接 join
+            while any(worker.is_alive() for worker in workers):
+                try:
+                    _handle(event_queue.get(timeout=DownloadScheduler.STOP_POLL_INTERVAL))
+                except queue.Empty:
+                    pass
+            for worker in workers:
+                worker.join()
+            # 子进程退出前写入的事件可能尚未读取
+            while True:
+                try:
+                    _handle(event_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        crashed = [worker.name for worker in workers if worker.exitcode not in (0, None)]
+        if crashed:
+            self._emit_log(f"[错误] 下载子进程异常退出: {', '.join(crashed)}，可使用 --resume 继续。")
+            outcome_counts[TASK_FAILED] = outcome_counts.get(TASK_FAILED, 0) or 1
+        return outcome_counts
+
+
+class ScopedQzonePhotoManager(QzonePhotoManager):
+    """由 QzonePhotoManager.for_job() 创建的任务级管理器，登录态始终读写父实例。"""
+
+    def __init__(self, parent: QzonePhotoManager, log_signal=None, is_stopped_func=None):
+        # 不调用父类 __init__：全局资源直接复用父实例的对象
+        self._parent = parent
+        self.user_qq = parent.user_qq
+        self.session = parent.session
+        self.reauth_hook = parent.reauth_hook
+        self.auth_breaker = parent.auth_breaker
+        self.listing_cache = parent.listing_cache
+        self.api_limiter = parent.api_limiter
+        self.host_cookie_policy = parent.host_cookie_policy
+        self.byte_budget = parent.byte_budget
+        self.hedger = parent.hedger
+        self.log_signal = log_signal
+        self.is_stopped_func = is_stopped_func if is_stopped_func is not None else (lambda: False)
+        self.transfers = ActiveTransfers()
+        self.manifest = None
+        self.metadata_store = parent.metadata_store
+        self.refresh_existing = False
+        self.listing_failures = 0
+        self.total_albums = 0
+        self._archives = {}
+        self._archives_lock = threading.Lock()
+
+    def close(self) -> None:
+        """共享的全局资源由父实例关闭。"""
+
+    # 重新登录由父实例完成，任务级管理器读取的 cookie 与 g_tk 必须随之更新
+    @property
+    def cookies(self) -> dict:
+        return self._parent.cookies
+
+    @cookies.setter
+    def cookies(self, value: dict) -> None:
+        self._parent.cookies = value
+
+    @property
+    def qzone_g_tk(self):
+        return self._parent.qzone_g_tk
+
+    @qzone_g_tk.setter
+    def qzone_g_tk(self, value) -> None:
+        self._parent.qzone_g_tk = value
+
+
+# ---------------------------------------------------------------------------
+# 多进程分片
+# ---------------------------------------------------------------------------
+
+
+class _QueueLogSignal:
+    """子进程中代替 GUI 日志信号，把日志通过事件队列发回主进程。"""
+
+    def __init__(self, event_queue, prefix: str):
+        self._queue = event_queue
+        self._prefix = prefix
+
+    def emit(self, message: str) -> None:
+        self._queue.put(("log", f"{self._prefix}{message}"))
+
+
+class _QueueEventHandler(logging.Handler):
+    """子进程中把结构化事件通过事件队列发回主进程，由主进程的 LogPipeline 写入。"""
+
+    def __init__(self, event_queue):
+        super().__init__()
+        self._queue = event_queue
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._queue.put(("event", record.getMessage(), getattr(record, "event_fields", {})))
+
+
+def _shard_app_config(processes: int) -> dict:
+    """
+    子进程使用的配置。API 并发数、速率与内存预算是整个下载共用的总量，按进程数平分，
+    使多进程下载时的总请求速率与内存占用不超过配置的上限（每个进程至少保留 1 个并发）。
+    """
+    config = dict(APP_CONFIG)
+    rate = float(config.get("api_rate_limit", 5))
+    if rate > 0:
+        config["api_rate_limit"] = rate / processes
+    config["api_max_concurrency"] = max(1, int(config.get("api_max_concurrency", 4)) // processes)
+    budget_mb = float(config.get("memory_budget_mb", 256))
+    if budget_mb > 0:
+        config["memory_budget_mb"] = budget_mb / processes
+    return config
+
+
+def _shard_worker_main(
+    shard_index: int,
+    app_config: dict,
+    user_qq: str,
+    cookies: dict,
+    g_tk: str,
+    dest_user_qq: str,
+    work_queue,
+    event_queue,
+    stop_event,
+    refresh: bool = False,
+) -> None:
+    """
+    下载子进程入口：用主进程的登录信息重建管理器，循环领取相册并下载。
+
+    子进程无法弹出浏览器重新登录，登录态失效时停止本进程，由用户稍后续传。
+    任务日志、文件清单与主机 cookie 策略不在子进程中写入，记录经事件队列交给主进程。
+    """
+    APP_CONFIG.update(app_config)
+    apply_log_level()
+    if APP_CONFIG.get("event_log"):
+        event_logger.addHandler(_QueueEventHandler(event_queue))
+        event_logger.setLevel(logging.INFO)
+    manager = QzonePhotoManager(
+        user_qq,
+        log_signal=_QueueLogSignal(event_queue, f"[进程 {shard_index}] "),
+        is_stopped_func=stop_event.is_set,
+        reauth_hook=lambda _manager: False,
+    )
+    manager.cookies = cookies
+    manager.qzone_g_tk = g_tk
+    manager.refresh_existing = refresh
+    for name, value in cookies.items():
+        manager.session.cookies.set(name, value)
+
+    def _progress(value: int) -> None:
+        event_queue.put(("progress", value))
+
+    journal = DownloadJournal.for_user(dest_user_qq)
+    journal.forward_to(lambda record: event_queue.put(("journal", record)))
+    if APP_CONFIG.get("output_mode", "files") not in ARCHIVE_MODES:
+        manager.manifest = DownloadManifest.for_user(dest_user_qq)
+        manager.manifest.load()
+        manager.manifest.forward_to(lambda record: event_queue.put(("manifest", record)))
+    manager.host_cookie_policy.forward_to(lambda *args: event_queue.put(("cookie", *args)))
+
+    outcome_counts: dict[str, int] = {}
+    try:
+        while not manager.is_stopped():
+            item = work_queue.get()
+            if item is None:
+                break
+            album_index, album, photos, done_keys = item
+            state = JournalState(
+                albums=None,
+                photos={album.uid: photos} if photos is not None else {},
+                outcomes=dict.fromkeys(done_keys, TASK_DONE),
+                complete=False,
+            )
+            tasks, resumed_done = manager._collect_album_tasks(
+                dest_user_qq, album_index, album, _progress, journal, state
+            )
+            if resumed_done:
+                manager._emit_log(
+                    f"[续传] 相册 '{album.name}' 中已有 {resumed_done} 张照片完成，跳过。"
+                )
+            if not tasks:
+                continue
+            _progress(-len(tasks))
+            for outcome, count in manager._run_photo_tasks(tasks, journal).items():
+                outcome_counts[outcome] = outcome_counts.get(outcome, 0) + count
+    finally:
+        manager.close()
+        event_queue.put(("listing_failures", manager.listing_failures))
+        event_queue.put(("counts", outcome_counts))
+        event_queue.put(("exit", shard_index))
@@ -0,0 +1,453 @@
+"""
+QQ空间相册照片下载器 - 常驻服务入口
+
+启动时登录一次，之后保持同一个 QzonePhotoManager（连接池、列表缓存、登录态）常驻，
+通过仅监听本机的 HTTP/JSON 接口接收下载任务：
+
+  POST   /jobs               提交任务，请求体 {"users": ["123456"], "resume": false}
+  GET    /jobs               列出所有任务
+  GET    /jobs/<id>          查询任务进度与统计
+  POST   /jobs/<id>/cancel   取消任务（DELETE /jobs/<id> 等价）
+  GET    /status             服务状态
+
+多个任务可同时运行，共享 API 限流、内存预算与登录态；同一目标用户的任务依次执行。
+
+每次启动生成一个随机令牌并打印，所有请求须带 "Authorization: Bearer <令牌>"；
+POST 请求须声明 "Content-Type: application/json"，使网页无法通过跨站的简单请求提交任务。
+
+使用方法:
+  python daemon.py [--host 127.0.0.1] [--port 8765] [--max-jobs 2]
+"""
+
+import argparse
+import atexit
+import hmac
+import itertools
+import json
+import logging
+import secrets
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core import (
+    APP_CONFIG,
+    TASK_DONE,
+    TASK_FAILED,
+    TASK_SKIPPED,
+    TASK_STOPPED,
+    USER_CONFIG,
+    ActiveTransfers,
+    LogPipeline,
+    QzonePhotoManager,
+    load_config,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+logger = logging.getLogger(__name__)
+
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+class DownloadJob:
+    """一个下载任务：若干目标用户的下载，记录进度、结果与最近的日志。"""
+
+    LOG_TAIL = 50  # 保留的最近日志条数
+
+    def __init__(self, job_id: str, users: list[str], resume: bool):
+        self.id = job_id
+        self.users = users
+        self.resume = resume
+        self.state = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.current_user: str | None = None
+        self.error: str | None = None
+        self.results: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self.transfers: ActiveTransfers | None = None  # 运行中任务的传输，取消时中断
+        self._totals: dict[str, int] = {}
+        self._completed = 0
+        self._logs: deque[str] = deque(maxlen=self.LOG_TAIL)
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        with self._lock:
+            transfers = self.transfers
+        if transfers is not None:
+            transfers.abort_all()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def emit(self, message: str) -> None:
+        """作为管理器的 log_signal 使用。"""
+        with self._lock:
+            self._logs.append(message)
+
+    def progress(self, value: int) -> None:
+        """作为 progress_func 使用：负数为当前用户的任务总量，1 表示完成一个任务。"""
+        with self._lock:
+            if value < 0 and self.current_user is not None:
+                self._totals[self.current_user] = -value
+            elif value > 0:
+                self._completed += value
+
+    def to_dict(self, with_logs: bool = False) -> dict:
+        with self._lock:
+            counts: dict[str, int] = {}
+            for user_counts in self.results.values():
+                for outcome, count in user_counts.items():
+                    counts[outcome] = counts.get(outcome, 0) + count
+            end = self.finished_at or time.time()
+            data = {
+                "id": self.id,
+                "users": self.users,
+                "resume": self.resume,
+                "state": self.state,
+                "current_user": self.current_user,
+                "total": sum(self._totals.values()),
+                "completed": self._completed,
+                "downloaded": counts.get(TASK_DONE, 0),
+                "skipped": counts.get(TASK_SKIPPED, 0),
+                "failed": counts.get(TASK_FAILED, 0),
+                "stopped": counts.get(TASK_STOPPED, 0),
+                "results": {user: dict(c) for user, c in self.results.items()},
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed": round(end - self.started_at, 1) if self.started_at else 0,
+                "error": self.error,
+            }
+            if with_logs:
+                data["logs"] = list(self._logs)
+            return data
+
+
+class DownloadDaemon:
+    """
+    任务调度：在 max_jobs 个线程中并发执行任务，每个任务使用 manager.for_job()
+    创建的任务级管理器，共享登录态与全局限额。同一目标用户同一时刻只有一个任务在下载。
+    """
+
+    USER_LOCK_POLL_INTERVAL = 0.5  # 秒，等待同一用户的其他任务时检查取消的间隔
+
+    def __init__(self, manager: QzonePhotoManager, max_jobs: int):
+        self.manager = manager
+        self.max_jobs = max(1, max_jobs)
+        self.started_at = time.time()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_jobs, thread_name_prefix="qzone-job"
+        )
+        self._jobs: dict[str, DownloadJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._user_locks: dict[str, threading.Lock] = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, users: list[str], resume: bool = False) -> DownloadJob:
+        job = DownloadJob(str(next(self._ids)), users, resume)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run_job, job)
+        logger.info(f"[任务 {job.id}] 已提交，目标用户: {', '.join(users)}")
+        return job
+
+    def get(self, job_id: str) -> DownloadJob | None:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list[DownloadJob]:
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> DownloadJob | None:
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+            logger.info(f"[任务 {job.id}] 收到取消请求。")
+        return job
+
+    def status(self) -> dict:
+        jobs = self.list_jobs()
+        budget = self.manager.byte_budget
+        return {
+            "user_qq": self.manager.user_qq,
+            "logged_in": bool(self.manager.cookies),
+            "auth_broken": self.manager.auth_breaker.broken,
+            "uptime": round(time.time() - self.started_at, 1),
+            "max_jobs": self.max_jobs,
+            "jobs": {
+                state: sum(1 for job in jobs if job.state == state)
+                for state in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+            },
+            "memory_budget_bytes": budget.capacity,
+            "memory_budget_peak_bytes": budget.peak,
+        }
+
+    def shutdown(self) -> None:
+        for job in self.list_jobs():
+            job.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _user_lock(self, user: str) -> threading.Lock:
+        with self._jobs_lock:
+            return self._user_locks.setdefault(user, threading.Lock())
+
+    def _run_job(self, job: DownloadJob) -> None:
+        # 任务状态由 HTTP 线程通过 to_dict() 读取，修改时须持有 job._lock
+        with job._lock:
+            if job.is_cancelled():
+                job.state = JOB_CANCELLED
+                job.finished_at = time.time()
+                return
+            job.state = JOB_RUNNING
+            job.started_at = time.time()
+        # 之前的任务未能恢复登录态时，新任务重新尝试恢复，而不是直接停止
+        self.manager.auth_breaker.reset()
+        manager = self.manager.for_job(log_signal=job, is_stopped_func=job.is_cancelled)
+        with job._lock:
+            job.transfers = manager.transfers
+        try:
+            for user in job.users:
+                if job.is_cancelled():
+                    break
+                user_lock = self._user_lock(user)
+                # 同一用户的任务共用任务日志与文件清单，需等待前一个任务结束
+                while not user_lock.acquire(timeout=self.USER_LOCK_POLL_INTERVAL):
+                    if job.is_cancelled():
+                        break
+                else:
+                    try:
+                        with job._lock:
+                            job.current_user = user
+                        # 固定单进程，使所有任务都受本进程的 API 限流与内存预算约束
+                        counts = manager.download_all_photos_for_user(
+                            user, progress_func=job.progress, resume=job.resume, processes=1
+                        )
+                        with job._lock:
+                            job.results[user] = counts or {}
+                    finally:
+                        user_lock.release()
+        except Exception as e:
+            with job._lock:
+                job.error = str(e)
+            job.emit(traceback.format_exc())
+            logger.exception(f"[任务 {job.id}] 执行出错。")
+        finally:
+            with job._lock:
+                job.current_user = None
+                job.transfers = None
+                job.finished_at = time.time()
+                if job.error:
+                    job.state = JOB_FAILED
+                elif job.is_cancelled():
+                    job.state = JOB_CANCELLED
+                else:
+                    job.state = JOB_DONE
+                state = job.state
+            logger.info(f"[任务 {job.id}] 结束，状态: {state}")
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON 接口；DownloadDaemon 由 make_server() 注入到服务器对象上。"""
+
+    server_version = "QzoneDownloaderDaemon/1.0"
+    MAX_BODY_BYTES = 64 * 1024  # 请求体大小上限，提交任务的 JSON 远小于此
+
+    @property
+    def daemon(self) -> DownloadDaemon:
+        return self.server.download_daemon
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"[HTTP] {self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": message})
+
+    def _path_parts(self) -> list[str]:
+        return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+    def _authorized(self) -> bool:
+        """校验启动时生成的令牌，失败时已发送错误响应。"""
+        token = self.server.auth_token
+        header = self.headers.get("Authorization", "")
+        if not token or hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return True
+        self._send_error(401, "缺少或错误的令牌，请使用 Authorization: Bearer <令牌>")
+        return False
+
+    def _read_json(self) -> dict | None:
+        """读取 JSON 对象请求体；请求体无效时已发送 400 响应并返回 None。"""
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        # 负数长度会使 rfile.read() 一直读到连接关闭
+        if not 0 <= length <= self.MAX_BODY_BYTES:
+            self._send_error(400, f"Content-Length 须为 0 到 {self.MAX_BODY_BYTES} 之间的整数")
+            return None
+        if not length:
+            return {}
+        try:
+            data = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            data = None
+        if not isinstance(data, dict):
+            self._send_error(400, "请求体必须是 JSON 对象")
+            return None
+        return data
+
+    def do_GET(self) -> None:
+        if not self._authorized():
+            return
+        parts = self._path_parts()
+        if parts == ["status"]:
+            self._send_json(200, self.daemon.status())
+        elif parts == ["jobs"]:
+            self._send_json(200, [job.to_dict() for job in self.daemon.list_jobs()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.daemon.get(parts[1])
+            if job is None:
+                self._send_error(404, f"任务 {parts[1]} 不存在")
+            else:
+                self._send_json(200, job.to_dict(with_logs=True))
+        else:
+            self._send_error(404, "未知的接口")
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            return
+        content_type = self.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+        if content_type != "application/json":
+            self._send_error(415, "POST 请求须使用 Content-Type: application/json")
+            return
+        parts = self._path_parts()
+        if parts == ["jobs"]:
+            data = self._read_json()
+            if data is None:
+                return
+            users = data.get("users")
+            if isinstance(users, (str, int)):
+                users = [users]
+            if (
+                not isinstance(users, list)
+                or not users
+                or not all(str(user).strip().isdigit() for user in users)
+            ):
+                self._send_error(400, "users 必须是非空的 QQ 号列表")
+                return
+            job = self.daemon.submit(
+                [str(user).strip() for user in users], resume=bool(data.get("resume"))
+            )
+            self._send_json(202, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            self._cancel(parts[1])
+        else:
+            self._send_error(404, "未知的接口")
+
+    def do_DELETE(self) -> None:
+        if not self._authorized():
+            return
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == "jobs":
+            self._cancel(parts[1])
+        else:
+            self._send_error(404, "未知的接口")
+
+    def _cancel(self, job_id: str) -> None:
+        job = self.daemon.cancel(job_id)
+        if job is None:
+            self._send_error(404, f"任务 {job_id} 不存在")
+        else:
+            self._send_json(200, job.to_dict())
+
+
+def make_server(
+    daemon: DownloadDaemon, host: str, port: int, auth_token: str = ""
+) -> ThreadingHTTPServer:
+    """创建 HTTP 服务；auth_token 为空时不校验令牌。"""
+    server = ThreadingHTTPServer((host, port), DaemonRequestHandler)
+    server.daemon_threads = True
+    server.download_daemon = daemon
+    server.auth_token = auth_token
+    return server
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """解析命令行参数，未指定时使用配置文件中的值。"""
+    parser = argparse.ArgumentParser(description="QQ空间相册照片下载器 - 常驻服务")
+    parser.add_argument("--host", default=None, help="监听地址 (默认: 配置项 daemon_host)")
+    parser.add_argument("--port", type=int, default=None, help="监听端口 (默认: 配置项 daemon_port)")
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=None,
+        metavar="N",
+        help="同时运行的任务数上限 (默认: 配置项 daemon_max_jobs)",
+    )
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    """常驻服务主入口点。"""
+    args = parse_args()
+    load_config(exit_on_error=True)
+    atexit.register(LogPipeline(logging.getLogger()).start().close)
+
+    main_user_qq = USER_CONFIG["main_user_qq"]
+    if main_user_qq == "123456":
+        print("请在配置文件中更新 'main_user_qq'。")
+        return
+
+    try:
+        qzone_manager = QzonePhotoManager(main_user_qq)
+        qzone_manager._login_and_get_cookies()
+    except Exception as e:
+        print(f"初始化 QzonePhotoManager 失败: {e}")
+        return
+
+    host = args.host or APP_CONFIG.get("daemon_host", "127.0.0.1")
+    port = args.port if args.port is not None else APP_CONFIG.get("daemon_port", 8765)
+    max_jobs = args.max_jobs or APP_CONFIG.get("daemon_max_jobs", 2)
+
+    daemon = DownloadDaemon(qzone_manager, max_jobs)
+    auth_token = secrets.token_urlsafe(24)
+    server = make_server(daemon, host, port, auth_token)
+    print(f"登录完成，服务已启动: http://{host}:{port} (最多同时运行 {daemon.max_jobs} 个任务)")
+    print(f"本次启动的访问令牌: {auth_token}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止服务，取消所有任务...")
+    finally:
+        server.server_close()
+        daemon.shutdown()
+        qzone_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,10 @@ QQ空间相册照片下载器 - GUI 入口
 基于 PyQt6 的图形界面，所有核心下载逻辑由 core.py 提供。
 """
 
+import atexit
 import json
 import logging
+import multiprocessing
 import os
 import sys
 import traceback
@@ -31,6 +33,7 @@ from core import (
     APP_CONFIG,
     CONFIG_FILE,
     USER_CONFIG,
+    LogPipeline,
     QzonePhotoManager,
     get_script_directory,
     load_config,
@@ -123,9 +126,12 @@ class DownloadWorker(QThread):
         self.previous_qzone_manager: QzonePhotoManager | None = None
 
     def stop(self) -> None:
-        """设置停止标志，请求线程停止。"""
+        """设置停止标志，并立即中断进行中的传输，不必等当前文件下载完。"""
         self._is_stopped = True
         logger.info("下载工作线程收到停止请求。")
+        manager = self.qzone_manager
+        if manager is not None:
+            manager.transfers.abort_all()
 
     def is_stopped(self) -> bool:
         return self._is_stopped
@@ -215,6 +221,8 @@ class DownloadWorker(QThread):
             logger.exception("下载过程中发生关键错误。")
         finally:
             if self.qzone_manager:
+                # 下一次运行只复用登录信息，线程池等资源随本次运行释放
+                self.qzone_manager.close()
                 self.previous_qzone_manager = self.qzone_manager
             self.finished_signal.emit(final_status)
 
@@ -349,12 +357,8 @@ class QzoneDownloaderGUI(QWidget):
                 "main_user_qq": USER_CONFIG["main_user_qq"],
                 "main_user_pass": USER_CONFIG.get("main_user_pass", ""),
                 "dest_users_qq": USER_CONFIG["dest_users_qq"],
-                "max_workers": APP_CONFIG["max_workers"],
-                "timeout_init": APP_CONFIG["timeout_init"],
-                "max_attempts": APP_CONFIG["max_attempts"],
-                "is_api_debug": APP_CONFIG["is_api_debug"],
-                "exclude_albums": APP_CONFIG["exclude_albums"],
-                "download_path": APP_CONFIG["download_path"],
+                # APP_CONFIG 中的其余下载参数原样写回，避免丢失 GUI 未展示的配置项
+                **APP_CONFIG,
             }
             with open(CONFIG_FILE, "w", encoding="utf-8") as f:
                 json.dump(updated_config, f, indent=4, ensure_ascii=False)
@@ -454,7 +458,10 @@ class QzoneDownloaderGUI(QWidget):
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    # 打包为独立程序时，多进程下载的子进程需要由此进入
+    multiprocessing.freeze_support()
     load_config(exit_on_error=True)
+    atexit.register(LogPipeline(logger, core.logger).start().close)
 
     app = QApplication(sys.argv)
     gui = QzoneDownloaderGUI()
@@ -4,6 +4,13 @@ QQ空间相册照片下载器 - 命令行入口
 使用方法:
   1. 在 config.json 中配置 QQ 账号信息和下载参数
   2. 运行脚本: python main.py
+     进程中断后可使用 python main.py --resume 从任务日志继续，无需重新列举相册
+     使用 python main.py --refresh 检查已下载的原图是否被替换，未变化的文件只消耗一次 304 响应
+     使用 python main.py --plan [--plan-head] 仅统计待下载数量与大小，不下载任何文件
+     使用 python main.py --verify 校验已下载文件，并只重新下载缺失或损坏的文件
+     使用 python main.py --migrate-names 按当前 file_naming 配置就地重命名已下载的文件
+     使用 python main.py --export-metadata 将任务日志中的照片元数据导出到 SQLite 数据库
+     使用 python main.py --watch --interval 1h 常驻运行，定期增量同步所有目标用户
   3. 在弹出的浏览器窗口中登录 QQ 空间
   4. 脚本将自动开始下载照片
 
@@ -13,15 +20,24 @@ QQ空间相册照片下载器 - 命令行入口
   - 大量照片下载可能需要较长时间
 """
 
+import argparse
+import atexit
 import logging
+import multiprocessing
+import re
 import sys
+import time
 import traceback
 
 from core import (
     APP_CONFIG,
     USER_CONFIG,
+    LogPipeline,
     QzonePhotoManager,
+    export_user_metadata,
     load_config,
+    migrate_file_names,
+    verify_user_library,
 )
 
 logging.basicConfig(
@@ -32,9 +48,247 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+_INTERVAL_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(value: str) -> float:
+    """解析 --interval，支持纯秒数或带 s/m/h/d 单位的时长。"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", value.lower())
+    if not match or float(match.group(1)) <= 0:
+        raise argparse.ArgumentTypeError(f"无效的时间间隔: {value}")
+    return float(match.group(1)) * _INTERVAL_UNITS[match.group(2)]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """解析命令行参数。"""
+    parser = argparse.ArgumentParser(description="QQ空间相册照片下载器")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="从上次中断运行的任务日志继续，跳过相册/照片列举",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="对已下载的文件按记录的 ETag/Last-Modified 发送条件请求，只重新下载远端已替换的文件",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="试运行：列举相册和照片，统计待下载数量、大小与预计耗时，不下载任何文件",
+    )
+    parser.add_argument(
+        "--plan-head",
+        action="store_true",
+        help="配合 --plan 使用，并发发送 HEAD 请求获取待下载文件的实际大小",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=20.0,
+        metavar="MBPS",
+        help="配合 --plan 使用，估算耗时所用的下行带宽，单位 Mbit/s (默认: 20)",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        metavar="N",
+        help="按相册把下载分给 N 个子进程并行执行 (默认: 配置项 processes)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="常驻运行，按 --interval 定期增量同步所有目标用户，只下载新照片",
+    )
+    parser.add_argument(
+        "--interval",
+        type=parse_interval,
+        default="1h",
+        metavar="DURATION",
+        help="配合 --watch 使用，两轮同步的间隔，如 90s、30m、1h、1d (默认: 1h)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="按文件清单多进程重新计算校验和，缺失或损坏的文件登录后自动重新下载",
+    )
+    parser.add_argument(
+        "--verify-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="配合 --verify 使用，校验进程数 (默认: CPU 核数)",
+    )
+    parser.add_argument(
+        "--migrate-names",
+        action="store_true",
+        help="按任务日志记录的照片信息，将已下载的文件就地重命名为当前 file_naming 配置的格式",
+    )
+    parser.add_argument(
+        "--export-metadata",
+        action="store_true",
+        help="不登录，将任务日志中记录的相册与照片元数据导出到 metadata_db 配置的 SQLite 数据库",
+    )
+    return parser.parse_args(argv)
+
+
+# 未发送 HEAD 请求或 HEAD 未返回大小时，估算所用的平均文件大小
+PLAN_DEFAULT_PHOTO_BYTES = 2 * 1024 * 1024
+PLAN_DEFAULT_VIDEO_BYTES = 30 * 1024 * 1024
+# 每个文件的固定开销（建立请求、写盘等），单位秒
+PLAN_PER_FILE_OVERHEAD = 0.3
+
+
+def _format_bytes(num: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if num < 1024:
+            return f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TB"
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 小时 {minutes} 分 {seconds} 秒"
+
+
+def print_plan_summary(title: str, summary: dict, bandwidth_mbps: float) -> None:
+    """打印 --plan 的统计结果与预计耗时。"""
+    new_photos = summary["new_photos"]
+    new_videos = summary["new_videos"]
+    known_bytes = summary["new_photo_bytes"] + summary["new_video_bytes"]
+    unknown = summary["unknown_size"]
+
+    # 未知大小的文件按已知文件的平均大小估算，没有已知样本时使用默认值
+    known_count = new_photos + new_videos - unknown
+    if known_count > 0:
+        avg_bytes = known_bytes / known_count
+    elif new_photos + new_videos > 0:
+        avg_bytes = (
+            new_photos * PLAN_DEFAULT_PHOTO_BYTES + new_videos * PLAN_DEFAULT_VIDEO_BYTES
+        ) / (new_photos + new_videos)
+    else:
+        avg_bytes = 0
+    estimated_bytes = known_bytes + unknown * avg_bytes
+
+    transfer_seconds = estimated_bytes * 8 / (max(bandwidth_mbps, 0.01) * 1_000_000)
+    overhead_seconds = (
+        (new_photos + new_videos) * PLAN_PER_FILE_OVERHEAD / max(APP_CONFIG["max_workers"], 1)
+    )
+
+    print(f"\n=== 下载计划: {title} ===")
+    print(f"相册数: {summary['albums']}")
+    print(f"照片: {summary['photos']}，视频: {summary['videos']}")
+    print(f"本地已存在: {summary['present']}")
+    print(f"待下载: 照片 {new_photos}，视频 {new_videos}")
+    size_line = f"待传输: {_format_bytes(known_bytes)} (已知)"
+    if unknown:
+        size_line += f"，另有 {unknown} 个文件大小未知，估算共 {_format_bytes(estimated_bytes)}"
+    print(size_line)
+    print(
+        f"预计耗时 ({bandwidth_mbps:g} Mbit/s): "
+        f"{_format_duration(max(transfer_seconds, overhead_seconds))}"
+    )
+
+
+def run_plan(qzone_manager: QzonePhotoManager, dest_users_qq: list, args) -> None:
+    """对所有目标用户执行 --plan 试运行并打印统计。"""
+    total: dict = {}
+    for target_qq in dest_users_qq:
+        target_qq_str = str(target_qq)
+        try:
+            summary = qzone_manager.plan_downloads_for_user(target_qq_str, head=args.plan_head)
+        except Exception as e:
+            print(f"规划用户 {target_qq_str} 时发生意外错误: {e}")
+            traceback.print_exc()
+            continue
+        print_plan_summary(f"用户 {target_qq_str}", summary, args.bandwidth)
+        for key, value in summary.items():
+            total[key] = total.get(key, 0) + value
+    if len(dest_users_qq) > 1 and total:
+        print_plan_summary("全部用户", total, args.bandwidth)
+
+
+def run_verify(dest_users_qq: list, workers: int | None) -> list[str]:
+    """校验所有目标用户的已下载文件，返回需要重新下载的用户列表。"""
+    requeue_users = []
+    for target_qq in dest_users_qq:
+        target_qq_str = str(target_qq)
+        try:
+            summary = verify_user_library(target_qq_str, workers)
+        except Exception as e:
+            print(f"校验用户 {target_qq_str} 时发生意外错误: {e}")
+            traceback.print_exc()
+            continue
+        print(
+            f"用户 {target_qq_str} 校验完成: 共 {summary['checked']} 个文件，完好 {summary['ok']}，"
+            f"缺失 {summary['missing']}，损坏 {summary['damaged']}"
+        )
+        if summary["missing"] or summary["damaged"]:
+            requeue_users.append(target_qq_str)
+    return requeue_users
+
+
+def run_migrate(dest_users_qq: list) -> None:
+    """按当前命名配置重命名所有目标用户已下载的文件。"""
+    for target_qq in dest_users_qq:
+        target_qq_str = str(target_qq)
+        try:
+            summary = migrate_file_names(target_qq_str)
+        except Exception as e:
+            print(f"重命名用户 {target_qq_str} 的文件时发生意外错误: {e}")
+            traceback.print_exc()
+            continue
+        print(
+            f"用户 {target_qq_str} 重命名完成: 重命名 {summary['renamed']}，"
+            f"无需改动 {summary['unchanged']}，未找到 {summary['missing']}，"
+            f"冲突 {summary['conflicts']}"
+        )
+
+
+def run_export_metadata(dest_users_qq: list) -> None:
+    """把所有目标用户任务日志中的元数据导出到数据库。"""
+    for target_qq in dest_users_qq:
+        target_qq_str = str(target_qq)
+        try:
+            count = export_user_metadata(target_qq_str)
+        except Exception as e:
+            print(f"导出用户 {target_qq_str} 的元数据时发生意外错误: {e}")
+            traceback.print_exc()
+            continue
+        print(f"用户 {target_qq_str} 元数据导出完成: {count} 张照片")
+
+
+def run_watch(qzone_manager: QzonePhotoManager, dest_users_qq: list, interval: float) -> None:
+    """按固定间隔循环增量同步所有目标用户，直到 Ctrl+C 或登录态无法恢复。"""
+    cycle = 0
+    while True:
+        cycle += 1
+        started = time.monotonic()
+        print(f"\n=== 第 {cycle} 轮同步开始: {time.strftime('%Y-%m-%d %H:%M:%S')} ===")
+        for target_qq in dest_users_qq:
+            target_qq_str = str(target_qq)
+            try:
+                qzone_manager.sync_user(target_qq_str)
+            except Exception as e:
+                print(f"同步用户 {target_qq_str} 时发生意外错误: {e}")
+                traceback.print_exc()
+            if qzone_manager.is_stopped():
+                print("登录态已失效且无法恢复，停止同步。")
+                return
+        wait = max(interval - (time.monotonic() - started), 0)
+        print(f"=== 第 {cycle} 轮同步结束，{_format_duration(wait)}后开始下一轮 (Ctrl+C 退出) ===")
+        time.sleep(wait)
+
+
 def main() -> None:
     """脚本主入口点。"""
+    args = parse_args()
     load_config(exit_on_error=True)
+    # 日志的格式化与输出移到后台线程，退出前写完剩余日志
+    atexit.register(LogPipeline(logging.getLogger()).start().close)
 
     main_user_qq = USER_CONFIG["main_user_qq"]
     dest_users_qq = USER_CONFIG["dest_users_qq"]
@@ -43,8 +297,25 @@ def main() -> None:
         print("请在配置文件中更新 'main_user_qq' 和 'dest_users_qq'。")
         return
 
+    if args.migrate_names:
+        run_migrate(dest_users_qq)
+        return
+    if args.export_metadata:
+        run_export_metadata(dest_users_qq)
+        return
+
+    resume = args.resume
+    if args.verify:
+        dest_users_qq = run_verify(dest_users_qq, args.verify_workers)
+        if not dest_users_qq:
+            print("所有文件校验通过，无需重新下载。")
+            return
+        # 校验已把缺失与损坏的文件重新加入任务日志，续传即可只下载这些文件
+        resume = True
+
     try:
         qzone_manager = QzonePhotoManager(main_user_qq)
+        atexit.register(qzone_manager.close)
         qzone_manager._login_and_get_cookies()
     except Exception as e:
         print(f"初始化 QzonePhotoManager 失败: {e}")
@@ -52,11 +323,28 @@ def main() -> None:
 
     print("登录过程已完成。")
 
+    if args.plan:
+        run_plan(qzone_manager, dest_users_qq, args)
+        return
+
+    if args.watch:
+        try:
+            run_watch(qzone_manager, dest_users_qq, args.interval)
+        except KeyboardInterrupt:
+            print("\n已停止同步。")
+        return
+
     for target_qq in dest_users_qq:
         target_qq_str = str(target_qq)
         print(f"\n--- 正在处理用户: {target_qq_str} ---")
         try:
-            qzone_manager.download_all_photos_for_user(target_qq_str)
+            qzone_manager.download_all_photos_for_user(
+                target_qq_str, resume=resume, processes=args.processes, refresh=args.refresh
+            )
+        except KeyboardInterrupt:
+            # 进行中的传输已被中断，任务日志已保存
+            print("\n已停止下载，可使用 --resume 继续。")
+            return
         except Exception as e:
             print(f"处理用户 {target_qq_str} 时发生意外错误: {e}")
             traceback.print_exc()
@@ -66,4 +354,6 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    # 打包为独立程序时，多进程下载的子进程需要由此进入
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,154 @@
+"""
+测试共用的夹具：在本机后台线程中运行的 HTTP 服务（模拟 CDN），以及隔离的下载配置。
+"""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core  # noqa: E402
+
+
+class FixtureServer:
+    """
+    按路径把 GET 请求分发给注册的处理函数，并记录收到的每个请求 (路径, 请求头)。
+
+    处理函数签名为 func(handler)，通过 send() 或 handler.wfile 直接写出响应。
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                with fixture._lock:
+                    fixture.requests.append((path, dict(self.headers)))
+                route = fixture.routes.get(path)
+                if route is None:
+                    send(self, 404, b"")
+                else:
+                    route(self)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_port}{path}"
+
+    def requests_for(self, path: str) -> list[dict]:
+        """返回对 path 的所有请求的请求头。"""
+        with self._lock:
+            return [headers for p, headers in self.requests if p == path]
+
+    def start(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def send(handler: BaseHTTPRequestHandler, status: int, body: bytes, headers=()) -> None:
+    """写出带 Content-Length 的完整响应。"""
+    handler.send_response(status)
+    handler.send_header("Content-Length", str(len(body)))
+    for name, value in headers:
+        handler.send_header(name, value)
+    handler.end_headers()
+    if body:
+        handler.wfile.write(body)
+
+
+def send_range(handler: BaseHTTPRequestHandler, data: bytes, headers=()) -> None:
+    """按请求中的 Range 头返回 206 部分内容，没有 Range 时返回完整的 200 响应。"""
+    header = handler.headers.get("Range")
+    if not header:
+        send(handler, 200, data, (("Accept-Ranges", "bytes"), *headers))
+        return
+    start, _, end = header.split("=", 1)[1].partition("-")
+    start = int(start)
+    end = int(end) if end else len(data) - 1
+    if start >= len(data):
+        send(handler, 416, b"", (("Content-Range", f"bytes */{len(data)}"),))
+        return
+    send(
+        handler,
+        206,
+        data[start:end + 1],
+        (
+            ("Accept-Ranges", "bytes"),
+            ("Content-Range", f"bytes {start}-{end}/{len(data)}"),
+            *headers,
+        ),
+    )
+
+
+def send_truncated(
+    handler: BaseHTTPRequestHandler, status: int, body: bytes, sent: int, headers=()
+) -> None:
+    """声明完整的 Content-Length，只写出前 sent 字节后断开连接，模拟传输中途掉线。"""
+    handler.send_response(status)
+    handler.send_header("Content-Length", str(len(body)))
+    for name, value in headers:
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.wfile.write(body[:sent])
+    handler.wfile.flush()
+    handler.close_connection = True
+
+
+@pytest.fixture
+def cdn():
+    server = FixtureServer().start()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    """把 APP_CONFIG 指向临时下载目录并缩短超时与退避，测试结束后恢复原配置。"""
+    saved = dict(core.APP_CONFIG)
+    core.APP_CONFIG.update(
+        {
+            "download_path": str(tmp_path / "downloads"),
+            "output_mode": "files",
+            "max_workers": 4,
+            "max_attempts": 3,
+            "timeout_init": 5,
+            "connect_timeout": 2,
+            "read_timeout": 5,
+            "retry_backoff_base": 0.05,
+            "retry_backoff_max": 0.2,
+            "task_deadline": 60,
+            "is_api_debug": False,
+            "exclude_albums": [],
+            "lane_workers": {},
+            "task_order": "album",
+            "file_naming": "index",
+            "file_name_prefix": "",
+            "listing_cache_ttl": 0,
+            "album_list_cache_ttl": 0,
+            "hedge_enabled": False,
+            "metadata_db": "",
+            "event_log": "",
+        }
+    )
+    yield core.APP_CONFIG
+    core.APP_CONFIG.clear()
+    core.APP_CONFIG.update(saved)
@@ -0,0 +1,114 @@
+"""相册列表分页：拿到总数后并发获取剩余分页，按页序合并去重，不完整的结果不写入缓存。"""
+
+import threading
+import time
+
+import pytest
+
+import core
+
+PAGE_NUM = 32
+TOTAL = PAGE_NUM * 5 + 7
+PAGE_DELAY = 0.05
+
+
+class PagedManager(core.QzonePhotoManager):
+    """用内存中的相册代替相册列表 API，记录请求的分页与同时进行的请求数。"""
+
+    def __init__(self, total: int, report_total: bool = True, failing=(), stop_after=None):
+        self.stopped = threading.Event()
+        super().__init__("10001", is_stopped_func=self.stopped.is_set)
+        self.stop_after = stop_after
+        self.albums = [core.QzoneAlbum(f"album-{i}", f"相册 {i}", 1) for i in range(total)]
+        self.report_total = report_total
+        self.failing = set(failing)
+        self.requested: list[int] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._count_lock = threading.Lock()
+
+    def get_albums(self, dest_user_qq, pageStart=0, pageNum=PAGE_NUM):
+        with self._count_lock:
+            self.requested.append(pageStart)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if pageStart == self.stop_after:
+                self.stopped.set()
+        try:
+            time.sleep(PAGE_DELAY)
+            if pageStart in self.failing:
+                return []
+            if self.total_albums == 0 and self.report_total:
+                self.total_albums = len(self.albums)
+            # 与真实接口一样，相邻分页可能重复返回边界上的相册
+            begin = max(0, pageStart - 1) if pageStart else 0
+            return self.albums[begin:pageStart + pageNum]
+        finally:
+            with self._count_lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def album_config(app_config):
+    app_config["api_max_concurrency"] = 3
+    app_config["api_rate_limit"] = 0
+    app_config["listing_cache_ttl"] = 3600
+    app_config["album_list_cache_ttl"] = 300
+    return app_config
+
+
+def test_pages_are_fetched_concurrently_and_merged_in_order(album_config):
+    manager = PagedManager(TOTAL)
+
+    started = time.monotonic()
+    albums = manager.get_albums_by_page("20002", use_cache=False)
+    elapsed = time.monotonic() - started
+
+    assert albums == manager.albums
+    assert sorted(manager.requested) == list(range(0, TOTAL, PAGE_NUM))
+    assert 1 < manager.max_in_flight <= album_config["api_max_concurrency"]
+    # 首页之后的 5 页以 3 个并发获取，耗时明显少于逐页获取
+    assert elapsed < PAGE_DELAY * len(manager.requested) * 0.8
+
+
+def test_complete_listing_is_cached(album_config):
+    manager = PagedManager(TOTAL)
+    albums = manager.get_albums_by_page("20002")
+    manager.requested.clear()
+
+    assert manager.get_albums_by_page("20002") == albums
+    assert manager.requested == []
+
+
+def test_failed_page_is_not_cached(album_config):
+    manager = PagedManager(TOTAL, failing={PAGE_NUM * 2})
+
+    albums = manager.get_albums_by_page("20002")
+
+    assert len(albums) < TOTAL
+    assert manager.listing_cache.get_albums("20002") is None
+
+    manager.failing.clear()
+    manager.requested.clear()
+    assert manager.get_albums_by_page("20002") == manager.albums
+    assert manager.listing_cache.get_albums("20002") == manager.albums
+
+
+def test_unknown_total_falls_back_to_sequential_pages(album_config):
+    manager = PagedManager(TOTAL, report_total=False)
+
+    albums = manager.get_albums_by_page("20002", use_cache=False)
+
+    assert albums == manager.albums
+    assert manager.max_in_flight == 1
+
+
+def test_stop_cancels_pages_not_yet_started(album_config):
+    manager = PagedManager(TOTAL, stop_after=PAGE_NUM)
+
+    albums = manager.get_albums_by_page("20002", use_cache=False)
+
+    # 首页之后只有第一批并发的分页被请求，其余分页被取消
+    assert len(manager.requested) <= 1 + album_config["api_max_concurrency"]
+    assert len(albums) < TOTAL
+    assert manager.listing_cache.get_albums("20002") is None
@@ -0,0 +1,130 @@
+"""登录态熔断器：验证结果缓存、重新登录、无法恢复与重置、无法确认时的指数退避、并发报告只恢复一次。"""
+
+import threading
+import time
+
+import pytest
+
+import core
+
+
+class Recorder:
+    """按脚本返回验证结果与重新登录结果，记录调用次数。"""
+
+    def __init__(self, valid=True, renewed=True):
+        self.valid = valid
+        self.renewed = renewed
+        self.validations = 0
+        self.reauths = 0
+        self.gate: threading.Event | None = None
+
+    def validate(self):
+        self.validations += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if isinstance(self.valid, Exception):
+            raise self.valid
+        return self.valid
+
+    def reauth(self):
+        self.reauths += 1
+        return self.renewed
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def breaker(recorder):
+    breaker = core.AuthCircuitBreaker(recorder.validate, recorder.reauth)
+    breaker.UNKNOWN_BACKOFF_BASE = 0.05
+    breaker.UNKNOWN_BACKOFF_MAX = 0.2
+    return breaker
+
+
+def test_valid_result_is_cached(breaker, recorder):
+    assert breaker.report_failure(breaker.generation) == core.AUTH_VALID
+    assert breaker.report_failure(breaker.generation) == core.AUTH_VALID
+    assert recorder.validations == 1
+    assert recorder.reauths == 0
+    assert breaker.wait_if_open()
+
+
+def test_expired_login_is_renewed(breaker, recorder):
+    recorder.valid = False
+    generation = breaker.generation
+
+    assert breaker.report_failure(generation) == core.AUTH_RENEWED
+    assert breaker.generation == generation + 1
+    assert recorder.reauths == 1
+
+    # 刷新前发出的请求再报告失败时直接重试，不再重新登录
+    assert breaker.report_failure(generation) == core.AUTH_RENEWED
+    assert recorder.validations == 1
+
+
+def test_failed_relogin_breaks_until_reset(breaker, recorder):
+    recorder.valid = False
+    recorder.renewed = False
+
+    assert breaker.report_failure(breaker.generation) == core.AUTH_BROKEN
+    assert breaker.broken
+    assert not breaker.wait_if_open()
+    assert breaker.report_failure(breaker.generation) == core.AUTH_BROKEN
+    assert recorder.reauths == 1
+
+    breaker.reset()
+    assert not breaker.broken
+    recorder.renewed = True
+    assert breaker.report_failure(breaker.generation) == core.AUTH_RENEWED
+    assert recorder.reauths == 2
+
+
+@pytest.mark.parametrize("valid", [None, ConnectionError("网络错误")])
+def test_unknown_result_backs_off_exponentially(breaker, recorder, valid):
+    recorder.valid = valid
+
+    assert breaker.report_failure(breaker.generation) == core.AUTH_UNKNOWN
+    assert 0 < breaker.backoff_remaining() <= 0.05
+    # 退避期间不再验证，也不会重新登录
+    assert breaker.report_failure(breaker.generation) == core.AUTH_UNKNOWN
+    assert recorder.validations == 1
+    assert recorder.reauths == 0
+    assert not breaker.broken
+
+    delays = []
+    for _ in range(3):
+        time.sleep(breaker.backoff_remaining())
+        assert breaker.report_failure(breaker.generation) == core.AUTH_UNKNOWN
+        delays.append(breaker.backoff_remaining())
+    assert delays[0] > 0.05
+    assert all(delay <= 0.2 for delay in delays)
+
+    # 确认有效后退避清零
+    time.sleep(breaker.backoff_remaining())
+    recorder.valid = True
+    assert breaker.report_failure(breaker.generation) == core.AUTH_VALID
+    assert breaker.backoff_remaining() == 0
+
+
+def test_concurrent_reports_recover_once(breaker, recorder):
+    recorder.valid = False
+    recorder.gate = threading.Event()
+    generation = breaker.generation
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(breaker.report_failure(generation)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    recorder.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [core.AUTH_RENEWED] * 8
+    assert recorder.validations == 1
+    assert recorder.reauths == 1
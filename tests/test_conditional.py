@@ -0,0 +1,136 @@
+"""--refresh 的条件请求：304 跳过文件并保留清单记录，200 替换文件并更新 ETag。"""
+
+import os
+
+import pytest
+
+import core
+from conftest import send
+
+PHOTO_COUNT = 3
+ALBUM = core.QzoneAlbum("album-1", "相册", PHOTO_COUNT)
+
+
+def _body(index: int, version: int) -> bytes:
+    # PNG 文件头：按 .png 保存，不经过 EXIF 回写，便于逐字节比较
+    return b"\x89PNG\r\n\x1a\n" + bytes([index, version]) * (4096 + version)
+
+
+@pytest.fixture
+def photo_cdn(cdn):
+    cdn.versions = dict.fromkeys(range(PHOTO_COUNT), 0)
+    cdn.not_modified = []
+
+    def _route(index):
+        def route(handler):
+            version = cdn.versions[index]
+            etag = f'"p{index}-v{version}"'
+            last_modified = f"Mon, 0{version + 1} Jan 2024 00:00:00 GMT"
+            if handler.headers.get("If-None-Match") == etag:
+                cdn.not_modified.append(index)
+                send(handler, 304, b"", (("ETag", etag),))
+            else:
+                send(
+                    handler,
+                    200,
+                    _body(index, version),
+                    (("ETag", etag), ("Last-Modified", last_modified)),
+                )
+        return route
+
+    for i in range(PHOTO_COUNT):
+        cdn.routes[f"/photo/{i}"] = _route(i)
+    return cdn
+
+
+@pytest.fixture
+def manager(app_config, photo_cdn):
+    photos = [
+        core.QzonePhoto(
+            photo_cdn.url(f"/photo/{i}"),
+            f"p{i}",
+            ALBUM.name,
+            False,
+            f"key{i}",
+            {},
+            "",
+            "2024-01-01 00:00:00",
+            "",
+        )
+        for i in range(PHOTO_COUNT)
+    ]
+
+    class FixtureManager(core.QzonePhotoManager):
+        def get_albums_by_page(self, dest_user_qq, use_cache=True):
+            return [ALBUM]
+
+        def list_album_photos(self, dest_user_qq, album):
+            return photos, True
+
+    return FixtureManager("10001")
+
+
+def _path(index: int) -> str:
+    album_dir = os.path.join(core.get_save_directory("20002"), ALBUM.name)
+    return os.path.join(album_dir, f"{core.photo_base_filename(index, _photo(index))}.png")
+
+
+def _photo(index: int) -> core.QzonePhoto:
+    return core.QzonePhoto("", f"p{index}", ALBUM.name, False, f"key{index}", {}, "", "", "")
+
+
+def _manifest() -> dict:
+    return core.DownloadManifest.for_user("20002").load()
+
+
+def _entry(index: int) -> dict:
+    return _manifest()[os.path.relpath(_path(index), core.get_save_directory("20002"))]
+
+
+def test_unchanged_files_are_skipped_by_304(manager, photo_cdn):
+    counts = manager.download_all_photos_for_user("20002")
+    assert counts.get(core.TASK_DONE) == PHOTO_COUNT
+    stats = {i: os.stat(_path(i)) for i in range(PHOTO_COUNT)}
+    entries = {i: _entry(i) for i in range(PHOTO_COUNT)}
+    assert all(entry["etag"] == f'"p{i}-v0"' for i, entry in entries.items())
+
+    counts = manager.download_all_photos_for_user("20002", refresh=True)
+
+    assert counts.get(core.TASK_SKIPPED) == PHOTO_COUNT
+    assert sorted(photo_cdn.not_modified) == list(range(PHOTO_COUNT))
+    for i in range(PHOTO_COUNT):
+        requests = photo_cdn.requests_for(f"/photo/{i}")
+        assert requests[-1]["If-None-Match"] == f'"p{i}-v0"'
+        # 文件未被重写，清单记录原样保留
+        assert os.stat(_path(i)).st_mtime_ns == stats[i].st_mtime_ns
+        assert os.stat(_path(i)).st_ino == stats[i].st_ino
+        assert _entry(i) == entries[i]
+
+
+def test_changed_file_is_replaced_and_etag_updated(manager, photo_cdn):
+    manager.download_all_photos_for_user("20002")
+    unchanged = os.stat(_path(0))
+    photo_cdn.versions[1] = 1
+
+    counts = manager.download_all_photos_for_user("20002", refresh=True)
+
+    assert counts.get(core.TASK_DONE) == 1
+    assert counts.get(core.TASK_SKIPPED) == PHOTO_COUNT - 1
+    with open(_path(1), "rb") as f:
+        assert f.read() == _body(1, 1)
+    entry = _entry(1)
+    assert entry["etag"] == '"p1-v1"'
+    assert entry["last_modified"] == "Mon, 02 Jan 2024 00:00:00 GMT"
+    assert entry["size"] == len(_body(1, 1))
+    assert os.stat(_path(0)).st_ino == unchanged.st_ino
+    assert _entry(0)["etag"] == '"p0-v0"'
+
+
+def test_plain_rerun_sends_no_requests(manager, photo_cdn):
+    manager.download_all_photos_for_user("20002")
+    sent = len(photo_cdn.requests)
+
+    counts = manager.download_all_photos_for_user("20002")
+
+    assert counts.get(core.TASK_SKIPPED) == PHOTO_COUNT
+    assert len(photo_cdn.requests) == sent
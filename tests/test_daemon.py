@@ -0,0 +1,167 @@
+"""常驻服务的 HTTP 接口：令牌、Content-Type 与请求体校验，任务生命周期、取消与同用户串行。"""
+
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+import core
+import daemon
+
+TOKEN = "test-token"
+
+
+class JobManager:
+    """代替任务级管理器：按测试的要求阻塞，记录每个目标用户同时进行的下载数。"""
+
+    def __init__(self, parent: "FakeManager", is_stopped_func):
+        self.parent = parent
+        self.is_stopped = is_stopped_func
+        self.transfers = core.ActiveTransfers()
+
+    def download_all_photos_for_user(self, user, progress_func=None, resume=False, processes=1):
+        parent = self.parent
+        with parent.lock:
+            parent.running[user] = parent.running.get(user, 0) + 1
+            parent.max_running[user] = max(parent.max_running.get(user, 0), parent.running[user])
+        try:
+            progress_func(-2)
+            while not parent.release.is_set() and not self.is_stopped():
+                time.sleep(0.01)
+            if self.is_stopped():
+                return {core.TASK_STOPPED: 2}
+            progress_func(1)
+            progress_func(1)
+            return {core.TASK_DONE: 2}
+        finally:
+            with parent.lock:
+                parent.running[user] -= 1
+
+
+class FakeManager(core.QzonePhotoManager):
+    def __init__(self):
+        super().__init__("10001")
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.running: dict[str, int] = {}
+        self.max_running: dict[str, int] = {}
+
+    def for_job(self, log_signal=None, is_stopped_func=None):
+        return JobManager(self, is_stopped_func)
+
+
+@pytest.fixture
+def service(app_config):
+    manager = FakeManager()
+    download_daemon = daemon.DownloadDaemon(manager, max_jobs=3)
+    server = daemon.make_server(download_daemon, "127.0.0.1", 0, TOKEN)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    manager.release.set()
+    server.shutdown()
+    server.server_close()
+    download_daemon.shutdown()
+
+
+def _request(server, method, path, body=None, headers=None, token=TOKEN):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    all_headers = {"Authorization": f"Bearer {token}"} if token else {}
+    if body is not None:
+        body = json.dumps(body).encode()
+        all_headers["Content-Type"] = "application/json"
+    all_headers.update(headers or {})
+    conn.request(method, path, body=body, headers=all_headers)
+    response = conn.getresponse()
+    data = json.loads(response.read() or b"null")
+    conn.close()
+    return response.status, data
+
+
+def _wait_for(server, job_id, state, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        _, job = _request(server, "GET", f"/jobs/{job_id}")
+        if job["state"] == state:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"任务 {job_id} 未进入状态 {state}: {job}")
+
+
+def test_requests_require_token(service):
+    assert _request(service, "GET", "/status", token="")[0] == 401
+    assert _request(service, "GET", "/status", token="wrong")[0] == 401
+    status, data = _request(service, "GET", "/status")
+    assert status == 200
+    assert data["user_qq"] == "10001"
+
+
+def test_post_requires_json_content_type(service):
+    status, _ = _request(
+        service, "POST", "/jobs", body={"users": ["20002"]}, headers={"Content-Type": "text/plain"}
+    )
+    assert status == 415
+    assert _request(service, "GET", "/jobs")[1] == []
+
+
+@pytest.mark.parametrize(
+    "length", ["abc", "-1", str(daemon.DaemonRequestHandler.MAX_BODY_BYTES + 1)]
+)
+def test_invalid_content_length_is_rejected(service, length):
+    conn = http.client.HTTPConnection("127.0.0.1", service.server_port, timeout=5)
+    conn.putrequest("POST", "/jobs")
+    conn.putheader("Authorization", f"Bearer {TOKEN}")
+    conn.putheader("Content-Type", "application/json")
+    conn.putheader("Content-Length", length)
+    conn.endheaders()
+    response = conn.getresponse()
+    assert response.status == 400
+    assert "Content-Length" in json.loads(response.read())["error"]
+    conn.close()
+
+
+def test_job_lifecycle(service):
+    status, job = _request(service, "POST", "/jobs", body={"users": ["20002", "20003"]})
+    assert status == 202
+    assert job["state"] in (daemon.JOB_QUEUED, daemon.JOB_RUNNING)
+
+    service.download_daemon.manager.release.set()
+    job = _wait_for(service, job["id"], daemon.JOB_DONE)
+
+    assert job["downloaded"] == 4
+    assert job["completed"] == 4
+    assert job["current_user"] is None
+    assert set(job["results"]) == {"20002", "20003"}
+    assert job["finished_at"] >= job["started_at"]
+
+
+def test_cancel_stops_running_job(service):
+    _, job = _request(service, "POST", "/jobs", body={"users": ["20002"]})
+    _wait_for(service, job["id"], daemon.JOB_RUNNING)
+
+    status, _ = _request(service, "POST", f"/jobs/{job['id']}/cancel", body={})
+    assert status == 200
+
+    job = _wait_for(service, job["id"], daemon.JOB_CANCELLED)
+    assert job["stopped"] == 2
+    assert _request(service, "DELETE", "/jobs/999")[0] == 404
+
+
+def test_jobs_for_same_user_run_one_at_a_time(service):
+    manager = service.download_daemon.manager
+    ids = [
+        _request(service, "POST", "/jobs", body={"users": [user]})[1]["id"]
+        for user in ("20002", "20002", "20003")
+    ]
+    deadline = time.monotonic() + 5
+    while manager.running.get("20003", 0) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # 不同用户的任务同时进行，同一用户的第二个任务等待第一个结束
+    assert manager.running == {"20002": 1, "20003": 1}
+
+    manager.release.set()
+    for job_id in ids:
+        _wait_for(service, job_id, daemon.JOB_DONE)
+    assert manager.max_running == {"20002": 1, "20003": 1}
@@ -0,0 +1,159 @@
+"""写盘阶段：临时文件重命名、清单记录、按批刷盘与关闭时刷新剩余文件、写入失败时释放预留内存。"""
+
+import hashlib
+import os
+import threading
+import types
+
+import pytest
+
+import core
+
+CONTENT = b"\x89PNG\r\n\x1a\n" + b"\x00" * 256
+
+
+def _task(index: int, manifest=None) -> core.PhotoTask:
+    photo = core.QzonePhoto(
+        f"http://cdn/{index}", f"p{index}", "相册", False, f"key{index}", {}, "",
+        "2024-01-01 08:00:00", "",
+    )
+    return core.PhotoTask(
+        request_cookies={},
+        user_qq="20002",
+        album_index=0,
+        album_name="相册",
+        photo_index=index,
+        photo=photo,
+        log_func=None,
+        progress_func=None,
+        is_stopped_func=lambda: False,
+        qzone_manager=types.SimpleNamespace(manifest=manifest),
+        album_id="album-1",
+        dest_user_qq="20002",
+    )
+
+
+def _job(directory, index: int, manifest=None, budget=None) -> core.WriteJob:
+    path = os.path.join(str(directory), f"{index}.png")
+    return core.WriteJob(
+        _task(index, manifest),
+        CONTENT,
+        f"{index}.png",
+        path,
+        None,
+        sha256=hashlib.sha256(CONTENT).hexdigest(),
+        budget=budget,
+        reserved=len(CONTENT) if budget is not None else 0,
+    )
+
+
+@pytest.fixture
+def fsynced(monkeypatch):
+    """记录每次 fsync 的文件描述符对应的路径。"""
+    paths = []
+    real_fsync = os.fsync
+
+    def _fsync(fd):
+        paths.append(os.readlink(f"/proc/self/fd/{fd}"))
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", _fsync)
+    return paths
+
+
+def _run(writer: core.DiskWriter, jobs) -> list:
+    done = []
+    writer.start()
+    for job in jobs:
+        writer.submit(
+            job, lambda task, outcome, nbytes: done.append((task.photo_index, outcome, nbytes))
+        )
+    writer.close()
+    return done
+
+
+def test_files_are_renamed_and_recorded(tmp_path, app_config):
+    manifest = core.DownloadManifest(str(tmp_path))
+    manifest.open()
+    jobs = [_job(tmp_path, i, manifest) for i in range(3)]
+
+    done = _run(core.DiskWriter(workers=2, queue_size=1), jobs)
+    manifest.close()
+
+    assert sorted(done) == [(i, core.TASK_DONE, len(CONTENT)) for i in range(3)]
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["0.png", "1.png", "2.png", core.DownloadManifest.FILE_NAME]
+    )
+    entries = core.DownloadManifest(str(tmp_path)).load()
+    assert entries["1.png"]["size"] == len(CONTENT)
+    assert entries["1.png"]["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+    assert entries["1.png"]["key"] == "album-1/key1"
+    # mtime 取自照片的上传时间
+    assert os.path.getmtime(jobs[0].path) == core._photo_timestamp({}, "", "2024-01-01 08:00:00")
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="需要 /proc 获取描述符路径")
+def test_batch_fsync_flushes_every_batch_and_remainder_on_close(tmp_path, app_config, fsynced):
+    metrics = core.StageMetrics()
+    jobs = [_job(tmp_path, i) for i in range(5)]
+
+    done = _run(core.DiskWriter(workers=1, queue_size=8, metrics=metrics, fsync_batch=2), jobs)
+
+    assert [outcome for _, outcome, _ in done] == [core.TASK_DONE] * 5
+    # 两个完整批次与关闭时剩余的一个文件，各刷一次文件所在目录
+    assert metrics.snapshot()[core.STAGE_FSYNC]["count"] == 3
+    files = [path for path in fsynced if path.endswith(".png")]
+    assert files == [job.path for job in jobs]
+    assert fsynced.count(str(tmp_path)) == 3
+    assert not any(path.endswith(".part") for path in fsynced)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="需要 /proc 获取描述符路径")
+def test_single_fsync_syncs_temp_file_before_rename(tmp_path, app_config, fsynced):
+    metrics = core.StageMetrics()
+
+    writer = core.DiskWriter(workers=1, queue_size=8, metrics=metrics, fsync_batch=1)
+    _run(writer, [_job(tmp_path, 0)])
+
+    assert fsynced == [os.path.join(str(tmp_path), "0.png.part")]
+    assert core.STAGE_FSYNC not in metrics.snapshot()
+
+
+def test_no_fsync_when_disabled(tmp_path, app_config, fsynced):
+    _run(core.DiskWriter(workers=1, queue_size=8, fsync_batch=0), [_job(tmp_path, 0)])
+
+    assert fsynced == []
+
+
+def test_failed_write_releases_budget_and_leaves_no_part(tmp_path, app_config):
+    budget = core.ByteBudget(len(CONTENT))
+    assert budget.acquire(len(CONTENT))
+    job = _job(tmp_path / "missing", 0, budget=budget)
+
+    done = _run(core.DiskWriter(workers=1, queue_size=1, fsync_batch=2), [job])
+
+    assert done == [(0, core.TASK_FAILED, len(CONTENT))]
+    assert not os.path.exists(tmp_path / "missing")
+    # 预留的内存已归还，可以再次全部占用
+    assert budget.acquire(len(CONTENT), is_stopped_func=lambda: True)
+
+
+def test_full_queue_blocks_submit(tmp_path, app_config):
+    release = threading.Event()
+    writer = core.DiskWriter(workers=1, queue_size=1)
+    writer.start()
+    writer.submit(_job(tmp_path, 0), lambda *args: release.wait(5))
+    writer.submit(_job(tmp_path, 1), lambda *args: None)
+
+    blocked = threading.Thread(target=writer.submit, args=(_job(tmp_path, 2), lambda *args: None))
+    blocked.start()
+    blocked.join(0.2)
+    # 写盘线程被第一个任务占住、队列已满时，提交方等待而不是把内容堆在内存中
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    writer.close()
+    assert sorted(os.listdir(tmp_path)) == ["0.png", "1.png", "2.png"]
+    assert writer.metrics.snapshot()[core.STAGE_WRITE_WAIT]["count"] == 3
@@ -0,0 +1,88 @@
+"""对冲请求：慢请求落败后被关闭，等待期间可被停止，进行中的响应登记到传输集合。"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+import core
+
+
+class FakeResponse:
+    raw = None
+
+    def __init__(self, index: int):
+        self.index = index
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class SlowFirstRequest:
+    """前 slow_calls 次调用阻塞到 release 被设置，之后的调用立即返回。"""
+
+    def __init__(self, slow_calls: int = 1):
+        self.slow_calls = slow_calls
+        self.release = threading.Event()
+        self.responses: list[FakeResponse] = []
+        self._lock = threading.Lock()
+
+    def __call__(self) -> FakeResponse:
+        with self._lock:
+            response = FakeResponse(len(self.responses))
+            self.responses.append(response)
+        if response.index < self.slow_calls:
+            self.release.wait(5)
+        return response
+
+
+def _wait_until(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def hedger():
+    hedger = core.RequestHedger(True, percentile=50, max_ratio=1.0)
+    # 积累足够的延迟样本，之后的请求几乎立即触发对冲
+    for _ in range(core.RequestHedger.MIN_SAMPLES):
+        hedger.fetch(lambda: FakeResponse(-1))
+    yield hedger
+    hedger.close()
+
+
+def test_hedge_wins_over_slow_primary_and_loser_is_closed(hedger):
+    request = SlowFirstRequest()
+    transfers = core.ActiveTransfers()
+
+    response = hedger.fetch(request, transfers=transfers)
+
+    primary, hedge = request.responses
+    assert response is hedge
+    assert hedger.snapshot()["hedge_wins"] == 1
+    request.release.set()
+    assert _wait_until(lambda: primary.closed)
+    assert not hedge.closed
+    # 落败的响应已注销，只有胜出的响应仍登记在传输集合中
+    assert transfers.abort_all() == 1
+
+
+def test_stop_while_waiting_abandons_both_requests(hedger):
+    request = SlowFirstRequest(slow_calls=2)
+    stopped = threading.Event()
+    threading.Timer(0.1, stopped.set).start()
+
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        hedger.fetch(request, stopped.is_set, core.ActiveTransfers())
+
+    assert time.monotonic() - started < core.RequestHedger.STOP_POLL_INTERVAL * 3
+    request.release.set()
+    assert _wait_until(lambda: len(request.responses) == 2)
+    assert _wait_until(lambda: all(response.closed for response in request.responses))
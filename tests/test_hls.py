@@ -0,0 +1,98 @@
+"""HLS 下载：分段按序拼接、掉线分段以 Range 续传、拒绝加密播放列表。"""
+
+import hashlib
+import os
+
+import pytest
+
+import core
+from conftest import send, send_range, send_truncated
+
+SEGMENT_COUNT = 6
+# 大于 DOWNLOAD_CHUNK_SIZE，使掉线前至少有一块数据写入 .part
+SEGMENT_SIZE = core.DOWNLOAD_CHUNK_SIZE * 2
+DROPPED_SEGMENT = 2
+
+
+def _segment(index: int) -> bytes:
+    return bytes([index]) * SEGMENT_SIZE
+
+
+@pytest.fixture
+def hls_cdn(cdn):
+    playlist = "#EXTM3U\n#EXT-X-TARGETDURATION:1\n" + "".join(
+        f"#EXTINF:1.0,\nseg{i}.ts\n" for i in range(SEGMENT_COUNT)
+    ) + "#EXT-X-ENDLIST\n"
+    cdn.routes["/hls/media.m3u8"] = lambda h: send(h, 200, playlist.encode())
+    cdn.routes["/hls/master.m3u8"] = lambda h: send(
+        h,
+        200,
+        b"#EXTM3U\n"
+        b"#EXT-X-STREAM-INF:BANDWIDTH=100\nlow.m3u8\n"
+        b"#EXT-X-STREAM-INF:BANDWIDTH=900\nmedia.m3u8\n",
+    )
+
+    def _segment_route(index):
+        def route(handler):
+            data = _segment(index)
+            first = len(cdn.requests_for(f"/hls/seg{index}.ts")) == 1
+            if index == DROPPED_SEGMENT and first:
+                send_truncated(handler, 200, data, SEGMENT_SIZE // 2 + 1024)
+            else:
+                send_range(handler, data)
+        return route
+
+    for i in range(SEGMENT_COUNT):
+        cdn.routes[f"/hls/seg{i}.ts"] = _segment_route(i)
+    return cdn
+
+
+def _download(url: str, tmp_path) -> bytes:
+    playlist = core.fetch_hls_playlist(None, url, (2, 5))
+    output_path = str(tmp_path / "video.ts")
+    work_dir = str(tmp_path / "segments")
+    size, sha256 = core.download_hls_video(None, playlist, work_dir, output_path, (2, 5))
+    with open(output_path, "rb") as f:
+        content = f.read()
+    assert size == len(content)
+    assert sha256 == hashlib.sha256(content).hexdigest()
+    assert not os.path.exists(work_dir)
+    return content
+
+
+def test_segments_are_concatenated_in_order(app_config, hls_cdn, tmp_path):
+    content = _download(hls_cdn.url("/hls/media.m3u8"), tmp_path)
+    assert content == b"".join(_segment(i) for i in range(SEGMENT_COUNT))
+
+
+def test_master_playlist_selects_highest_bandwidth(app_config, hls_cdn, tmp_path):
+    content = _download(hls_cdn.url("/hls/master.m3u8"), tmp_path)
+    assert content == b"".join(_segment(i) for i in range(SEGMENT_COUNT))
+    assert not hls_cdn.requests_for("/hls/low.m3u8")
+
+
+def test_dropped_segment_resumes_with_range(app_config, hls_cdn, tmp_path):
+    content = _download(hls_cdn.url("/hls/media.m3u8"), tmp_path)
+    assert content == b"".join(_segment(i) for i in range(SEGMENT_COUNT))
+
+    requests = hls_cdn.requests_for(f"/hls/seg{DROPPED_SEGMENT}.ts")
+    assert len(requests) == 2
+    assert "Range" not in requests[0]
+    start = int(requests[1]["Range"].split("=", 1)[1].rstrip("-"))
+    # 只重新请求掉线后缺少的部分
+    assert 0 < start <= SEGMENT_SIZE // 2 + 1024
+
+
+@pytest.mark.parametrize(
+    "playlist",
+    [
+        '#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="key.bin"\n#EXTINF:1,\nseg0.ts\n',
+        '#EXTM3U\n#EXT-X-KEY:METHOD=SAMPLE-AES,URI="key.bin"\n#EXTINF:1,\nseg0.ts\n',
+    ],
+)
+def test_encrypted_playlist_is_rejected(app_config, cdn, playlist):
+    cdn.routes["/hls/enc.m3u8"] = lambda h: send(h, 200, playlist.encode())
+    with pytest.raises(core.HlsError):
+        core.fetch_hls_playlist(None, cdn.url("/hls/enc.m3u8"), (2, 5))
+    # 拒绝发生在请求任何分段之前
+    assert not cdn.requests_for("/hls/seg0.ts")
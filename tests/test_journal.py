@@ -0,0 +1,90 @@
+"""任务日志：记录后重新加载、写到一半的最后一行被忽略、校验重新排队后撤销完成标记。"""
+
+import os
+
+import pytest
+
+import core
+
+ALBUMS = [core.QzoneAlbum("album-1", "相册", 2, 1700000000), core.QzoneAlbum("album-2", "空相册", 0)]
+PHOTOS = [
+    core.QzonePhoto("http://cdn/0", "p0", "相册", False, "key0", {"Make": "Apple"}, "", "", "", 4, 3),
+    core.QzonePhoto("http://cdn/1", "p1", "相册", True, "key1", {}, "", "2024-01-01 00:00:00", ""),
+]
+KEYS = [core.photo_task_key(ALBUMS[0].uid, photo) for photo in PHOTOS]
+
+
+@pytest.fixture
+def journal(app_config):
+    journal = core.DownloadJournal.for_user("20002")
+    journal.open(truncate=True)
+    journal.record_albums(ALBUMS)
+    journal.record_photos(ALBUMS[0], PHOTOS)
+    journal.record_photos(ALBUMS[1], [])
+    journal.record_outcome(KEYS[0], core.TASK_DONE)
+    journal.record_outcome(KEYS[1], core.TASK_FAILED)
+    journal.close()
+    return journal
+
+
+def test_records_round_trip(journal):
+    state = journal.load()
+
+    assert state.albums == ALBUMS
+    assert state.photos == {ALBUMS[0].uid: PHOTOS, ALBUMS[1].uid: []}
+    assert state.outcomes == {KEYS[0]: core.TASK_DONE, KEYS[1]: core.TASK_FAILED}
+    assert not state.complete
+
+
+def test_later_outcome_wins_and_complete_is_recorded(journal):
+    journal.open()
+    journal.record_outcome(KEYS[1], core.TASK_DONE)
+    journal.mark_complete()
+    journal.close()
+
+    state = journal.load()
+    assert state.outcomes[KEYS[1]] == core.TASK_DONE
+    assert state.complete
+
+
+def test_torn_last_line_is_ignored(journal):
+    journal.open()
+    journal.record_outcome(KEYS[1], core.TASK_DONE)
+    journal.close()
+    # 模拟进程在写最后一条记录时崩溃：截断到该行中间
+    size = os.path.getsize(journal.path)
+    with open(journal.path, "rb+") as f:
+        f.truncate(size - 10)
+
+    state = journal.load()
+    assert state.albums == ALBUMS
+    assert state.outcomes == {KEYS[0]: core.TASK_DONE, KEYS[1]: core.TASK_FAILED}
+
+    # 续传时追加的记录从新的一行开始，截断的行不影响之后的记录
+    journal.open()
+    journal.record_outcome(KEYS[1], core.TASK_SKIPPED)
+    journal.close()
+    assert journal.load().outcomes[KEYS[1]] == core.TASK_SKIPPED
+
+
+def test_truncate_discards_previous_run(journal):
+    journal.open(truncate=True)
+    journal.close()
+
+    assert journal.load() == core.JournalState(None, {}, {}, False)
+
+
+def test_requeue_reopens_completed_journal(journal):
+    journal.open()
+    journal.mark_complete()
+    journal.close()
+
+    journal.requeue([KEYS[0]])
+
+    state = journal.load()
+    assert state.outcomes[KEYS[0]] == core.TASK_FAILED
+    assert not state.complete
+
+
+def test_missing_journal_loads_empty_state(app_config):
+    assert core.DownloadJournal.for_user("30003").load() == core.JournalState(None, {}, {}, False)
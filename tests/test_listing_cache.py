@@ -0,0 +1,77 @@
+"""列表缓存：JSON 往返、照片列表与相册列表各自的有效期、相册变化与损坏文件时失效。"""
+
+import json
+
+import pytest
+
+import core
+
+ALBUM = core.QzoneAlbum("album-1", "相册", 2, 1700000000)
+PHOTOS = {
+    0: [
+        core.QzonePhoto(
+            "http://cdn/0", "p0", ALBUM.name, False, "key0", {"Make": "Apple"}, "", "", "", 10, 20
+        )
+    ],
+    1: [core.QzonePhoto("http://cdn/1", "p1", ALBUM.name, True, "key1", {}, "", "", "")],
+}
+ALBUM_PAGES = {0: [ALBUM], 32: [core.QzoneAlbum("album-2", "另一个相册", 5)]}
+
+
+@pytest.fixture
+def cache(app_config):
+    return core.ListingCache(ttl=3600, album_ttl=300)
+
+
+def _age(cache, key: str, seconds: float) -> None:
+    """把缓存文件的保存时间改为 seconds 秒之前。"""
+    path = cache._path("20002", key)
+    with open(path, "r", encoding="utf-8") as f:
+        entry = json.load(f)
+    entry["saved_at"] -= seconds
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+
+
+def test_round_trip(cache):
+    cache.put_photos("20002", ALBUM, PHOTOS)
+    cache.put_albums("20002", ALBUM_PAGES)
+
+    assert cache.get_photos("20002", ALBUM) == PHOTOS
+    assert cache.get_albums("20002") == ALBUM_PAGES[0] + ALBUM_PAGES[32]
+    with open(cache._path("20002", ALBUM.uid), "r", encoding="utf-8") as f:
+        assert json.load(f)["version"] == core.ListingCache.VERSION
+
+
+def test_entries_expire_after_their_ttl(cache):
+    cache.put_photos("20002", ALBUM, PHOTOS)
+    cache.put_albums("20002", ALBUM_PAGES)
+
+    # 相册列表的有效期更短：超过 album_ttl 后失效，照片列表仍然有效
+    _age(cache, core.ListingCache.ALBUMS_KEY, 301)
+    _age(cache, ALBUM.uid, 301)
+    assert cache.get_albums("20002") is None
+    assert cache.get_photos("20002", ALBUM) == PHOTOS
+
+    _age(cache, ALBUM.uid, 3600)
+    assert cache.get_photos("20002", ALBUM) is None
+
+
+def test_changed_album_invalidates_photos(cache):
+    cache.put_photos("20002", ALBUM, PHOTOS)
+
+    assert cache.get_photos("20002", ALBUM._replace(count=3)) is None
+    assert cache.get_photos("20002", ALBUM._replace(modifytime=1700000001)) is None
+
+
+@pytest.mark.parametrize("content", [b"", b"{not json", b"\x80\x04\x95pickle", b"[1, 2]"])
+def test_corrupt_file_is_ignored(cache, content):
+    cache.put_photos("20002", ALBUM, PHOTOS)
+    with open(cache._path("20002", ALBUM.uid), "wb") as f:
+        f.write(content)
+
+    assert cache.get_photos("20002", ALBUM) is None
+
+    # 重新写入后恢复正常
+    cache.put_photos("20002", ALBUM, PHOTOS)
+    assert cache.get_photos("20002", ALBUM) == PHOTOS
@@ -0,0 +1,127 @@
+"""日志管道与结构化事件：handler 移到后台线程并延迟格式化，关闭时写完并恢复，
+按配置 event_log 写入 JSON Lines，任务日志在级别未启用时不格式化。"""
+
+import json
+import logging
+import threading
+
+import pytest
+
+import core
+
+
+class Recorder(logging.Handler):
+    """记录每条日志格式化后的内容及格式化所在的线程。"""
+
+    def __init__(self):
+        super().__init__()
+        self.lines: list[tuple[str, str]] = []
+
+    def emit(self, record):
+        self.lines.append((self.format(record), threading.current_thread().name))
+
+
+class Counted:
+    """被格式化时记录次数与所在线程，用于检查日志参数是否被延迟格式化。"""
+
+    def __init__(self):
+        self.count = 0
+        self.threads: set[str] = set()
+
+    def __str__(self):
+        self.count += 1
+        self.threads.add(threading.current_thread().name)
+        return "counted"
+
+
+@pytest.fixture
+def core_level():
+    """恢复 start() 按配置修改的 core 日志级别。"""
+    level = core.logger.level
+    yield
+    core.logger.setLevel(level)
+
+
+@pytest.fixture
+def target():
+    target = logging.getLogger("tests.pipeline")
+    target.propagate = False
+    target.setLevel(logging.DEBUG)
+    recorder = Recorder()
+    target.addHandler(recorder)
+    yield target, recorder
+    target.removeHandler(recorder)
+
+
+def test_handlers_run_in_background_and_are_restored(target, app_config, core_level):
+    logger, recorder = target
+    pipeline = core.LogPipeline(logger).start()
+    assert recorder not in logger.handlers
+
+    arg = Counted()
+    for i in range(50):
+        logger.info("消息 %d %s", i, arg)
+    pipeline.close()
+
+    assert [line for line, _ in recorder.lines] == [f"消息 {i} counted" for i in range(50)]
+    # 格式化发生在后台线程，记录日志的线程只负责入队
+    main_thread = threading.current_thread().name
+    assert all(thread != main_thread for _, thread in recorder.lines)
+    assert main_thread not in arg.threads
+    assert recorder in logger.handlers
+    assert not any(isinstance(h, core._DeferredQueueHandler) for h in logger.handlers)
+
+
+def test_events_are_written_as_json_lines(app_config, tmp_path, core_level):
+    path = tmp_path / "logs" / "events.jsonl"
+    app_config["event_log"] = str(path)
+    pipeline = core.LogPipeline().start()
+
+    core.log_event("retry", user="20002", attempt=2, delay=0.5)
+    core.log_event("user", user="20002", outcomes={core.TASK_DONE: 3}, path=tmp_path)
+    pipeline.close()
+
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [event["event"] for event in events] == ["retry", "user"]
+    assert events[0]["attempt"] == 2 and events[0]["delay"] == 0.5
+    assert events[1]["outcomes"] == {core.TASK_DONE: 3}
+    # 无法序列化的字段按字符串写入
+    assert events[1]["path"] == str(tmp_path)
+    assert all(isinstance(event["ts"], float) for event in events)
+
+    # 关闭后事件不再记录
+    core.log_event("ignored")
+    assert not core.event_logger.isEnabledFor(logging.INFO)
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+
+def test_events_disabled_without_event_log(app_config, core_level):
+    pipeline = core.LogPipeline().start()
+    try:
+        assert not core.event_logger.isEnabledFor(logging.INFO)
+    finally:
+        pipeline.close()
+
+
+def test_start_applies_log_level(app_config, core_level):
+    app_config["log_level"] = "DEBUG"
+    core.LogPipeline().start().close()
+    assert core.logger.level == logging.DEBUG
+
+    app_config["log_level"] = "warning"
+    core.apply_log_level()
+    assert core.logger.level == logging.WARNING
+
+
+def test_task_log_is_lazy_below_level(core_level):
+    core.logger.setLevel(logging.INFO)
+    messages = []
+    arg = Counted()
+
+    core.task_log(messages.append, logging.DEBUG, "照片 %s", arg)
+    assert messages == []
+    assert arg.count == 0
+
+    core.task_log(messages.append, logging.INFO, "照片 %s", arg)
+    core.task_log(messages.append, logging.INFO, "100% 完成")
+    assert messages == ["照片 counted", "100% 完成"]
@@ -0,0 +1,148 @@
+"""文件清单与校验：记录、改名、删除后重新加载，冗余记录压缩，写到一半的最后一行，
+按 SHA-256 找出缺失与损坏的文件并重新排队。"""
+
+import hashlib
+import os
+
+import pytest
+
+import core
+
+PHOTOS = [
+    core.QzonePhoto(f"http://cdn/{i}", f"p{i}", "相册", False, f"key{i}", {}, "", "", "")
+    for i in range(3)
+]
+KEYS = [core.photo_task_key("album-1", photo) for photo in PHOTOS]
+
+
+def _content(index: int) -> bytes:
+    return bytes([index]) * (1024 + index)
+
+
+@pytest.fixture
+def library(app_config):
+    """用户目录下的三个文件，清单与任务日志中均已记录为完成。"""
+    manifest = core.DownloadManifest.for_user("20002")
+    manifest.open()
+    paths = []
+    for i, photo in enumerate(PHOTOS):
+        path = os.path.join(manifest.root, "相册", f"{i}.png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(_content(i))
+        sha256 = hashlib.sha256(_content(i)).hexdigest()
+        manifest.record_file(path, len(_content(i)), sha256, KEYS[i], photo, "album-1", etag='"e"')
+        paths.append(path)
+    manifest.close()
+
+    journal = core.DownloadJournal.for_user("20002")
+    journal.open(truncate=True)
+    for key in KEYS:
+        journal.record_outcome(key, core.TASK_DONE)
+    journal.mark_complete()
+    journal.close()
+    return paths
+
+
+def test_hash_file(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"x" * (core.VERIFY_CHUNK_SIZE + 1))
+
+    assert core.hash_file(str(path)) == (
+        core.VERIFY_CHUNK_SIZE + 1,
+        hashlib.sha256(b"x" * (core.VERIFY_CHUNK_SIZE + 1)).hexdigest(),
+    )
+    assert core.hash_file(str(tmp_path / "missing")) is None
+
+
+def test_records_round_trip(library):
+    manifest = core.DownloadManifest.for_user("20002")
+    entries = manifest.load()
+
+    assert sorted(entries) == ["相册/0.png", "相册/1.png", "相册/2.png"]
+    assert entries["相册/1.png"] == {
+        "path": "相册/1.png",
+        "size": 1025,
+        "sha256": hashlib.sha256(_content(1)).hexdigest(),
+        "key": KEYS[1],
+        "album_id": "album-1",
+        "pic_key": "key1",
+        "url": "http://cdn/1",
+        "etag": '"e"',
+    }
+    assert manifest.is_intact(library[0])
+    assert manifest.conditional_headers(library[0]) == {"If-None-Match": '"e"'}
+
+
+def test_rename_and_remove(library):
+    manifest = core.DownloadManifest.for_user("20002")
+    manifest.open()
+    new_path = os.path.join(manifest.root, "相册", "key0.png")
+    manifest.rename(library[0], new_path)
+    manifest.remove(library[1])
+    manifest.close()
+
+    entries = core.DownloadManifest.for_user("20002").load()
+    assert sorted(entries) == ["相册/2.png", "相册/key0.png"]
+    assert entries["相册/key0.png"]["key"] == KEYS[0]
+
+
+def test_redundant_records_are_compacted(library):
+    manifest = core.DownloadManifest.for_user("20002")
+    manifest.open()
+    for _ in range(60):
+        manifest.rename(library[0], library[0] + ".tmp")
+        manifest.rename(library[0] + ".tmp", library[0])
+    manifest.close()
+    expected = manifest.load()
+
+    manifest.open()
+    manifest.close()
+
+    with open(manifest.path, "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == len(PHOTOS)
+    assert core.DownloadManifest.for_user("20002").load() == expected
+
+
+def test_torn_last_line_is_ignored(library):
+    manifest = core.DownloadManifest.for_user("20002")
+    with open(manifest.path, "rb+") as f:
+        f.truncate(os.path.getsize(manifest.path) - 10)
+
+    assert sorted(manifest.load()) == ["相册/0.png", "相册/1.png"]
+
+    # 之后追加的记录从新的一行开始
+    manifest.open(compact=False)
+    manifest.remove(library[0])
+    manifest.close()
+    assert sorted(core.DownloadManifest.for_user("20002").load()) == ["相册/1.png"]
+
+
+def test_verify_finds_missing_and_damaged_files(library):
+    os.remove(library[0])
+    with open(library[1], "r+b") as f:
+        f.write(b"\xff")
+
+    summary = core.verify_user_library("20002", workers=2)
+
+    assert summary == {"checked": 3, "ok": 1, "missing": 1, "damaged": 1}
+    # 损坏的文件保留备查，缺失与损坏的文件从清单移除并在任务日志中重新排队
+    assert not os.path.exists(library[1])
+    with open(library[1] + core.DAMAGED_SUFFIX, "rb") as f:
+        assert f.read()[:1] == b"\xff"
+    assert sorted(core.DownloadManifest.for_user("20002").load()) == ["相册/2.png"]
+    state = core.DownloadJournal.for_user("20002").load()
+    assert state.outcomes == {
+        KEYS[0]: core.TASK_FAILED,
+        KEYS[1]: core.TASK_FAILED,
+        KEYS[2]: core.TASK_DONE,
+    }
+    assert not state.complete
+
+    assert core.verify_user_library("20002", workers=1) == {
+        "checked": 1, "ok": 1, "missing": 0, "damaged": 0,
+    }
+
+
+def test_verify_without_manifest(app_config):
+    assert core.verify_user_library("30003") == {"checked": 0, "ok": 0, "missing": 0, "damaged": 0}
@@ -0,0 +1,123 @@
+"""元数据导出（SQLite）：按配置创建、按相册整体替换、从任务日志导出、下载时只写入完整列举的相册。"""
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+import core
+from conftest import send
+
+ALBUMS = [core.QzoneAlbum("album-1", "相册", 2, 1700000000), core.QzoneAlbum("album-2", "旅行", 1)]
+PHOTOS = [
+    core.QzonePhoto(
+        "http://cdn/0", "p0", "相册", False, "key0", {"Make": "Apple"}, "2023-05-01 10:00:00",
+        "2023-05-02 00:00:00", "iPhone", 4032, 3024,
+    ),
+    core.QzonePhoto("http://cdn/1", "p1", "相册", True, "", {}, "", "", ""),
+]
+
+
+@pytest.fixture
+def store(app_config):
+    app_config["metadata_db"] = "metadata.db"
+    return core.PhotoMetadataStore.from_config()
+
+
+def _rows(store, sql: str, *params) -> list[tuple]:
+    conn = sqlite3.connect(store.path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_from_config(app_config):
+    assert core.PhotoMetadataStore.from_config() is None
+
+    app_config["metadata_db"] = "metadata.db"
+    store = core.PhotoMetadataStore.from_config()
+    assert store.path == os.path.join(app_config["download_path"], "metadata.db")
+
+
+def test_write_album_round_trip(store):
+    store.write_album("20002", ALBUMS[0], PHOTOS)
+
+    assert _rows(store, "SELECT user_qq, album_id, name, photo_count, modifytime FROM albums") == [
+        ("20002", "album-1", "相册", 2, 1700000000)
+    ]
+    rows = _rows(
+        store,
+        "SELECT photo_key, photo_index, is_video, pic_key, url, shoottime, cameratype, "
+        "width, height, exif FROM photos ORDER BY photo_index",
+    )
+    assert rows == [
+        ("key0", 0, 0, "key0", "http://cdn/0", "2023-05-01 10:00:00", "iPhone", 4032, 3024,
+         json.dumps({"Make": "Apple"})),
+        # 缺少 pic_key 时以 URL 作为照片键
+        ("http://cdn/1", 1, 1, "", "http://cdn/1", "", "", 0, 0, "{}"),
+    ]
+
+
+def test_write_album_replaces_previous_rows(store):
+    store.write_album("20002", ALBUMS[0], PHOTOS)
+    store.write_album("20002", ALBUMS[1], PHOTOS[:1])
+    store.write_album("30003", ALBUMS[0], PHOTOS)
+
+    store.write_album("20002", ALBUMS[0]._replace(count=1), PHOTOS[1:])
+
+    sql = "SELECT photo_count FROM albums WHERE user_qq = ? AND album_id = ?"
+    assert _rows(store, sql, "20002", "album-1") == [(1,)]
+    counts = _rows(
+        store, "SELECT user_qq, album_id, COUNT(*) FROM photos GROUP BY user_qq, album_id"
+    )
+    # 只替换该用户的该相册，其他相册与用户的记录不变
+    assert sorted(counts) == [
+        ("20002", "album-1", 1),
+        ("20002", "album-2", 1),
+        ("30003", "album-1", 2),
+    ]
+
+
+def test_export_from_journal(store, app_config):
+    assert core.export_user_metadata("20002") == 0
+
+    journal = core.DownloadJournal.for_user("20002")
+    journal.open(truncate=True)
+    journal.record_albums(ALBUMS)
+    journal.record_photos(ALBUMS[0], PHOTOS)
+    # 未列举的相册不导出
+    journal.close()
+
+    messages = []
+    assert core.export_user_metadata("20002", messages.append) == len(PHOTOS)
+    assert _rows(store, "SELECT album_id FROM albums") == [("album-1",)]
+    assert _rows(store, "SELECT COUNT(*) FROM photos") == [(len(PHOTOS),)]
+    assert store.path in messages[-1]
+
+    app_config["metadata_db"] = ""
+    assert core.export_user_metadata("20002") == 0
+
+
+@pytest.mark.parametrize("complete", [True, False])
+def test_download_writes_completely_listed_albums(store, app_config, cdn, complete):
+    body = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+    cdn.routes["/photo/0"] = lambda h: send(h, 200, body)
+    photos = [core.QzonePhoto(cdn.url("/photo/0"), "p0", "相册", False, "key0", {}, "", "", "")]
+
+    class FixtureManager(core.QzonePhotoManager):
+        def get_albums_by_page(self, dest_user_qq, use_cache=True):
+            return ALBUMS[:1]
+
+        def list_album_photos(self, dest_user_qq, album):
+            return photos, complete
+
+    counts = FixtureManager("10001").download_all_photos_for_user("20002")
+
+    assert counts.get(core.TASK_DONE) == 1
+    if complete:
+        assert _rows(store, "SELECT album_id, photo_key FROM photos") == [("album-1", "key0")]
+    else:
+        # 只列举了一部分的相册不能替换数据库中的完整记录
+        assert not os.path.exists(store.path)
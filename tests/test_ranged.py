@@ -0,0 +1,113 @@
+"""多连接分段下载：输出与原文件逐字节一致，每段独立重试且只重新请求缺少的部分。"""
+
+import hashlib
+import os
+import random
+
+import pytest
+
+import core
+from conftest import send, send_range, send_truncated
+
+CONNECTIONS = 4
+VIDEO = random.Random(20240101).randbytes(core.DOWNLOAD_CHUNK_SIZE * 10 + 12345)
+
+
+def _parse_range(header: str) -> tuple[int, int]:
+    start, _, end = header.split("=", 1)[1].partition("-")
+    return int(start), int(end) if end else len(VIDEO) - 1
+
+
+@pytest.fixture
+def ranged_config(app_config):
+    app_config["ranged_download_connections"] = CONNECTIONS
+    return app_config
+
+
+def _download(cdn, path, tmp_path) -> tuple[str, bytes]:
+    output_path = str(tmp_path / "out" / "video.mp4")
+    sha256 = core.download_ranged(None, cdn.url(path), len(VIDEO), output_path, (2, 5))
+    with open(output_path, "rb") as f:
+        return sha256, f.read()
+
+
+def test_output_is_byte_identical(ranged_config, cdn, tmp_path):
+    cdn.routes["/video"] = lambda h: send_range(h, VIDEO)
+
+    sha256, content = _download(cdn, "/video", tmp_path)
+
+    assert content == VIDEO
+    assert sha256 == hashlib.sha256(VIDEO).hexdigest()
+    ranges = sorted(_parse_range(headers["Range"]) for headers in cdn.requests_for("/video"))
+    assert len(ranges) == CONNECTIONS
+    # 各段首尾相接覆盖整个文件
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(VIDEO) - 1
+    assert all(prev[1] + 1 == cur[0] for prev, cur in zip(ranges, ranges[1:]))
+
+
+def test_dropped_range_retries_only_missing_bytes(ranged_config, cdn, tmp_path):
+    dropped = []
+
+    def route(handler):
+        start, end = _parse_range(handler.headers["Range"])
+        if start > 0 and not dropped:
+            # 第一个非首段的请求在发送一部分数据后断开
+            dropped.append((start, end))
+            send_truncated(
+                handler,
+                206,
+                VIDEO[start:end + 1],
+                core.DOWNLOAD_CHUNK_SIZE + 100,
+                (("Content-Range", f"bytes {start}-{end}/{len(VIDEO)}"),),
+            )
+        else:
+            send_range(handler, VIDEO)
+
+    cdn.routes["/flaky"] = route
+
+    sha256, content = _download(cdn, "/flaky", tmp_path)
+
+    assert content == VIDEO
+    assert sha256 == hashlib.sha256(VIDEO).hexdigest()
+    (start, end), = dropped
+    retries = [
+        _parse_range(headers["Range"])
+        for headers in cdn.requests_for("/flaky")
+        if _parse_range(headers["Range"])[1] == end
+    ]
+    assert retries[0] == (start, end)
+    retry_start, retry_end = retries[1]
+    # 重试从已写入的位置继续，不重新请求整段
+    assert start < retry_start <= start + core.DOWNLOAD_CHUNK_SIZE + 100
+    assert retry_end == end
+    assert len(cdn.requests_for("/flaky")) == CONNECTIONS + 1
+
+
+def test_retryable_status_is_retried_per_range(ranged_config, cdn, tmp_path):
+    failed = []
+
+    def route(handler):
+        start, _ = _parse_range(handler.headers["Range"])
+        if start == 0 and not failed:
+            failed.append(start)
+            send(handler, 503, b"")
+        else:
+            send_range(handler, VIDEO)
+
+    cdn.routes["/busy"] = route
+
+    sha256, content = _download(cdn, "/busy", tmp_path)
+
+    assert content == VIDEO
+    assert sha256 == hashlib.sha256(VIDEO).hexdigest()
+    assert len(cdn.requests_for("/busy")) == CONNECTIONS + 1
+
+
+def test_server_ignoring_range_fails_and_removes_output(ranged_config, cdn, tmp_path):
+    cdn.routes["/norange"] = lambda h: send(h, 200, VIDEO)
+    output_path = str(tmp_path / "out" / "video.mp4")
+
+    with pytest.raises(ConnectionError):
+        core.download_ranged(None, cdn.url("/norange"), len(VIDEO), output_path, (2, 5))
+
+    assert not os.path.exists(output_path)
@@ -0,0 +1,86 @@
+"""按新的命名配置就地重命名已下载的文件：往返改名后内容与清单一致，相册改名后仍在原目录中改名。"""
+
+import os
+
+import pytest
+
+import core
+from conftest import send
+
+PHOTO_COUNT = 3
+ALBUM = core.QzoneAlbum("album-1", "相册", PHOTO_COUNT)
+
+
+def _body(index: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + bytes([index]) * 1024
+
+
+@pytest.fixture
+def downloaded(app_config, cdn):
+    photos = []
+    for i in range(PHOTO_COUNT):
+        cdn.routes[f"/photo/{i}"] = lambda h, i=i: send(h, 200, _body(i))
+        photos.append(
+            core.QzonePhoto(
+                cdn.url(f"/photo/{i}"), f"p{i}", ALBUM.name, False, f"key{i}", {}, "", "", ""
+            )
+        )
+
+    class FixtureManager(core.QzonePhotoManager):
+        def get_albums_by_page(self, dest_user_qq, use_cache=True):
+            return [ALBUM]
+
+        def list_album_photos(self, dest_user_qq, album):
+            return photos, True
+
+    counts = FixtureManager("10001").download_all_photos_for_user("20002")
+    assert counts.get(core.TASK_DONE) == PHOTO_COUNT
+    return photos
+
+
+def _files() -> dict[str, bytes]:
+    """清单中的每个文件：{相对路径: 内容}，同时检查记录的大小与实际一致。"""
+    result = {}
+    for rel, entry in core.DownloadManifest.for_user("20002").load().items():
+        with open(os.path.join(core.get_save_directory("20002"), rel), "rb") as f:
+            content = f.read()
+        assert len(content) == entry["size"]
+        result[rel] = content
+    return result
+
+
+def test_rename_round_trip(downloaded, app_config):
+    original = _files()
+    assert len(original) == PHOTO_COUNT
+
+    app_config["file_naming"] = "pic_key"
+    summary = core.migrate_file_names("20002")
+    assert summary["renamed"] == PHOTO_COUNT
+    renamed = _files()
+    assert sorted(renamed) == sorted(f"{ALBUM.name}/key{i}.png" for i in range(PHOTO_COUNT))
+    assert sorted(renamed.values()) == sorted(original.values())
+
+    app_config["file_naming"] = "index"
+    summary = core.migrate_file_names("20002")
+    assert summary["renamed"] == PHOTO_COUNT
+    assert _files() == original
+    assert core.migrate_file_names("20002")["unchanged"] == PHOTO_COUNT
+
+
+def test_files_stay_in_recorded_directory_after_album_rename(downloaded, app_config):
+    original = _files()
+    # 相册在远端改名：任务日志中是新名称，文件与清单仍在原目录
+    journal = core.DownloadJournal.for_user("20002")
+    journal.open(truncate=True)
+    renamed_album = ALBUM._replace(name="新相册")
+    journal.record_albums([renamed_album])
+    journal.record_photos(renamed_album, downloaded)
+    journal.close()
+
+    app_config["file_naming"] = "pic_key"
+    summary = core.migrate_file_names("20002")
+
+    assert summary == {"renamed": PHOTO_COUNT, "unchanged": 0, "missing": 0, "conflicts": 0}
+    renamed = _files()
+    assert sorted(renamed) == sorted(f"{ALBUM.name}/key{i}.png" for i in range(PHOTO_COUNT))
+    assert sorted(renamed.values()) == sorted(original.values())
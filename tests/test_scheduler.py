@@ -0,0 +1,133 @@
+"""下载调度：重试延迟的退避与抖动、延迟队列按就绪时间出队、超出次数或截止时间后判定失败。"""
+
+import logging
+import random
+import threading
+import time
+
+import pytest
+
+import core
+
+
+def _task(pic_key: str, attempt: int = 0) -> core.PhotoTask:
+    photo = core.QzonePhoto(f"http://cdn/{pic_key}", pic_key, "相册", False, pic_key, {}, "", "", "")
+    return core.PhotoTask(
+        request_cookies={},
+        user_qq="20002",
+        album_index=0,
+        album_name="相册",
+        photo_index=0,
+        photo=photo,
+        log_func=None,
+        progress_func=None,
+        is_stopped_func=lambda: False,
+        qzone_manager=None,
+        album_id="album-1",
+        dest_user_qq="20002",
+        attempt=attempt,
+    )
+
+
+class ScriptedWorker:
+    """代替 save_photo_worker：按脚本依次返回各任务的结果，记录每次尝试。"""
+
+    def __init__(self, script: dict[str, list[str]]):
+        self.script = {key: list(outcomes) for key, outcomes in script.items()}
+        self.calls: list[tuple[str, int, float]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, task: core.PhotoTask) -> str:
+        with self._lock:
+            self.calls.append((task.photo.pic_key, task.attempt, time.monotonic()))
+            outcomes = self.script[task.photo.pic_key]
+            return outcomes.pop(0) if len(outcomes) > 1 else outcomes[0]
+
+    def order(self) -> list[str]:
+        return [key for key, _, _ in self.calls]
+
+
+@pytest.fixture
+def scheduler_config(app_config):
+    app_config["retry_backoff_base"] = 0.1
+    app_config["retry_backoff_max"] = 0.4
+    app_config["max_attempts"] = 3
+    return app_config
+
+
+def _run(monkeypatch, worker, tasks, outcomes=None):
+    """以单个图片线程执行任务，outcomes 不为 None 时记录每个任务的最终结果。"""
+    monkeypatch.setattr(core, "save_photo_worker", worker)
+
+    def _on_outcome(task, outcome):
+        if outcomes is not None:
+            outcomes.append((task.photo.pic_key, outcome))
+
+    return core.DownloadScheduler({core.LANE_IMAGE: 1}, on_outcome=_on_outcome).run(tasks)
+
+
+def test_retry_delay_has_exponential_backoff_with_jitter(scheduler_config):
+    random.seed(1)
+    for attempt in range(1, 6):
+        cap = min(0.4, 0.1 * 2 ** (attempt - 1))
+        delays = [core.compute_retry_delay(attempt) for _ in range(50)]
+        assert all(cap / 2 <= delay <= cap for delay in delays)
+        # 抖动使同一批失败的任务不会在同一时刻重试
+        assert len(set(delays)) > 1
+
+
+def test_retried_task_does_not_block_others(scheduler_config, monkeypatch):
+    worker = ScriptedWorker(
+        {"a": [core.TASK_RETRY, core.TASK_DONE], "b": [core.TASK_DONE], "c": [core.TASK_DONE]}
+    )
+
+    counts = _run(monkeypatch, worker, [_task("a"), _task("b"), _task("c")])
+
+    assert counts == {core.TASK_DONE: 3}
+    # 失败的任务进入延迟队列，工作线程先处理其他任务
+    assert worker.order() == ["a", "b", "c", "a"]
+    first, retry = [(attempt, at) for key, attempt, at in worker.calls if key == "a"]
+    assert retry[0] == 1
+    assert retry[1] - first[1] >= 0.1 / 2
+
+
+def test_delayed_queue_pops_in_ready_time_order(scheduler_config, monkeypatch):
+    # 重试延迟随尝试次数递减：后失败的 y 比先失败的 x 更早就绪
+    monkeypatch.setattr(core, "compute_retry_delay", lambda attempt: 0.4 / attempt)
+    worker = ScriptedWorker(
+        {"x": [core.TASK_RETRY, core.TASK_DONE], "y": [core.TASK_RETRY, core.TASK_DONE]}
+    )
+
+    counts = _run(monkeypatch, worker, [_task("x"), _task("y", attempt=1)])
+
+    assert counts == {core.TASK_DONE: 2}
+    assert worker.order() == ["x", "y", "y", "x"]
+
+
+def test_task_fails_after_max_attempts(scheduler_config, monkeypatch, caplog):
+    worker = ScriptedWorker({"bad": [core.TASK_RETRY], "good": [core.TASK_DONE]})
+    outcomes = []
+
+    with caplog.at_level(logging.WARNING, logger=core.logger.name):
+        counts = _run(monkeypatch, worker, [_task("bad"), _task("good")], outcomes)
+
+    assert counts == {core.TASK_FAILED: 1, core.TASK_DONE: 1}
+    assert [attempt for key, attempt, _ in worker.calls if key == "bad"] == [0, 1, 2]
+    assert sorted(outcomes) == [("bad", core.TASK_FAILED), ("good", core.TASK_DONE)]
+    (record,) = [r for r in caplog.records if "[下载失败]" in r.getMessage()]
+    assert record.levelno == logging.WARNING
+    # 参数延迟格式化
+    assert record.args
+
+
+def test_task_fails_after_deadline(scheduler_config, monkeypatch):
+    scheduler_config["max_attempts"] = 100
+    scheduler_config["task_deadline"] = 0.3
+    worker = ScriptedWorker({"slow": [core.TASK_RETRY]})
+
+    started = time.monotonic()
+    counts = _run(monkeypatch, worker, [_task("slow")])
+
+    assert counts == {core.TASK_FAILED: 1}
+    assert 1 < len(worker.calls) < 100
+    assert time.monotonic() - started < 2
@@ -0,0 +1,92 @@
+"""多进程下载：子进程的任务日志、文件清单与 cookie 策略记录只由主进程写入。"""
+
+import json
+import os
+
+import pytest
+
+import core
+from conftest import send
+
+ALBUMS = [core.QzoneAlbum(f"album-{i}", f"相册 {i}", 6) for i in range(4)]
+# 超过文件缓冲区大小的记录，多个进程直接追加时会交错成损坏的行
+URL_PADDING = "x" * 9000
+
+
+def _body(album_index: int, index: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + bytes([album_index, index]) * 2048
+
+
+@pytest.fixture
+def shard_config(app_config):
+    app_config["processes"] = 2
+    app_config["max_workers"] = 2
+    return app_config
+
+
+@pytest.fixture
+def photos(cdn):
+    result = {}
+    for a, album in enumerate(ALBUMS):
+        result[album.uid] = []
+        for i in range(album.count):
+            path = f"/photo/{a}/{i}"
+            cdn.routes[path] = lambda h, a=a, i=i: send(h, 200, _body(a, i))
+            result[album.uid].append(
+                core.QzonePhoto(
+                    cdn.url(f"{path}?pad={URL_PADDING}"),
+                    f"p{a}-{i}",
+                    album.name,
+                    False,
+                    f"key{a}-{i}",
+                    {},
+                    "",
+                    "2024-01-01 00:00:00",
+                    "",
+                )
+            )
+    return result
+
+
+def _read_lines(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_two_shards_share_one_writer(shard_config, photos, cdn):
+    # 子进程不能使用测试中替换的列举方法，因此从预先写好的任务日志续传
+    journal = core.DownloadJournal.for_user("20002")
+    journal.open(truncate=True)
+    journal.record_albums(ALBUMS)
+    for album in ALBUMS:
+        journal.record_photos(album, photos[album.uid])
+    journal.close()
+
+    manager = core.QzonePhotoManager("10001")
+    manager.cookies = {"uin": "o10001"}
+    counts = manager.download_all_photos_for_user("20002", resume=True, processes=2)
+
+    total = sum(album.count for album in ALBUMS)
+    assert counts.get(core.TASK_DONE) == total
+    # 每一行都是完整的 JSON，没有被其他进程的写入截断
+    state = journal.load()
+    assert state.complete
+    expected_keys = {
+        core.photo_task_key(album.uid, photo)
+        for album in ALBUMS
+        for photo in photos[album.uid]
+    }
+    assert {key for key, outcome in state.outcomes.items() if outcome == core.TASK_DONE} == (
+        expected_keys
+    )
+    manifest_path = core.DownloadManifest.for_user("20002").path
+    records = _read_lines(manifest_path)
+    assert len(records) == total
+    assert {record["key"] for record in records} == expected_keys
+    for record in records:
+        path = os.path.join(core.get_save_directory("20002"), record["path"])
+        assert os.path.getsize(path) == record["size"]
+    # 两个子进程的 cookie 策略统计都汇总到主进程保存的文件中
+    with open(manager.host_cookie_policy.path, "r", encoding="utf-8") as f:
+        stats = json.load(f)
+    assert stats["127.0.0.1"]["cookie_ok"] == total
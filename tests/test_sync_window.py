@@ -0,0 +1,74 @@
+"""watch 模式配合日期窗口：窗口内照片全部完成后，下一轮不再列举相册。"""
+
+import time
+
+import pytest
+
+import core
+from conftest import send
+
+WINDOW_START = "2024-01-01"
+# 修改时间晚于窗口下限的相册需要列举；早于下限的相册直接跳过
+RECENT = core.QzoneAlbum("album-1", "近期", 4, int(time.mktime((2024, 3, 1, 0, 0, 0, 0, 0, -1))))
+OLD = core.QzoneAlbum("album-2", "旧相册", 2, int(time.mktime((2023, 3, 1, 0, 0, 0, 0, 0, -1))))
+UPLOAD_TIMES = ["2024-02-01 00:00:00", "2024-02-02 00:00:00", "2023-12-01 00:00:00", ""]
+
+
+@pytest.fixture
+def manager(app_config, cdn):
+    app_config["photo_date_from"] = WINDOW_START
+    app_config["photo_date_to"] = ""
+    app_config["photo_date_field"] = "upload"
+    photos = []
+    for i, uploadtime in enumerate(UPLOAD_TIMES):
+        path = f"/photo/{i}"
+        cdn.routes[path] = lambda h, i=i: send(h, 200, b"\x89PNG\r\n\x1a\n" + bytes([i]) * 512)
+        photos.append(
+            core.QzonePhoto(
+                cdn.url(path), f"p{i}", RECENT.name, False, f"key{i}", {}, "", uploadtime, ""
+            )
+        )
+
+    class FixtureManager(core.QzonePhotoManager):
+        listings = 0
+
+        def get_albums_by_page(self, dest_user_qq, use_cache=True):
+            return [RECENT, OLD]
+
+        def list_album_photos(self, dest_user_qq, album):
+            self.listings += 1
+            # 与按上传时间倒序的真实接口一样，遇到日期下限后不再翻页，列表不完整
+            return photos, False
+
+    return FixtureManager("10001")
+
+
+def test_watch_cycle_stops_listing_once_window_is_done(manager, cdn):
+    counts = manager.sync_user("20002")
+
+    # 上传时间未知的照片保留，早于下限的照片跳过
+    assert counts.get(core.TASK_DONE) == 3
+    assert not cdn.requests_for("/photo/2")
+    assert manager.listings == 1
+
+    counts = manager.sync_user("20002")
+
+    assert counts == {}
+    assert manager.listings == 1
+    snapshot = core.SyncSnapshot.for_user("20002")
+    snapshot.load()
+    assert snapshot.albums[RECENT.uid]["complete"]
+    assert snapshot.albums[OLD.uid]["complete"]
+
+
+def test_wider_window_relists_album(manager, cdn, app_config):
+    manager.sync_user("20002")
+
+    app_config["photo_date_from"] = "2023-11-01"
+    counts = manager.sync_user("20002")
+
+    # 之前已下载的照片不再请求，只下载新进入窗口的照片
+    assert manager.listings == 2
+    assert counts.get(core.TASK_DONE) == 1
+    assert len(cdn.requests_for("/photo/2")) == 1
+    assert len(cdn.requests_for("/photo/0")) == 1